@@ -0,0 +1,41 @@
+"""certificate inventory columns on ssl_certificates
+
+Revision ID: 20261019_0001
+Revises:
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('serial_number', sa.String(length=64), nullable=True),
+    sa.Column('fingerprint', sa.String(length=64), nullable=True),
+    sa.Column('storage_path', sa.String(length=512), nullable=True),
+    sa.Column('scanned_at', sa.DateTime(timezone=True), nullable=True),
+]
+INDEX = 'ix_ssl_certificates_expires_at'
+
+
+def upgrade() -> None:
+    # Installs created by init_db after the model changed already have these
+    inspector = sa.inspect(op.get_bind())
+    existing = {column['name'] for column in inspector.get_columns('ssl_certificates')}
+    for column in COLUMNS:
+        if column.name not in existing:
+            op.add_column('ssl_certificates', column)
+    if INDEX not in {index['name'] for index in inspector.get_indexes('ssl_certificates')}:
+        op.create_index(INDEX, 'ssl_certificates', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name='ssl_certificates')
+    for column in reversed(COLUMNS):
+        op.drop_column('ssl_certificates', column.name)
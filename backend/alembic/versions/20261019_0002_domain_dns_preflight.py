@@ -0,0 +1,40 @@
+"""dns pre-flight columns on domains
+
+Revision ID: 20261019_0002
+Revises: 20261019_0001
+Create Date: 2026-10-19 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_0002'
+down_revision = '20261019_0001'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('dns_status', sa.String(length=16), nullable=True),
+    sa.Column('dns_result', sa.JSON(), nullable=True),
+    sa.Column('dns_checked_at', sa.DateTime(timezone=True), nullable=True),
+]
+INDEX = 'ix_domains_dns_checked_at'
+
+
+def upgrade() -> None:
+    # Installs created by init_db after the model changed already have these
+    inspector = sa.inspect(op.get_bind())
+    existing = {column['name'] for column in inspector.get_columns('domains')}
+    for column in COLUMNS:
+        if column.name not in existing:
+            op.add_column('domains', column)
+    if INDEX not in {index['name'] for index in inspector.get_indexes('domains')}:
+        op.create_index(INDEX, 'domains', ['dns_checked_at'])
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name='domains')
+    for column in reversed(COLUMNS):
+        op.drop_column('domains', column.name)
@@ -0,0 +1,38 @@
+"""page cache counters on traffic_rollups
+
+Revision ID: 20261019_0003
+Revises: 20261019_0002
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261019_0003'
+down_revision = '20261019_0002'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('cache_hits', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('cache_misses', sa.Integer(), nullable=False, server_default='0'),
+]
+
+
+def upgrade() -> None:
+    # Installs created by init_db after the model changed already have these;
+    # without the table at all, init_db creates it complete
+    inspector = sa.inspect(op.get_bind())
+    if 'traffic_rollups' not in inspector.get_table_names():
+        return
+    existing = {column['name'] for column in inspector.get_columns('traffic_rollups')}
+    for column in COLUMNS:
+        if column.name not in existing:
+            op.add_column('traffic_rollups', column)
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        op.drop_column('traffic_rollups', column.name)
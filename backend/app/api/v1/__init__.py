@@ -2,7 +2,7 @@
 API v1 routes
 """
 from fastapi import APIRouter
-from app.api.v1 import auth, users, sites, databases, domains, backups, audit
+from app.api.v1 import auth, users, sites, databases, domains, backups, audit, logs
 
 api_router = APIRouter()
 
@@ -13,3 +13,4 @@ api_router.include_router(databases.router, prefix="/databases", tags=["database
 api_router.include_router(domains.router, prefix="/domains", tags=["domains"])
 api_router.include_router(backups.router, prefix="/backups", tags=["backups"])
 api_router.include_router(audit.router, prefix="/audit", tags=["audit"])
+api_router.include_router(logs.router, prefix="/logs", tags=["logs"])
@@ -1,7 +1,7 @@
 """
 Database management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.core.database import get_db
@@ -10,8 +10,10 @@ from app.core.audit import log_audit, AuditAction
 from app.core.permissions import Resource, Action
 from app.core.middleware import require_permission
 from app.models.user import User
-from app.schemas.database import DatabaseCreate, DatabaseUpdate, DatabaseResponse
+from app.schemas.database import DatabaseCreate, DatabaseUpdate, DatabaseResponse, DatabaseStatsListResponse
 from app.services.database_service import DatabaseService
+from app.services.database_stats_service import get_database_stats_collector, size_history
+from app.services.mysql_admin_service import MySQLAdminError
 
 router = APIRouter()
 
@@ -64,6 +66,49 @@ async def create_database(
     return DatabaseResponse.model_validate(database)
 
 
+@router.get("/stats", response_model=DatabaseStatsListResponse)
+async def get_site_database_stats(
+    site_id: int,
+    days: int = Query(30, ge=0, le=365),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Sizes, row estimates, fragmentation and largest tables of a site's databases, with daily growth"""
+    if not await require_permission(Resource.DATABASE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    collector = get_database_stats_collector()
+    try:
+        databases = await collector.site_stats(db, site_id)
+    except MySQLAdminError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"MySQL: {e}")
+    
+    history = await size_history(db, [d["database_id"] for d in databases], days) if days else {}
+    return {
+        "collected_at": collector.collected_at,
+        "databases": [d | {"history": history.get(d["database_id"], [])} for d in databases],
+    }
+
+
+@router.get("/stats/largest", response_model=DatabaseStatsListResponse)
+async def get_largest_databases(
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """The largest managed databases (data plus indexes)"""
+    if not await require_permission(Resource.DATABASE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    collector = get_database_stats_collector()
+    try:
+        databases = await collector.largest(db, limit)
+    except MySQLAdminError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"MySQL: {e}")
+    
+    return {"collected_at": collector.collected_at, "databases": databases}
+
+
 @router.get("/{database_id}", response_model=DatabaseResponse)
 async def get_database(
     database_id: int,
@@ -1,17 +1,28 @@
 """
 Domain management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
 from app.core.middleware import get_current_user
 from app.core.audit import log_audit, AuditAction
 from app.core.permissions import Resource, Action
 from app.core.middleware import require_permission
 from app.models.user import User
-from app.schemas.domain import DomainCreate, DomainUpdate, DomainResponse
-from app.services.domain_service import DomainService
+from app.core.config import settings
+from app.schemas.domain import (
+    DomainCreate,
+    DomainUpdate,
+    DomainResponse,
+    DomainImportResponse,
+    SSLCertificateResponse,
+)
+from app.services.domain_service import DomainService, read_csv_rows
+from app.services.certificate_service import expiring_certificates
+from app.services.caddy_service import CaddyConfigError
+from app.services.caddy_admin_service import CaddyAdminError
+import httpx
 
 router = APIRouter()
 
@@ -33,6 +44,22 @@ async def list_domains(
     return [DomainResponse.model_validate(d) for d in domains[skip:skip+limit]]
 
 
+@router.get("/certificates/expiring", response_model=List[SSLCertificateResponse])
+async def list_expiring_certificates(
+    days: Optional[int] = Query(None, ge=0, le=365),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Certificates expiring within days (default CERT_EXPIRY_WARNING_DAYS) or expired, soonest first"""
+    if not await require_permission(Resource.DOMAIN, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    window = settings.CERT_EXPIRY_WARNING_DAYS if days is None else days
+    certificates = await expiring_certificates(db, window, limit)
+    return [SSLCertificateResponse.model_validate(c) for c in certificates]
+
+
 @router.post("/", response_model=DomainResponse, status_code=status.HTTP_201_CREATED)
 async def create_domain(
     domain_data: DomainCreate = Body(..., embed=False),
@@ -44,12 +71,17 @@ async def create_domain(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
     
     service = DomainService(db)
-    domain = await service.create_domain(
-        domain=domain_data.domain,
-        site_id=domain_data.site_id,
-        domain_type=domain_data.domain_type,
-        ssl_enabled=domain_data.ssl_enabled,
-    )
+    try:
+        domain = await service.create_domain(
+            domain=domain_data.domain,
+            site_id=domain_data.site_id,
+            domain_type=domain_data.domain_type,
+            ssl_enabled=domain_data.ssl_enabled,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except (CaddyConfigError, CaddyAdminError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     
     await log_audit(
         user_id=current_user.id,
@@ -64,6 +96,67 @@ async def create_domain(
     return DomainResponse.model_validate(domain)
 
 
+@router.post("/import", response_model=DomainImportResponse)
+async def import_domains(
+    request: Request,
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Bulk-create domains from a JSON array or a streamed CSV upload (Content-Type: text/csv)"""
+    if not await require_permission(Resource.DOMAIN, Action.CREATE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    max_rows = settings.DOMAIN_IMPORT_MAX_ROWS
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = await read_csv_rows(request.stream(), max_rows)
+        else:
+            payload = await request.json()
+            rows = payload.get("domains") if isinstance(payload, dict) else payload
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError("Expected a JSON array of domain objects")
+            if len(rows) > max_rows:
+                raise ValueError(f"Import is limited to {max_rows} rows")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    service = DomainService(db)
+    report = await service.import_domains(rows, dry_run=dry_run)
+    
+    if not dry_run:
+        await log_audit(
+            user_id=current_user.id,
+            username=current_user.username,
+            action=AuditAction.CREATE,
+            resource_type=Resource.DOMAIN,
+            details={"import": True, "created": report["created"], "failed": report["failed"]},
+            success=True,
+            db=db,
+        )
+    
+    return DomainImportResponse(**report)
+
+
+@router.post("/{domain_id}/dns-check", response_model=DomainResponse)
+async def check_domain_dns(
+    domain_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Re-run the DNS pre-flight check of a domain"""
+    if not await require_permission(Resource.DOMAIN, Action.UPDATE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = DomainService(db)
+    try:
+        domain = await service.check_dns(domain_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    
+    return DomainResponse.model_validate(domain)
+
+
 @router.put("/{domain_id}", response_model=DomainResponse)
 async def update_domain(
     domain_id: int,
@@ -76,7 +169,10 @@ async def update_domain(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
     
     service = DomainService(db)
-    domain = await service.update_domain(domain_id, domain_data)
+    try:
+        domain = await service.update_domain(domain_id, domain_data)
+    except (CaddyConfigError, CaddyAdminError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     
     await log_audit(
         user_id=current_user.id,
@@ -102,7 +198,10 @@ async def delete_domain(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
     
     service = DomainService(db)
-    await service.delete_domain(domain_id)
+    try:
+        await service.delete_domain(domain_id)
+    except (CaddyConfigError, CaddyAdminError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     
     await log_audit(
         user_id=current_user.id,
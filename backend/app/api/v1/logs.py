@@ -0,0 +1,45 @@
+"""
+Log search endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from typing import List, Optional
+from datetime import datetime
+from app.core.middleware import get_current_user
+from app.core.permissions import Resource, Action
+from app.core.middleware import require_permission
+from app.models.user import User
+from app.schemas.log import LogSearchResponse
+from app.services.log_index_service import LogIndexService
+import asyncio
+import time
+
+router = APIRouter()
+
+
+@router.get("/search", response_model=LogSearchResponse)
+async def search_logs(
+    q: str = "",
+    site_id: Optional[List[int]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+):
+    """Search worker logs of all sites by terms, site and time range"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    started = time.perf_counter()
+    try:
+        results = await asyncio.to_thread(
+            LogIndexService().search,
+            q,
+            site_id,
+            since.timestamp() if since else None,
+            until.timestamp() if until else None,
+            limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return {"results": results, "took_ms": (time.perf_counter() - started) * 1000}
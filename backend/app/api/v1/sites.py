@@ -1,20 +1,63 @@
 """
 Site management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
 from app.core.middleware import get_current_user
 from app.core.audit import log_audit, AuditAction
 from app.core.permissions import Resource, Action
 from app.core.middleware import require_permission
 from app.models.user import User
-from app.schemas.site import SiteCreate, SiteUpdate, SiteResponse, SiteStatusUpdate
+from app.schemas.site import (
+    SiteCreate,
+    SiteUpdate,
+    SiteResponse,
+    SiteStatusUpdate,
+    PlacementMapResponse,
+    ResourceSampleResponse,
+    ResourceHistoryResponse,
+    LogPageResponse,
+    SiteHealthResponse,
+    ReconcileReportResponse,
+    WarmupReportResponse,
+    TrafficSeriesResponse,
+    SiteAnalyticsResponse,
+    SlowQueryListResponse,
+    PageCacheResponse,
+    PageCacheUpdate,
+    CachePurgeRequest,
+    CachePurgeResponse,
+)
 from app.services.site_service import SiteService
+from app.services.frankenphp_service import FrankenPHPService
+from app.services.resource_service import get_resource_sampler
+from app.services.log_service import LogFilter
+from app.services.health_service import get_health_prober
+from app.services.reconcile_service import get_worker_reconciler
+from app.services.opcache_service import load_report, warm_up
+from app.services.access_log_service import traffic_series
+from app.services.sketch_service import site_analytics
+from app.services.slow_query_service import top_slow_queries
+from app.services.page_cache_service import PageCacheRules, purge, cache_stats
+from app.services.caddy_admin_service import CaddyAdminError
+from app.core.config import settings
+import httpx
+from datetime import date, datetime, timedelta, timezone
+import json
+import re
 
 router = APIRouter()
 
+# Default window and longest range per traffic chart resolution
+TRAFFIC_WINDOWS = {
+    "minute": (timedelta(hours=6), timedelta(days=2)),
+    "hour": (timedelta(days=7), timedelta(days=31)),
+    "day": (timedelta(days=90), timedelta(days=366)),
+}
+
 
 @router.get("/", response_model=List[SiteResponse])
 async def list_sites(
@@ -60,6 +103,84 @@ async def create_site(
     return SiteResponse.model_validate(site)
 
 
+@router.get("/placement", response_model=PlacementMapResponse)
+async def get_worker_placement(
+    current_user: User = Depends(get_current_user),
+):
+    """Get the CPU/NUMA placement map of running workers"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    return FrankenPHPService().get_placement_map()
+
+
+@router.post("/placement/rebalance", response_model=PlacementMapResponse)
+async def rebalance_worker_placement(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Rebalance worker CPU/NUMA placement now"""
+    if not await require_permission(Resource.SYSTEM, Action.MANAGE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    return await FrankenPHPService().rebalance_placement(db)
+
+
+@router.get("/reconcile", response_model=Optional[ReconcileReportResponse])
+async def get_reconcile_report(
+    current_user: User = Depends(get_current_user),
+):
+    """Report of the last worker reconciliation pass (null before the first one)"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    return get_worker_reconciler().last_report
+
+
+@router.post("/reconcile", response_model=ReconcileReportResponse)
+async def reconcile_workers(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Start missing workers of active sites and clean stale PID files now"""
+    if not await require_permission(Resource.SYSTEM, Action.MANAGE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    report = await get_worker_reconciler().run(db)
+    return report.to_dict()
+
+
+@router.get("/resources/top", response_model=List[ResourceSampleResponse])
+async def top_site_resources(
+    metric: str = "cpu_percent",
+    limit: int = Query(10, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+):
+    """Sites with the highest current CPU, memory, IO or process count"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    try:
+        return get_resource_sampler().top(metric, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/health", response_model=List[SiteHealthResponse])
+async def list_site_health(
+    state: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Latest health of all active sites, optionally only those in one state"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    health = get_health_prober().all()
+    if state:
+        health = [h for h in health if h["state"] == state]
+    return health
+
+
 @router.get("/{site_id}", response_model=SiteResponse)
 async def get_site(
     site_id: int,
@@ -91,7 +212,13 @@ async def update_site(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
     
     service = SiteService(db)
-    site = await service.update_site(site_id, site_data)
+    try:
+        site = await service.update_site(site_id, site_data)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        # Blue/green reload failed; the old worker keeps serving and nothing was saved
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     
     await log_audit(
         user_id=current_user.id,
@@ -141,7 +268,10 @@ async def start_site(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
     
     service = SiteService(db)
-    await service.start_site(site_id)
+    try:
+        await service.start_site(site_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
     
     return {"message": "Site started successfully"}
 
@@ -160,3 +290,323 @@ async def stop_site(
     await service.stop_site(site_id)
     
     return {"message": "Site stopped successfully"}
+
+
+@router.get("/{site_id}/resources", response_model=ResourceHistoryResponse)
+async def get_site_resources(
+    site_id: int,
+    samples: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get current resource usage and recent history of a site's worker"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    resources = service.frankenphp_service.get_worker_resources(site, samples)
+    if resources is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No samples for this site (worker not running)")
+    
+    return resources
+
+
+@router.get("/{site_id}/traffic", response_model=TrafficSeriesResponse)
+async def get_site_traffic(
+    site_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resolution: str = Query("minute", pattern="^(minute|hour|day)$"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Requests, status classes, bytes and latency of a site over time, from access log rollups"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    default_window, max_range = TRAFFIC_WINDOWS[resolution]
+    until = _as_utc(until) if until else datetime.now(timezone.utc)
+    since = _as_utc(since) if since else until - default_window
+    if since >= until:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="since must be before until")
+    if until - since > max_range:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range too long for {resolution} resolution (max {max_range.days} days)",
+        )
+    
+    points = await traffic_series(db, site_id, since, until, resolution)
+    return {"site_id": site_id, "resolution": resolution, "since": since, "until": until, "points": points}
+
+
+@router.get("/{site_id}/analytics", response_model=SiteAnalyticsResponse)
+async def get_site_analytics(
+    site_id: int,
+    period: str = Query("day", pattern="^(day|week)$"),
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Unique visitors and top URLs/referrers of a UTC day or the week ending on it (estimates)"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    return await site_analytics(db, site_id, period, end or datetime.now(timezone.utc).date(), limit)
+
+
+@router.get("/{site_id}/slow-queries", response_model=SlowQueryListResponse)
+async def get_site_slow_queries(
+    site_id: int,
+    days: int = Query(7, ge=1, le=90),
+    order: str = Query("total_time", pattern="^(total_time|avg_time|max_time|calls|rows_examined)$"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Slowest statement fingerprints of a site's databases over the last days, from the MySQL slow log"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    queries = await top_slow_queries(db, site_id, days, order, limit)
+    return {"site_id": site_id, "days": days, "order": order, "queries": queries}
+
+
+@router.get("/{site_id}/cache", response_model=PageCacheResponse)
+async def get_site_cache(
+    site_id: int,
+    hours: int = Query(24, ge=1, le=24 * 31),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Page cache rules of a site and its hit ratio over the last hours"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    return await _page_cache_response(db, site, hours)
+
+
+@router.put("/{site_id}/cache", response_model=PageCacheResponse)
+async def update_site_cache(
+    site_id: int,
+    changes: PageCacheUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Change a site's page cache rules (TTLs, bypass cookies/paths, cache key)"""
+    if not await require_permission(Resource.SITE, Action.UPDATE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    if not await service.get_site(site_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    try:
+        site = await service.update_page_cache(site_id, changes.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    await log_audit(
+        user_id=current_user.id,
+        username=current_user.username,
+        action=AuditAction.UPDATE,
+        resource_type=Resource.SITE,
+        resource_id=site_id,
+        success=True,
+        db=db,
+    )
+    
+    return await _page_cache_response(db, site)
+
+
+@router.post("/{site_id}/cache/purge", response_model=CachePurgeResponse)
+async def purge_site_cache(
+    site_id: int,
+    request: Optional[CachePurgeRequest] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Purge cached pages of a site: one URL, a path prefix, or everything"""
+    if not await require_permission(Resource.SITE, Action.UPDATE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    if not settings.PAGE_CACHE_ENABLED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Page cache is not enabled on this server")
+    
+    request = request or CachePurgeRequest()
+    try:
+        purged = await purge(db, site, url=request.url, prefix=request.prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except (CaddyAdminError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Cache purge failed: {e}")
+    return {"purged": purged}
+
+
+async def _page_cache_response(db: AsyncSession, site, hours: int = 24) -> dict:
+    try:
+        rules = PageCacheRules.for_site(site.site_type, site.config)
+    except (ValueError, TypeError):
+        rules = PageCacheRules()
+    return {
+        "site_id": site.id,
+        "available": settings.PAGE_CACHE_ENABLED,
+        "rules": rules.to_dict(),
+        "stats": await cache_stats(db, site.id, hours),
+    }
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _log_filter(pattern: Optional[str], level: Optional[str]) -> LogFilter:
+    try:
+        return LogFilter(pattern=pattern, level=level)
+    except (ValueError, re.error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/{site_id}/logs", response_model=LogPageResponse)
+async def get_site_logs(
+    site_id: int,
+    lines: int = Query(100, ge=1, le=5000),
+    before: Optional[int] = Query(None, ge=0),
+    pattern: Optional[str] = None,
+    level: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get worker log lines, newest last; page back with the returned cursor"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    log_filter = _log_filter(pattern, level)
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    return await service.frankenphp_service.get_worker_logs(site, lines, before, log_filter)
+
+
+@router.get("/{site_id}/logs/stream")
+async def stream_site_logs(
+    site_id: int,
+    request: Request,
+    offset: Optional[int] = Query(None, ge=0),
+    pattern: Optional[str] = None,
+    level: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Follow worker logs as Server-Sent Events (event id = byte offset, resumable via Last-Event-ID)"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    log_filter = _log_filter(pattern, level)
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    last_event_id = request.headers.get("last-event-id")
+    if offset is None and last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    
+    frankenphp_service = service.frankenphp_service
+    
+    async def events():
+        async for lines, next_offset in frankenphp_service.follow_worker_logs(site, offset, log_filter):
+            if await request.is_disconnected():
+                break
+            if not lines:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {next_offset}\ndata: {json.dumps(lines)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{site_id}/warmup", response_model=WarmupReportResponse)
+async def get_site_warmup(
+    site_id: int,
+    current_user: User = Depends(get_current_user),
+):
+    """First-request latency before and after the last warmup of a site's worker"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    report = load_report(site_id)
+    if report is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site has not been warmed up yet")
+    return report
+
+
+@router.post("/{site_id}/warmup", response_model=WarmupReportResponse)
+async def warm_up_site(
+    site_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Request a site's hot URLs now (e.g. after clearing OPcache)"""
+    if not await require_permission(Resource.SITE, Action.UPDATE, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    service = SiteService(db)
+    site = await service.get_site(site_id)
+    if not site:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    
+    worker = await service.frankenphp_service.get_worker_status(site)
+    if worker["status"] != "running":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Worker is not running")
+    
+    report = await warm_up(site, site.worker_port)
+    return report.to_dict()
+
+
+@router.get("/{site_id}/health", response_model=SiteHealthResponse)
+async def get_site_health(
+    site_id: int,
+    current_user: User = Depends(get_current_user),
+):
+    """Latest liveness/readiness probe result of a site's worker"""
+    if not await require_permission(Resource.SITE, Action.READ, current_user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
+    
+    health = get_health_prober().get(site_id)
+    if health is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site is not being probed (not active)")
+    return health
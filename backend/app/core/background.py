@@ -0,0 +1,70 @@
+"""
+Background task management for periodic maintenance jobs
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def start_periodic(
+    name: str,
+    interval: float,
+    func: Callable[[], Awaitable[None]],
+    initial_delay: float = 0.0,
+) -> asyncio.Task:
+    """Run func every interval seconds until stop_all() is called"""
+    if name in _tasks and not _tasks[name].done():
+        return _tasks[name]
+
+    async def runner():
+        await asyncio.sleep(initial_delay)
+        while True:
+            try:
+                await func()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Background job %s failed", name)
+            await asyncio.sleep(interval)
+
+    task = asyncio.create_task(runner(), name=name)
+    _tasks[name] = task
+    return task
+
+
+def start_task(name: str, func: Callable[[], Awaitable[None]]) -> asyncio.Task:
+    """Run a long-lived job (one that schedules itself) until stop_all() is called"""
+    if name in _tasks and not _tasks[name].done():
+        return _tasks[name]
+
+    async def runner():
+        while True:
+            try:
+                await func()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Background job %s crashed; restarting", name)
+                await asyncio.sleep(5)
+
+    task = asyncio.create_task(runner(), name=name)
+    _tasks[name] = task
+    return task
+
+
+async def stop_all():
+    """Cancel all running background jobs"""
+    tasks = list(_tasks.values())
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
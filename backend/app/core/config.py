@@ -56,6 +56,15 @@ class Settings(BaseSettings):
     MYSQL_ROOT_USER: str = "root"
     MYSQL_ROOT_PASSWORD: str
     MYSQL_SOCKET: Optional[str] = None
+    MYSQL_ADMIN_POOL_SIZE: int = 4  # Root connections (and threads) for database administration
+    MYSQL_ADMIN_TIMEOUT: float = 30.0  # Seconds per operation before its statement is killed
+    MYSQL_ADMIN_CONNECT_TIMEOUT: int = 5
+    MYSQL_ADMIN_PING_AFTER: int = 30  # Ping connections idle longer than this before reuse
+    MYSQL_ADMIN_IDLE_TIMEOUT: int = 300  # Close connections idle longer than this
+    DB_STATS_CACHE_TTL: int = 300  # Seconds database sizes are served from memory
+    DB_STATS_QUERY_TIMEOUT: float = 60.0  # The information_schema query over all managed databases
+    DB_STATS_HISTORY_INTERVAL: int = 3600  # Seconds between stored size samples
+    DB_STATS_RETENTION_DAYS: int = 365
     
     # Paths
     FRANKENPANEL_ROOT: str = "/opt/frankenpanel"
@@ -68,12 +77,96 @@ class Settings(BaseSettings):
     # FrankenPHP
     FRANKENPHP_BIN: str = "/usr/local/bin/frankenphp"
     FRANKENPHP_WORKER_START_PORT: int = 8081
-    FRANKENPHP_WORKER_MAX: int = 1000
+    FRANKENPHP_WORKER_MAX: int = 1000  # Ports START..START+MAX are primary; the next MAX are blue/green alternates
+    FRANKENPHP_DRAIN_TIMEOUT: int = 30  # Seconds a replaced worker may finish in-flight requests
+    FRANKENPHP_PLACEMENT_ENABLED: bool = False  # CPU/NUMA pinning of workers
+    FRANKENPHP_PLACEMENT_INTERVAL: int = 60  # Seconds between rebalances
+    FRANKENPHP_PLACEMENT_RESERVED_CPUS: str = ""  # cpulist kept free for Caddy/MySQL, e.g. "0-1"
+    FRANKENPHP_PLACEMENT_TOLERANCE: float = 0.25  # Allowed load imbalance before moving workers
+    FRANKENPHP_SAMPLE_ENABLED: bool = True  # Per-site CPU/memory/IO sampling from /proc
+    FRANKENPHP_SAMPLE_INTERVAL: int = 5  # Seconds between samples
+    FRANKENPHP_SAMPLE_HISTORY: int = 720  # Samples kept per site (1 hour at 5s)
+    
+    # OPcache and warmup
+    OPCACHE_ENABLED: bool = True
+    OPCACHE_MEMORY_MB: int = 128  # Per site (config.opcache_memory_mb)
+    OPCACHE_MAX_FILES: int = 20000  # Per site (config.opcache_max_files)
+    OPCACHE_REVALIDATE_FREQ: int = 60  # Seconds between timestamp checks of cached scripts
+    OPCACHE_FILE_CACHE: bool = True  # Persist compiled scripts so restarts start warm
+    OPCACHE_PRELOAD_ENABLED: bool = True  # Allow preloading; only sites that set config.preload_paths preload anything
+    OPCACHE_PRELOAD_USER: str = "www-data"  # Required by PHP when the worker runs as root
+    WARMUP_ENABLED: bool = True  # Request hot URLs before a started worker counts as ready
+    WARMUP_CONCURRENCY: int = 4
+    WARMUP_TIMEOUT: float = 10.0  # Seconds per warmup request
+    WARMUP_MAX_URLS: int = 50
+    
+    # Worker reconciliation (boot recovery and drift repair)
+    RECONCILE_ENABLED: bool = True
+    RECONCILE_INTERVAL: int = 60  # Seconds between drift checks after the boot pass
+    RECONCILE_CONCURRENCY: int = 8  # Workers started at once
+    RECONCILE_STAGGER: float = 0.25  # Seconds between consecutive launches
+    RECONCILE_STOP_GRACE: int = 300  # Seconds before a worker of an inactive or deleted site is stopped
+    LEADER_ELECTION_INTERVAL: int = 15  # Seconds between leadership attempts of follower processes
+    
+    # Worker health probing
+    HEALTH_CHECK_ENABLED: bool = True
+    HEALTH_CHECK_INTERVAL: int = 10  # Seconds between probes of one site
+    HEALTH_CHECK_CONCURRENCY: int = 50  # Probes in flight at once
+    HEALTH_CHECK_TIMEOUT: float = 2.0
+    HEALTH_CHECK_REFRESH_INTERVAL: int = 30  # Seconds between reloads of the active site list
+    HEALTH_FAILURE_THRESHOLD: int = 3  # Consecutive failures before a site is degraded/down
+    HEALTH_RESTART_THRESHOLD: int = 6  # Consecutive failures before the worker is restarted
+    HEALTH_RESTART_BACKOFF: int = 300  # Minimum seconds between automatic restarts
+    HEALTH_READY_TIMEOUT: int = 30  # Seconds a started worker has to answer before start fails
     
     # Caddy
     CADDY_BIN: str = "/usr/bin/caddy"
     CADDY_CONFIG_DIR: str = "/etc/caddy"
     CADDY_CONFIG_FILE: str = "/etc/caddy/Caddyfile"
+    CADDY_BACKEND: str = "caddyfile"  # caddyfile or admin_api (incremental JSON route updates)
+    CADDY_ADMIN_URL: str = "http://localhost:2019"
+    CADDY_SYNC_INTERVAL: int = 300  # Seconds between drift checks of the admin API config
+    CADDY_RESTART_CHECK_INTERVAL: int = 5  # Seconds between checks that Caddy still holds the admin API config
+    CADDY_DATA_DIR: str = "/var/lib/caddy/.local/share/caddy"  # Caddy storage; certificates/<issuer>/<domain>/
+    CERT_SCAN_ENABLED: bool = True
+    CERT_SCAN_INTERVAL: int = 600  # Seconds between incremental scans of the certificate storage
+    CERT_SCAN_WORKERS: int = 8  # Threads reading and parsing certificate files
+    CERT_EXPIRY_WARNING_DAYS: int = 21  # Default window of the expiring-soon query
+    STATIC_FILES_ENABLED: bool = True  # Caddy serves static assets of PHP sites from disk
+    PRECOMPRESS_ENABLED: bool = True  # Write .br/.gz siblings of static assets (.br needs the brotli package)
+    PRECOMPRESS_INTERVAL: int = 900  # Seconds between incremental passes
+    PRECOMPRESS_WORKERS: int = 2  # Compression processes
+    PRECOMPRESS_NICE: int = 10  # Added niceness of the compression processes
+    PRECOMPRESS_MAX_BYTES_PER_RUN: int = 512 * 1024 * 1024  # Source bytes compressed per pass; the rest waits
+    PRECOMPRESS_MIN_SIZE: int = 1024  # Smaller files are not worth a sibling
+    PRECOMPRESS_MIN_RATIO: float = 0.9  # Keep a sibling only if at most this fraction of the original
+    PAGE_CACHE_ENABLED: bool = False  # Requires a Caddy build with github.com/caddyserver/cache-handler
+    PAGE_CACHE_API_PATH: str = "/souin-api/souin"  # Cache purge API under CADDY_ADMIN_URL
+    TLS_ASK_HOST: str = "127.0.0.1"  # Ask listener; not the panel port, where the panel proxy makes every client loopback
+    TLS_ASK_PORT: int = 8001  # Bound by every backend process (SO_REUSEPORT); 0 disables the listener
+    TLS_ASK_PATH: str = "/internal/tls-ask"
+    TLS_ASK_URL: str = "http://127.0.0.1:8001/internal/tls-ask"  # Empty disables the ask check
+    TLS_ASK_RESYNC_INTERVAL: int = 3600  # Seconds between full reloads of the domain index
+    DNS_PREFLIGHT_ENABLED: bool = True  # Resolve new domains; the TLS ask refuses ones that cannot validate
+    DNS_PREFLIGHT_ENFORCE: bool = False  # Reject new domains that do not point here instead of only recording it
+    DNS_EXPECTED_A: list[str] = []  # This server's public IPv4 addresses
+    DNS_EXPECTED_AAAA: list[str] = []  # This server's public IPv6 addresses
+    DNS_EXPECTED_CNAME: list[str] = []  # Hostnames customers may CNAME to, e.g. edge.example-host.com
+    DNS_NAMESERVERS: list[str] = []  # host or host:port; empty uses /etc/resolv.conf
+    DNS_TIMEOUT: float = 2.0
+    DNS_RETRIES: int = 2
+    DNS_CONCURRENCY: int = 64  # Queries in flight at once
+    DNS_MAX_TTL: int = 3600  # Longest a cached answer is kept, whatever its TTL
+    DNS_NEGATIVE_TTL: int = 60  # Cache lifetime of NXDOMAIN and empty answers
+    DNS_CACHE_SIZE: int = 50000
+    DNS_RECHECK_INTERVAL: int = 300  # Seconds between re-check passes
+    DNS_RECHECK_MAX_AGE: int = 6 * 3600  # Re-check passing domains this often
+    DNS_RECHECK_FAILED_AGE: int = 300  # Re-check failing domains this often
+    DNS_RECHECK_BATCH: int = 2000  # Domains per pass
+    DOMAIN_IMPORT_MAX_ROWS: int = 10000  # Rows per bulk domain import
+    CADDY_RELOAD_DEBOUNCE: float = 0.2  # Seconds of quiet before a batch of config changes is applied
+    CADDY_RELOAD_MAX_DELAY: float = 2.0  # Longest a change waits for its batch
+    CADDY_SWITCH_PIN_SECONDS: int = 600  # How long a blue/green upstream switch overrides the stored port
     
     # Encryption
     ENCRYPTION_KEY: str  # For encrypting database credentials
@@ -86,12 +179,46 @@ class Settings(BaseSettings):
     # Backup
     BACKUP_RETENTION_DAYS: int = 30
     BACKUP_ENCRYPTION_ENABLED: bool = True
+    DB_DUMP_THREADS: int = 4  # Connections dumping or loading a database in parallel
+    DB_DUMP_CHUNK_ROWS: int = 500000  # Tables with an integer primary key are split into chunks of about this many rows
+    DB_DUMP_STATEMENT_BYTES: int = 1024 * 1024  # Size of each multi-row INSERT; keep below max_allowed_packet
+    DB_DUMP_COMPRESS_LEVEL: int = 3  # gzip level of chunk files
+    DB_DUMP_LOCK_WAIT_TIMEOUT: int = 10  # Seconds to wait for the brief table lock that aligns the snapshots
     
     # Logging
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "json"
     LOG_FILE: str = "/opt/frankenpanel/logs/backend.log"
     
+    # Worker log rotation (per-site overrides: config.log_max_bytes, log_retention_segments, log_retention_days)
+    LOG_ROTATE_MAX_BYTES: int = 100 * 1024 * 1024
+    LOG_ROTATE_INTERVAL_HOURS: int = 24
+    LOG_ROTATE_CHECK_INTERVAL: int = 60  # Seconds between rotation checks
+    LOG_RETENTION_SEGMENTS: int = 14
+    LOG_RETENTION_DAYS: int = 30
+    LOG_COMPRESSION: str = "gzip"  # gzip or zstd (requires the zstandard package)
+    
+    # Worker log search index
+    LOG_INDEX_ENABLED: bool = True
+    LOG_INDEX_DIR: Optional[str] = None  # Defaults to LOGS_DIR/index
+    LOG_INDEX_INTERVAL: int = 30  # Seconds between incremental ingests
+    LOG_INDEX_RETENTION_DAYS: int = 7
+    
+    # Caddy access logs and traffic rollups
+    ACCESS_LOG_ENABLED: bool = True
+    ACCESS_LOG_FILE: str = "/var/log/caddy/frankenpanel-access.log"  # Must be writable by the caddy user
+    ACCESS_LOG_ROLL_SIZE_MB: int = 100
+    ACCESS_LOG_ROLL_KEEP: int = 5
+    ACCESS_LOG_INGEST_INTERVAL: int = 15  # Seconds between incremental ingests
+    TRAFFIC_RETENTION_DAYS: int = 90  # Minute rollups older than this are deleted
+    SKETCH_RETENTION_DAYS: int = 400  # Daily visitor/top-URL sketches older than this are deleted
+    
+    # MySQL slow query log digests
+    SLOW_LOG_ENABLED: bool = True
+    SLOW_LOG_FILE: str = "/var/log/mysql/mysql-slow.log"  # slow_query_log_file; must be readable by the panel
+    SLOW_LOG_INGEST_INTERVAL: int = 60  # Seconds between incremental ingests
+    SLOW_QUERY_RETENTION_DAYS: int = 30  # Daily fingerprint rollups older than this are deleted
+    
     # Monitoring
     METRICS_ENABLED: bool = True
     METRICS_PORT: int = 9090
@@ -0,0 +1,46 @@
+"""
+Single-leader election between backend processes on one host
+
+Jobs that change host state (starting workers, rotating logs, ...) must run in
+exactly one process even when the API is served by several uvicorn workers.
+The leader is whichever process holds an exclusive flock on RUNTIME_DIR/leader.lock;
+the kernel releases it when that process exits.
+"""
+from app.core.config import settings
+import fcntl
+import os
+from typing import Optional
+
+_lock_fd: Optional[int] = None
+
+
+def acquire_leadership() -> bool:
+    """Try to become the leader without blocking; True if this process is (now) the leader"""
+    global _lock_fd
+    if _lock_fd is not None:
+        return True
+    os.makedirs(settings.RUNTIME_DIR, exist_ok=True)
+    fd = os.open(os.path.join(settings.RUNTIME_DIR, "leader.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _lock_fd = fd
+    return True
+
+
+def is_leader() -> bool:
+    return _lock_fd is not None
+
+
+def release_leadership():
+    """Give up leadership so another process can take over"""
+    global _lock_fd
+    if _lock_fd is None:
+        return
+    fcntl.flock(_lock_fd, fcntl.LOCK_UN)
+    os.close(_lock_fd)
+    _lock_fd = None
@@ -10,6 +10,7 @@ from app.core.security import decode_token
 from app.models.user import User, Role
 from app.models.audit import AuditAction
 from app.core.audit import log_audit
+from app.core.config import settings
 from typing import Callable
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import RedirectResponse
@@ -182,3 +183,4 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Content-Security-Policy"] = "default-src 'self'"
 
         return response
+
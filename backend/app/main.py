@@ -7,8 +7,25 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, HTMLResponse
 from app.core.config import settings
 from app.core.database import init_db, close_db
+from app.core.background import start_periodic, start_task, stop_all
+from app.core.leader import acquire_leadership, is_leader, release_leadership
 from app.core.middleware import AuditMiddleware, SecurityHeadersMiddleware, PreferFrontendMiddleware
 from app.api.v1 import api_router
+from app.services.frankenphp_service import rebalance_worker_placement
+from app.services.resource_service import get_resource_sampler
+from app.services.log_rotation_service import rotate_worker_logs
+from app.services.log_index_service import index_worker_logs
+from app.services.health_service import get_health_prober
+from app.services.reconcile_service import reconcile_workers
+from app.services.caddy_admin_service import sync_caddy_config, watch_caddy_config
+from app.services.access_log_service import ingest_access_logs
+from app.services.slow_query_service import ingest_slow_log
+from app.services.precompress_service import precompress_sites
+from app.services.certificate_service import scan_certificates
+from app.services.dns_service import recheck_domains
+from app.services.database_stats_service import record_database_sizes
+from app.services import domain_index_service
+from app.services.mysql_admin_service import close_mysql_admin
 import os
 
 # Create FastAPI app
@@ -86,13 +103,73 @@ async def serve_frontend(full_path: str):
     return HTMLResponse(status_code=200, content=_FALLBACK_HTML)
 
 
+def start_leader_jobs():
+    """Start the jobs that change host state; only the leader process runs them"""
+    if settings.CADDY_BACKEND == "admin_api":
+        start_periodic("caddy-sync", settings.CADDY_SYNC_INTERVAL, sync_caddy_config)
+        start_periodic(
+            "caddy-watch",
+            settings.CADDY_RESTART_CHECK_INTERVAL,
+            watch_caddy_config,
+            initial_delay=settings.CADDY_RESTART_CHECK_INTERVAL,
+        )
+    if settings.RECONCILE_ENABLED:
+        start_periodic("worker-reconcile", settings.RECONCILE_INTERVAL, reconcile_workers)
+    if settings.HEALTH_CHECK_ENABLED:
+        start_task("health-prober", get_health_prober().run)
+    start_periodic("log-rotation", settings.LOG_ROTATE_CHECK_INTERVAL, rotate_worker_logs)
+    if settings.LOG_INDEX_ENABLED:
+        start_periodic("log-index", settings.LOG_INDEX_INTERVAL, index_worker_logs)
+    if settings.ACCESS_LOG_ENABLED:
+        start_periodic("access-log-ingest", settings.ACCESS_LOG_INGEST_INTERVAL, ingest_access_logs)
+    if settings.SLOW_LOG_ENABLED:
+        start_periodic("slow-log-ingest", settings.SLOW_LOG_INGEST_INTERVAL, ingest_slow_log)
+    start_periodic("database-sizes", settings.DB_STATS_HISTORY_INTERVAL, record_database_sizes, initial_delay=60)
+    if settings.DNS_PREFLIGHT_ENABLED:
+        start_periodic("dns-recheck", settings.DNS_RECHECK_INTERVAL, recheck_domains)
+    if settings.CERT_SCAN_ENABLED:
+        start_periodic("cert-scan", settings.CERT_SCAN_INTERVAL, scan_certificates)
+    if settings.PRECOMPRESS_ENABLED:
+        start_periodic("precompress", settings.PRECOMPRESS_INTERVAL, precompress_sites)
+    if settings.FRANKENPHP_PLACEMENT_ENABLED:
+        start_periodic(
+            "worker-placement",
+            settings.FRANKENPHP_PLACEMENT_INTERVAL,
+            rebalance_worker_placement,
+            initial_delay=settings.FRANKENPHP_PLACEMENT_INTERVAL,
+        )
+
+
+async def elect_leader():
+    """Take over the leader jobs when the leader process goes away"""
+    if not is_leader() and acquire_leadership():
+        start_leader_jobs()
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup"""
     await init_db()
+    if settings.FRANKENPHP_SAMPLE_ENABLED:
+        start_periodic(
+            "resource-sampler",
+            settings.FRANKENPHP_SAMPLE_INTERVAL,
+            get_resource_sampler().sample_async,
+        )
+    # Every process answers TLS asks, so every process keeps its own domain index
+    start_task("domain-index", domain_index_service.listen)
+    if settings.TLS_ASK_PORT:
+        start_task("tls-ask", domain_index_service.serve_ask)
+    if acquire_leadership():
+        start_leader_jobs()
+    else:
+        start_periodic("leader-election", settings.LEADER_ELECTION_INTERVAL, elect_leader)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    await stop_all()
+    release_leadership()
+    close_mysql_admin()
     await close_db()
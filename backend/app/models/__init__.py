@@ -3,11 +3,12 @@ Database models
 """
 from app.models.user import User, Role, Permission, UserRole, RolePermission
 from app.models.site import Site, SiteType
-from app.models.database import Database, DatabaseType
+from app.models.database import Database, DatabaseType, DatabaseSizeSample, SlowQueryRollup
 from app.models.domain import Domain
 from app.models.ssl import SSLCertificate
 from app.models.backup import Backup
 from app.models.audit import AuditLog
+from app.models.traffic import TrafficRollup, TrafficSketch
 
 __all__ = [
     "User",
@@ -19,8 +20,12 @@ __all__ = [
     "SiteType",
     "Database",
     "DatabaseType",
+    "DatabaseSizeSample",
+    "SlowQueryRollup",
     "Domain",
     "SSLCertificate",
     "Backup",
     "AuditLog",
+    "TrafficRollup",
+    "TrafficSketch",
 ]
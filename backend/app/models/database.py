@@ -1,12 +1,16 @@
 """
 Database model
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Boolean, Date, DateTime, ForeignKey, Enum, Text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 from app.core.database import Base
 
+# Upper bounds (ms) of the slow query time histogram buckets; one more bucket counts slower queries
+QUERY_TIME_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
 
 class DatabaseType(str, enum.Enum):
     """Database type enumeration"""
@@ -43,3 +47,41 @@ class Database(Base):
     
     def __repr__(self):
         return f"<Database {self.name}>"
+
+
+class DatabaseSizeSample(Base):
+    """Size of one database at one point in time, for growth trends"""
+    __tablename__ = "database_size_samples"
+    
+    database_id = Column(Integer, ForeignKey("databases.id", ondelete="CASCADE"), primary_key=True)
+    sampled_at = Column(DateTime(timezone=True), primary_key=True, index=True)
+    tables = Column(Integer, nullable=False, default=0)
+    rows = Column(BigInteger, nullable=False, default=0)  # Sum of InnoDB row estimates
+    data_bytes = Column(BigInteger, nullable=False, default=0)
+    index_bytes = Column(BigInteger, nullable=False, default=0)
+    free_bytes = Column(BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<DatabaseSizeSample {self.database_id} {self.sampled_at}>"
+
+
+class SlowQueryRollup(Base):
+    """One normalized statement (fingerprint) of one database during one UTC day, from the MySQL slow log"""
+    __tablename__ = "slow_query_rollups"
+    
+    database_id = Column(Integer, ForeignKey("databases.id", ondelete="CASCADE"), primary_key=True)
+    fingerprint_hash = Column(BigInteger, primary_key=True)  # First 8 bytes of the fingerprint's BLAKE2b digest
+    day = Column(Date, primary_key=True, index=True)
+    site_id = Column(Integer, ForeignKey("sites.id", ondelete="CASCADE"), nullable=False, index=True)
+    fingerprint = Column(Text, nullable=False)  # Literals replaced with ?
+    calls = Column(Integer, nullable=False, default=0)
+    query_time_sum = Column(Float, nullable=False, default=0.0)  # Seconds
+    query_time_max = Column(Float, nullable=False, default=0.0)
+    lock_time_sum = Column(Float, nullable=False, default=0.0)
+    rows_sent = Column(BigInteger, nullable=False, default=0)
+    rows_examined = Column(BigInteger, nullable=False, default=0)
+    query_time_histogram = Column(ARRAY(Integer), nullable=False)  # Counts per QUERY_TIME_BUCKETS_MS bucket
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+    
+    def __repr__(self):
+        return f"<SlowQueryRollup {self.database_id} {self.fingerprint_hash} {self.day}>"
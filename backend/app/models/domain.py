@@ -1,7 +1,7 @@
 """
 Domain model
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Text, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -30,6 +30,11 @@ class Domain(Base):
     ssl_enabled = Column(Boolean, default=True)
     ssl_certificate_id = Column(Integer, ForeignKey("ssl_certificates.id", ondelete="SET NULL"), nullable=True)
     
+    # DNS pre-flight (app.services.dns_service)
+    dns_status = Column(String(16), nullable=True)  # ok, partial, mismatch, nxdomain, nodata, unverified, error
+    dns_result = Column(JSON, nullable=True)  # Addresses and CNAME chain found
+    dns_checked_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    
     # Status
     is_active = Column(Boolean, default=True)
     
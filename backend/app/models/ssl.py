@@ -17,12 +17,16 @@ class SSLCertificate(Base):
     # Certificate info
     issuer = Column(String(255))
     issued_at = Column(DateTime(timezone=True))
-    expires_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), index=True)  # Range scans of the expiring-soon query
+    serial_number = Column(String(64))
+    fingerprint = Column(String(64))  # SHA-256 of the DER certificate, hex
     auto_renew = Column(Boolean, default=True)
     
     # Caddy-managed certificates
     caddy_managed = Column(Boolean, default=True)
     caddy_config = Column(JSON, default=dict)
+    storage_path = Column(String(512))  # Certificate file in Caddy's storage the metadata was read from
+    scanned_at = Column(DateTime(timezone=True))
     
     # Status
     is_valid = Column(Boolean, default=True)
@@ -0,0 +1,48 @@
+"""
+Traffic rollup model
+"""
+from sqlalchemy import Column, Integer, BigInteger, Float, Date, DateTime, String, LargeBinary, ForeignKey
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+# Upper bounds (ms) of the latency histogram buckets; one more bucket counts slower requests
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class TrafficRollup(Base):
+    """Requests to one site during one minute, aggregated from Caddy access logs"""
+    __tablename__ = "traffic_rollups"
+
+    site_id = Column(Integer, ForeignKey("sites.id", ondelete="CASCADE"), primary_key=True)
+    minute = Column(DateTime(timezone=True), primary_key=True, index=True)
+
+    requests = Column(Integer, nullable=False, default=0)
+    status_1xx = Column(Integer, nullable=False, default=0)
+    status_2xx = Column(Integer, nullable=False, default=0)
+    status_3xx = Column(Integer, nullable=False, default=0)
+    status_4xx = Column(Integer, nullable=False, default=0)
+    status_5xx = Column(Integer, nullable=False, default=0)
+    bytes_in = Column(BigInteger, nullable=False, default=0)
+    bytes_out = Column(BigInteger, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0, server_default="0")  # Served by the page cache
+    cache_misses = Column(Integer, nullable=False, default=0, server_default="0")  # Cacheable, forwarded to PHP
+    duration_ms_sum = Column(Float, nullable=False, default=0.0)
+    latency_histogram = Column(ARRAY(Integer), nullable=False)  # Counts per LATENCY_BUCKETS_MS bucket
+
+    def __repr__(self):
+        return f"<TrafficRollup site={self.site_id} {self.minute}>"
+
+
+class TrafficSketch(Base):
+    """Serialized sketch (unique visitors, top URLs or top referrers) of one site and UTC day"""
+    __tablename__ = "traffic_sketches"
+
+    site_id = Column(Integer, ForeignKey("sites.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    kind = Column(String(16), primary_key=True)  # visitors, urls or referrers
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<TrafficSketch site={self.site_id} {self.day} {self.kind}>"
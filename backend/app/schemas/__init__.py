@@ -34,6 +34,7 @@ from app.schemas.backup import (
     BackupRestoreRequest,
 )
 from app.schemas.audit import AuditLogResponse
+from app.schemas.log import LogSearchHit, LogSearchResponse
 
 __all__ = [
     "UserCreate",
@@ -59,4 +60,6 @@ __all__ = [
     "BackupResponse",
     "BackupRestoreRequest",
     "AuditLogResponse",
+    "LogSearchHit",
+    "LogSearchResponse",
 ]
@@ -2,7 +2,7 @@
 Database schemas
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.database import DatabaseType
 
@@ -34,3 +34,42 @@ class DatabaseResponse(DatabaseBase):
     
     class Config:
         from_attributes = True
+
+
+
+class TableStatsResponse(BaseModel):
+    name: str
+    engine: Optional[str] = None
+    rows: int  # Estimate
+    data_bytes: int
+    index_bytes: int
+    free_bytes: int
+    total_bytes: int
+
+
+class DatabaseSizePoint(BaseModel):
+    sampled_at: datetime
+    rows: int
+    data_bytes: int
+    index_bytes: int
+    total_bytes: int
+
+
+class DatabaseStatsResponse(BaseModel):
+    database_id: int
+    site_id: int
+    name: str
+    tables: int
+    rows: int  # Sum of row estimates
+    data_bytes: int
+    index_bytes: int
+    free_bytes: int
+    total_bytes: int
+    fragmentation: float  # free / (data + index + free)
+    largest_tables: List[TableStatsResponse] = []
+    history: List[DatabaseSizePoint] = []  # Last sample of each day
+
+
+class DatabaseStatsListResponse(BaseModel):
+    collected_at: Optional[datetime] = None
+    databases: List[DatabaseStatsResponse]
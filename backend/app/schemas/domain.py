@@ -22,13 +22,47 @@ class DomainUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
+class DomainImportError(BaseModel):
+    row: int
+    domain: str
+    error: str
+
+
+class DomainImportResponse(BaseModel):
+    received: int
+    created: int
+    failed: int
+    dry_run: bool
+    errors: list[DomainImportError]
+
+
 class DomainResponse(DomainBase):
     id: int
     site_id: int
     is_active: bool
     ssl_certificate_id: Optional[int] = None
+    dns_status: Optional[str] = None
+    dns_result: Optional[dict] = None
+    dns_checked_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     
     class Config:
         from_attributes = True
+
+
+class SSLCertificateResponse(BaseModel):
+    id: int
+    domain: str
+    issuer: Optional[str] = None
+    issued_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    serial_number: Optional[str] = None
+    fingerprint: Optional[str] = None
+    auto_renew: bool
+    caddy_managed: bool
+    is_valid: bool
+    scanned_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
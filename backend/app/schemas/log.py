@@ -0,0 +1,17 @@
+"""
+Log search schemas
+"""
+from pydantic import BaseModel
+from typing import List
+
+
+class LogSearchHit(BaseModel):
+    site_id: int
+    timestamp: float
+    offset: int  # Virtual byte offset in the site's worker log
+    line: str
+
+
+class LogSearchResponse(BaseModel):
+    results: List[LogSearchHit]
+    took_ms: float
@@ -2,8 +2,8 @@
 Site schemas
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, List
+from datetime import date, datetime
 from app.models.site import SiteType, SiteStatus
 
 
@@ -48,3 +48,188 @@ class SiteResponse(SiteBase):
     
     class Config:
         from_attributes = True
+
+
+class WorkerPlacementResponse(BaseModel):
+    site_id: int
+    node: int
+    cpus: List[int]
+    cpulist: str
+    dedicated: bool
+    load: float
+
+
+class PlacementMapResponse(BaseModel):
+    topology: Dict[str, str]  # NUMA node -> cpulist
+    reserved: str
+    placements: List[WorkerPlacementResponse]
+    updated_at: datetime
+
+
+class ResourceSampleResponse(BaseModel):
+    site_id: int
+    pid: Optional[int] = None
+    timestamp: Optional[float] = None
+    cpu_percent: Optional[float] = None
+    rss_bytes: Optional[int] = None
+    read_bps: Optional[float] = None
+    write_bps: Optional[float] = None
+    processes: Optional[int] = None
+
+
+class ResourceHistoryResponse(BaseModel):
+    current: ResourceSampleResponse
+    history: Dict[str, List[float]]  # series name -> values, oldest first; includes "timestamps"
+
+
+class LogPageResponse(BaseModel):
+    lines: List[str]
+    cursor: int  # Byte offset of the oldest line returned; pass as `before` for older lines
+    end: int  # Byte offset after the newest line; pass as `offset` to follow from here
+
+
+class SiteHealthResponse(BaseModel):
+    site_id: int
+    state: str  # unknown, healthy, degraded, down
+    consecutive_failures: int
+    last_checked: Optional[float] = None
+    last_ok: Optional[float] = None
+    latency_ms: Optional[float] = None
+    status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    restarts: int
+    last_restart: Optional[float] = None
+
+
+class WarmupReportResponse(BaseModel):
+    site_id: int
+    port: int
+    timestamp: float
+    sample_url: Optional[str] = None  # URL timed cold and warm
+    cold_ms: Optional[float] = None  # First request to the fresh worker
+    warm_ms: Optional[float] = None  # Same URL after warmup
+    urls: int
+    errors: int
+    duration_ms: float
+    failed_urls: List[str]
+
+
+class ReconcileReportResponse(BaseModel):
+    started_at: float
+    duration: float  # Seconds, including waiting for started workers to become ready
+    desired: int  # Active sites
+    running: int
+    started: List[int]
+    failed: List[int]
+    stopped: List[int]
+    stale_pid_files: List[int]
+
+
+class TrafficPointResponse(BaseModel):
+    timestamp: datetime  # Start of the step
+    requests: int
+    status: Dict[str, int]  # Requests per status class: 1xx .. 5xx
+    bytes_in: int
+    bytes_out: int
+    cache_hits: int = 0
+    cache_misses: int = 0
+    avg_ms: Optional[float] = None
+    p50_ms: Optional[float] = None  # Percentiles are histogram bucket upper bounds
+    p95_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+
+
+class TrafficSeriesResponse(BaseModel):
+    site_id: int
+    resolution: str  # minute, hour or day
+    since: datetime
+    until: datetime
+    points: List[TrafficPointResponse]
+
+
+class HeavyHitterResponse(BaseModel):
+    key: str  # URL path, or referrer origin
+    count: int  # Estimated; never below the true count
+
+
+class SiteAnalyticsResponse(BaseModel):
+    site_id: int
+    period: str  # day or week
+    start: date
+    end: date
+    unique_visitors: int  # Distinct client IPs (HyperLogLog estimate)
+    unique_visitors_error: float  # Relative standard error, e.g. 0.016
+    requests: int
+    top_urls: List[HeavyHitterResponse]
+    top_urls_error: int  # Counts overestimate by at most this much with 98% probability
+    top_referrers: List[HeavyHitterResponse]
+    top_referrers_error: int
+
+
+class SlowQueryResponse(BaseModel):
+    database_id: int
+    database: str
+    fingerprint_id: str  # 64-bit fingerprint hash, hex
+    fingerprint: str  # Statement with literals replaced by ?
+    calls: int
+    total_ms: float
+    avg_ms: Optional[float] = None
+    max_ms: float
+    p95_ms: Optional[float] = None  # Histogram bucket upper bound
+    lock_ms: float
+    rows_sent: int
+    rows_examined: int
+    last_seen: datetime
+
+
+class SlowQueryListResponse(BaseModel):
+    site_id: int
+    days: int
+    order: str
+    queries: List[SlowQueryResponse]
+
+
+class PageCacheRules(BaseModel):
+    enabled: bool
+    ttl: int  # Seconds a page is served from cache
+    stale: int  # Seconds an expired page may still be served while it is refreshed
+    bypass_cookies: List[str]  # Cookie name prefixes that skip the cache (e.g. logged-in users)
+    bypass_paths: List[str]  # Caddy path patterns that skip the cache
+    ignore_query: bool
+    vary_headers: List[str]
+
+
+class PageCacheUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    ttl: Optional[int] = Field(None, gt=0)
+    stale: Optional[int] = Field(None, ge=0)
+    bypass_cookies: Optional[List[str]] = None
+    bypass_paths: Optional[List[str]] = None
+    ignore_query: Optional[bool] = None
+    vary_headers: Optional[List[str]] = None
+
+
+class PageCacheStatsResponse(BaseModel):
+    since: datetime
+    requests: int
+    hits: int
+    misses: int
+    bypassed: int  # Not cacheable: bypass cookie or path, non-GET, or cache off
+    hit_ratio: Optional[float] = None  # Hits / cacheable requests
+    offload_ratio: Optional[float] = None  # Hits / all requests: share of traffic kept away from PHP
+
+
+class PageCacheResponse(BaseModel):
+    site_id: int
+    available: bool  # The proxy has the cache module (PAGE_CACHE_ENABLED)
+    rules: PageCacheRules
+    stats: PageCacheStatsResponse
+
+
+class CachePurgeRequest(BaseModel):
+    url: Optional[str] = None  # One page, e.g. https://example.com/about/
+    prefix: Optional[str] = None  # Every page under a path on all the site's domains; neither purges the site
+
+
+class CachePurgeResponse(BaseModel):
+    purged: int  # Purge requests sent to the proxy (one per domain for prefix and site purges)
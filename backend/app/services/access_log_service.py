@@ -0,0 +1,411 @@
+"""
+Caddy access log ingestion into per-site traffic rollups
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, text, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from app.models.domain import Domain
+from app.models.traffic import TrafficRollup, LATENCY_BUCKETS_MS
+from app.core.config import settings
+from app.services.sketch_service import SketchAggregator
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Iterable, Optional
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover
+    orjson = None
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+MAX_BYTES_PER_RUN = 256 * 1024 * 1024
+UPSERT_BATCH = 1000
+HISTOGRAM_SIZE = len(LATENCY_BUCKETS_MS) + 1
+STATUS_COLUMNS = ("status_1xx", "status_2xx", "status_3xx", "status_4xx", "status_5xx")
+COUNTER_COLUMNS = ("requests", "bytes_in", "bytes_out", "cache_hits", "cache_misses", "duration_ms_sum") + STATUS_COLUMNS
+
+
+def cache_result(headers: Optional[dict]) -> Optional[bool]:
+    """True for a page cache hit, False for a miss, None if the page cache was not consulted"""
+    if not headers:
+        return None
+    values = headers.get("Cache-Status")
+    if not values:
+        return None
+    parts = [part.strip() for part in values[0].split(";")]
+    if "hit" in parts:
+        return True
+    if any(part.startswith("fwd=") for part in parts):
+        return False
+    return None
+
+
+class MinuteRollup:
+    """Counters of one site and minute while a batch is aggregated"""
+    __slots__ = ("requests", "status", "bytes_in", "bytes_out", "cache_hits", "cache_misses", "duration_ms_sum", "histogram")
+
+    def __init__(self):
+        self.requests = 0
+        self.status = [0] * 5
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duration_ms_sum = 0.0
+        self.histogram = [0] * HISTOGRAM_SIZE
+
+    def add(self, status: int, bytes_in: int, bytes_out: int, duration_ms: float, cache: Optional[bool] = None):
+        self.requests += 1
+        if cache is not None:
+            if cache:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if 100 <= status < 600:
+            self.status[status // 100 - 1] += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.duration_ms_sum += duration_ms
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+    def row(self, site_id: int, minute: int) -> dict:
+        row = {
+            "site_id": site_id,
+            "minute": datetime.fromtimestamp(minute, timezone.utc),
+            "requests": self.requests,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "duration_ms_sum": self.duration_ms_sum,
+            "latency_histogram": self.histogram,
+        }
+        row.update(zip(STATUS_COLUMNS, self.status))
+        return row
+
+
+class TrafficAggregator:
+    """Folds access log entries into minute rollups and adds them to the stored ones"""
+
+    def __init__(self):
+        self.rollups: dict[tuple[int, int], MinuteRollup] = {}
+
+    def add(self, site_id: int, entry: dict):
+        ts = entry.get("ts")
+        if not isinstance(ts, (int, float)):
+            return
+        key = (site_id, int(ts) - int(ts) % 60)
+        rollup = self.rollups.get(key)
+        if rollup is None:
+            rollup = self.rollups[key] = MinuteRollup()
+        rollup.add(
+            int(entry.get("status") or 0),
+            int(entry.get("bytes_read") or 0),
+            int(entry.get("size") or 0),
+            float(entry.get("duration") or 0.0) * 1000.0,
+            cache_result(entry.get("resp_headers")),
+        )
+
+    async def flush(self, db: AsyncSession):
+        """Upsert the batch; counters are added to existing rows, histograms element-wise"""
+        rows = [rollup.row(site_id, minute) for (site_id, minute), rollup in sorted(self.rollups.items())]
+        # Cleared up front: if the upsert fails, the checkpoint is not saved and the lines are read again
+        self.rollups.clear()
+        table = TrafficRollup.__table__
+        for start in range(0, len(rows), UPSERT_BATCH):
+            stmt = insert(table).values(rows[start:start + UPSERT_BATCH])
+            excluded = stmt.excluded
+            update = {
+                column: table.c[column] + excluded[column]
+                for column in COUNTER_COLUMNS
+            }
+            update["latency_histogram"] = literal_column(
+                "ARRAY(SELECT a + b FROM unnest(traffic_rollups.latency_histogram, "
+                "excluded.latency_histogram) AS t(a, b))"
+            )
+            await db.execute(stmt.on_conflict_do_update(index_elements=["site_id", "minute"], set_=update))
+
+    async def prune(self, db: AsyncSession, retention_days: Optional[int] = None) -> int:
+        """Delete rollups older than the retention period"""
+        days = retention_days if retention_days is not None else settings.TRAFFIC_RETENTION_DAYS
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        result = await db.execute(delete(TrafficRollup).where(TrafficRollup.minute < cutoff))
+        await db.commit()
+        return result.rowcount or 0
+
+
+class HostMap:
+    """Request host -> site id, refreshed from the domains table"""
+
+    def __init__(self):
+        self.hosts: dict[str, int] = {}
+        self.loaded_at = 0.0
+
+    async def refresh(self, db: AsyncSession, max_age: float = 60.0):
+        if time.monotonic() - self.loaded_at < max_age:
+            return
+        result = await db.execute(select(Domain.domain, Domain.site_id))
+        self.hosts = {domain.lower(): site_id for domain, site_id in result.all()}
+        self.loaded_at = time.monotonic()
+
+    def site_id(self, host: str) -> Optional[int]:
+        site_id = self.hosts.get(host)
+        if site_id is None and host:
+            host = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+            site_id = self.hosts.get(host.lower().rstrip("."))
+        return site_id
+
+
+class LogTailer(ABC):
+    """Reads an append-only log incrementally from a checkpoint, surviving rotation and truncation.
+
+    The checkpoint is the (inode, offset) of the last complete line read. When
+    the log is rolled, the rest of the old file is read from its rotated name
+    (matched by inode) before the new file is started from the top. Subclasses
+    parse lines in _parse.
+    """
+
+    def __init__(self, log_file: str, checkpoint_name: str):
+        self.log_file = log_file
+        self.checkpoint_file = os.path.join(settings.RUNTIME_DIR, checkpoint_name)
+
+    def ingest(self, checkpoint: dict) -> tuple[int, dict]:
+        """Read and parse new lines of the current and just-rotated log file"""
+        try:
+            st = os.stat(self.log_file)
+        except OSError:
+            return 0, checkpoint
+        inode, offset = checkpoint.get("inode"), checkpoint.get("offset", 0)
+        entries = 0
+        budget = MAX_BYTES_PER_RUN
+
+        if inode is not None and inode != st.st_ino:
+            rotated = self._rotated_file(inode)
+            if rotated is None:
+                logger.warning("Log %s was rotated away before it was fully read", self.log_file)
+            else:
+                count, end = self._read(rotated, offset, budget)
+                entries += count
+                budget -= end - offset
+                try:
+                    unread = os.path.getsize(rotated) - end
+                except OSError:
+                    unread = 0
+                if unread > budget:
+                    # Out of budget for this run: finish the rotated file next time
+                    return entries, {"inode": inode, "offset": end}
+            offset = 0
+        elif st.st_size < offset:
+            logger.warning("Log %s was truncated; reading it from the start", self.log_file)
+            offset = 0
+
+        count, offset = self._read(self.log_file, offset, budget)
+        return entries + count, {"inode": st.st_ino, "offset": offset}
+
+    def _read(self, path: str, offset: int, budget: int) -> tuple[int, int]:
+        """Feed complete lines from offset on; returns (entries, offset after the last complete line)"""
+        entries = 0
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return 0, offset
+        with f:
+            f.seek(offset)
+            pending = b""
+            while budget > 0:
+                chunk = f.read(min(READ_CHUNK_BYTES, budget))
+                if not chunk:
+                    break
+                budget -= len(chunk)
+                data = pending + chunk
+                end = data.rfind(b"\n")
+                if end < 0:
+                    pending = data
+                    continue
+                pending = data[end + 1:]
+                entries += self._parse(data[:end].split(b"\n"))
+                offset += end + 1
+        return entries, offset
+
+    @abstractmethod
+    def _parse(self, lines: Iterable[bytes]) -> int:
+        """Consume complete lines; returns the number of entries accepted"""
+
+    def _rotated_file(self, inode: int) -> Optional[str]:
+        directory = os.path.dirname(self.log_file) or "."
+        base = os.path.basename(self.log_file)
+        stem, ext = os.path.splitext(base)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return None
+        for name in names:
+            # Caddy's roller (name-<time>.log) or logrotate (name.log.1)
+            if (name.startswith(stem + "-") and name.endswith(ext)) or name.startswith(base + "."):
+                path = os.path.join(directory, name)
+                try:
+                    if os.stat(path).st_ino == inode:
+                        return path
+                except OSError:
+                    continue
+        return None
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, checkpoint: dict):
+        os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_file)
+
+
+class AccessLogIngester(LogTailer):
+    """Tails Caddy's JSON access log and feeds complete lines to consumers"""
+
+    def __init__(self, log_file: Optional[str] = None, consumers: Optional[list] = None):
+        super().__init__(log_file or settings.ACCESS_LOG_FILE, "access_log_checkpoint.json")
+        self.hosts = HostMap()
+        self.consumers = consumers if consumers is not None else [TrafficAggregator()]
+        self._last_prune = 0.0
+
+    async def run(self, db: AsyncSession) -> int:
+        """Ingest new log lines; returns the number of entries attributed to a site"""
+        await self.hosts.refresh(db)
+        checkpoint = self._load_checkpoint()
+        entries, checkpoint = await asyncio.to_thread(self.ingest, checkpoint)
+        for consumer in self.consumers:
+            await consumer.flush(db)
+        await db.commit()
+        # Saved after the commit: a crash in between re-reads (and double counts) one batch at most
+        self._save_checkpoint(checkpoint)
+        if time.monotonic() - self._last_prune > 3600:
+            for consumer in self.consumers:
+                await consumer.prune(db)
+            self._last_prune = time.monotonic()
+        return entries
+
+    def _parse(self, lines: Iterable[bytes]) -> int:
+        entries = 0
+        site_id_for = self.hosts.site_id
+        consumers = self.consumers
+        for line in lines:
+            if not line:
+                continue
+            try:
+                entry = _loads(line)
+                site_id = site_id_for(entry["request"]["host"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if site_id is None:
+                continue
+            for consumer in consumers:
+                consumer.add(site_id, entry)
+            entries += 1
+        return entries
+
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def percentile(histogram: list[int], q: float, buckets: tuple = LATENCY_BUCKETS_MS) -> Optional[float]:
+    """Upper bound (ms) of the histogram bucket holding quantile q; the open last bucket reports its lower bound"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return float(buckets[min(i, len(buckets) - 1)])
+    return float(buckets[-1])
+
+
+async def traffic_series(
+    db: AsyncSession, site_id: int, since: datetime, until: datetime, resolution: str = "minute"
+) -> list[dict]:
+    """Per-step traffic of a site, summed from the minute rollups in Postgres"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    # Inlined rather than bound, so the SELECT and GROUP BY expressions are identical
+    bucket = func.date_trunc(literal_column(f"'{resolution}'"), TrafficRollup.minute).label("bucket")
+    in_range = (
+        TrafficRollup.site_id == site_id,
+        TrafficRollup.minute >= since,
+        TrafficRollup.minute < until,
+    )
+    sums = [
+        func.sum(getattr(TrafficRollup, column)).label(column)
+        for column in COUNTER_COLUMNS
+    ]
+    result = await db.execute(select(bucket, *sums).where(*in_range).group_by(bucket).order_by(bucket))
+    points = {row.bucket: row for row in result.all()}
+
+    # Histograms are summed per bucket index in SQL so only one row per step and bucket comes back
+    histograms = {ts: [0] * HISTOGRAM_SIZE for ts in points}
+    result = await db.execute(
+        text(
+            f"SELECT date_trunc('{resolution}', minute) AS bucket, h.idx, sum(h.n) "
+            "FROM traffic_rollups, unnest(latency_histogram) WITH ORDINALITY AS h(n, idx) "
+            "WHERE site_id = :site_id AND minute >= :since AND minute < :until "
+            "GROUP BY 1, 2"
+        ),
+        {"site_id": site_id, "since": since, "until": until},
+    )
+    for ts, idx, count in result.all():
+        if ts in histograms and 0 < idx <= HISTOGRAM_SIZE:
+            histograms[ts][idx - 1] = int(count)
+
+    series = []
+    for ts, row in points.items():
+        requests = int(row.requests or 0)
+        histogram = histograms[ts]
+        series.append({
+            "timestamp": ts,
+            "requests": requests,
+            "status": {column[len("status_"):]: int(getattr(row, column) or 0) for column in STATUS_COLUMNS},
+            "bytes_in": int(row.bytes_in or 0),
+            "bytes_out": int(row.bytes_out or 0),
+            "cache_hits": int(row.cache_hits or 0),
+            "cache_misses": int(row.cache_misses or 0),
+            "avg_ms": round(float(row.duration_ms_sum or 0) / requests, 2) if requests else None,
+            "p50_ms": percentile(histogram, 0.50),
+            "p95_ms": percentile(histogram, 0.95),
+            "p99_ms": percentile(histogram, 0.99),
+        })
+    return series
+
+
+_ingester: Optional[AccessLogIngester] = None
+
+
+def get_access_log_ingester() -> AccessLogIngester:
+    """Process-wide access log ingester (its host map and consumers persist between runs)"""
+    global _ingester
+    if _ingester is None:
+        _ingester = AccessLogIngester()
+        _ingester.consumers.append(SketchAggregator(_ingester.hosts))
+    return _ingester
+
+
+async def ingest_access_logs():
+    """Background job: fold new access log lines into traffic rollups"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await get_access_log_ingester().run(db)
@@ -10,6 +10,7 @@ from app.schemas.backup import BackupCreate, BackupRestoreRequest
 from app.core.config import settings
 from app.core.security import encrypt_secret, decrypt_secret
 from app.services.database_service import DatabaseService
+from app.services.database_dump_service import dump_database, load_database, is_dump
 import os
 import tarfile
 import gzip
@@ -150,12 +151,14 @@ class BackupService:
                 tar.add(site.path, arcname="site")
             
             # Backup database
-            await self._backup_database_to_file(site, os.path.join(temp_dir, "database.sql"))
+            db_dir = os.path.join(temp_dir, "database")
+            await self._backup_database_to_dir(site, db_dir)
             
             # Create final archive
             with tarfile.open(backup_path, "w:gz") as tar:
                 tar.add(site_backup, arcname="site.tar.gz")
-                tar.add(os.path.join(temp_dir, "database.sql"), arcname="database.sql")
+                if os.path.isdir(db_dir):
+                    tar.add(db_dir, arcname="database")
             
         finally:
             shutil.rmtree(temp_dir)
@@ -171,16 +174,17 @@ class BackupService:
         os.makedirs(temp_dir, exist_ok=True)
         
         try:
-            db_file = os.path.join(temp_dir, "database.sql")
-            await self._backup_database_to_file(site, db_file)
+            db_dir = os.path.join(temp_dir, "database")
+            await self._backup_database_to_dir(site, db_dir)
             
             with tarfile.open(backup_path, "w:gz") as tar:
-                tar.add(db_file, arcname="database.sql")
+                if os.path.isdir(db_dir):
+                    tar.add(db_dir, arcname="database")
         finally:
             shutil.rmtree(temp_dir)
     
-    async def _backup_database_to_file(self, site: Site, output_file: str):
-        """Backup database to SQL file"""
+    async def _backup_database_to_dir(self, site: Site, output_dir: str):
+        """Backup database as a parallel dump (compressed per-table chunks plus manifest)"""
         # Get database for site
         result = await self.db.execute(select(Database).where(Database.site_id == site.id).limit(1))
         db = result.scalar_one_or_none()
@@ -188,20 +192,7 @@ class BackupService:
         if not db:
             return
         
-        password = decrypt_secret(db.encrypted_password)
-        
-        # Use mysqldump
-        cmd = [
-            "mysqldump",
-            f"--host={db.host}",
-            f"--port={db.port}",
-            f"--user={db.username}",
-            f"--password={password}",
-            db.name,
-        ]
-        
-        with open(output_file, "w") as f:
-            subprocess.run(cmd, stdout=f, check=True)
+        await dump_database(db.name, output_dir)
     
     async def _restore_files(self, site: Site, extract_dir: str):
         """Restore site files"""
@@ -218,9 +209,10 @@ class BackupService:
     
     async def _restore_database(self, site: Site, extract_dir: str):
         """Restore database"""
+        db_dir = os.path.join(extract_dir, "database")
         db_file = os.path.join(extract_dir, "database.sql")
         
-        if not os.path.exists(db_file):
+        if not is_dump(db_dir) and not os.path.exists(db_file):
             return
         
         # Get database
@@ -230,6 +222,12 @@ class BackupService:
         if not db:
             return
         
+        if is_dump(db_dir):
+            # Views and triggers are owned by the site's database user, also when restoring another site's backup
+            await load_database(db_dir, db.name, definer=f"`{db.username}`@`localhost`")
+            return
+        
+        # Backups taken before parallel dumps: a single mysqldump file
         password = decrypt_secret(db.encrypted_password)
         
         # Restore using mysql
@@ -0,0 +1,432 @@
+"""
+Caddy JSON admin API backend with incremental per-site route updates
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.domain import Domain
+from app.models.site import Site
+from app.core.config import settings
+from app.services.caddy_service import upstream_port, site_rules
+from app.services.page_cache_service import PageCacheRules
+from app.services.static_files_service import StaticFileRules
+from dataclasses import dataclass, field
+import asyncio
+import logging
+from typing import Any, Iterable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# FrankenPanel owns only these objects; the rest of Caddy's config (e.g. the dashboard) is left alone
+SERVER_PATH = ("apps", "http", "servers", "frankenpanel_sites")
+TLS_POLICIES_PATH = ("apps", "tls", "automation", "policies")
+TLS_POLICY_ID = "frankenpanel_on_demand"
+TLS_ON_DEMAND_PATH = ("apps", "tls", "automation", "on_demand")
+CACHE_API_PATH = ("apps", "cache", "api", "souin")
+ACCESS_LOGGER = "frankenpanel_access"
+ACCESS_LOG_PATH = ("logging", "logs", ACCESS_LOGGER)
+
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": ["nosniff"],
+    "X-Frame-Options": ["DENY"],
+    "X-Xss-Protection": ["1; mode=block"],
+}
+
+
+def route_id(site_id: int) -> str:
+    return f"frankenpanel_site_{site_id}"
+
+
+def upstream_id(site_id: int) -> str:
+    return f"frankenpanel_site_{site_id}_upstream"
+
+
+@dataclass
+class SiteRoute:
+    """Desired route of one site: its active domains proxied to its worker"""
+    site_id: int
+    port: int
+    hosts: list[str] = field(default_factory=list)
+    tls_hosts: list[str] = field(default_factory=list)
+    cache: Optional[PageCacheRules] = None
+    static: Optional[StaticFileRules] = None
+
+    def to_json(self) -> dict:
+        proxy = {
+            "@id": upstream_id(self.site_id),
+            "handler": "reverse_proxy",
+            "upstreams": [{"dial": f"127.0.0.1:{self.port}"}],
+        }
+        if self.cache is not None and self.cache.active:
+            # The cache handler wraps the proxy only for requests matching the cacheable matcher
+            proxy = {
+                "handler": "subroute",
+                "routes": [
+                    {"match": [self.cache.matcher_json()], "handle": [self.cache.handler_json()]},
+                    {"handle": [proxy]},
+                ],
+            }
+        static_routes = self.static.routes_json() if self.static is not None else []
+        if static_routes:
+            # Files on disk are served first; a static site has no worker to fall back to
+            if not self.static.static_site:
+                static_routes.append({"handle": [proxy]})
+            proxy = {"handler": "subroute", "routes": static_routes}
+        return {
+            "@id": route_id(self.site_id),
+            "match": [{"host": self.hosts}],
+            "handle": [{"handler": "headers", "response": {"set": SECURITY_HEADERS}}, proxy],
+            "terminal": True,
+        }
+
+
+class CaddyConfigModel:
+    """Canonical model of the FrankenPanel part of Caddy's config"""
+
+    def __init__(self, routes: Optional[Iterable[SiteRoute]] = None):
+        self.routes: dict[int, SiteRoute] = {route.site_id: route for route in routes or []}
+
+    @classmethod
+    async def from_db(cls, db: AsyncSession) -> "CaddyConfigModel":
+        result = await db.execute(select(Site.id, Site.worker_port, Site.site_type, Site.path, Site.config))
+        sites = {
+            site_id: (port, *site_rules(site_id, site_type, path, config))
+            for site_id, port, site_type, path, config in result.all()
+        }
+        result = await db.execute(select(Domain).where(Domain.is_active == True))  # noqa: E712
+        by_site: dict[int, list[Domain]] = {}
+        for domain in result.scalars().all():
+            by_site.setdefault(domain.site_id, []).append(domain)
+        return cls(
+            site_route(site_id, *sites[site_id], domains=domains)
+            for site_id, domains in by_site.items()
+            if site_id in sites
+        )
+
+    def server_json(self) -> dict:
+        routes = [self.routes[site_id].to_json() for site_id in sorted(self.routes)]
+        server = {
+            "listen": [":80", ":443"],
+            "routes": routes,
+            "automatic_https": {"skip": self.plain_http_hosts()},
+        }
+        if settings.ACCESS_LOG_ENABLED:
+            server["logs"] = {"default_logger_name": ACCESS_LOGGER}
+        return server
+
+    def access_log_json(self) -> dict:
+        return {
+            "writer": {
+                "output": "file",
+                "filename": settings.ACCESS_LOG_FILE,
+                "roll_size_mb": settings.ACCESS_LOG_ROLL_SIZE_MB,
+                "roll_keep": settings.ACCESS_LOG_ROLL_KEEP,
+                "roll_gzip": False,
+            },
+            "encoder": {"format": "json"},
+            "include": [f"http.log.access.{ACCESS_LOGGER}"],
+        }
+
+    def plain_http_hosts(self) -> list[str]:
+        return sorted(h for route in self.routes.values() for h in route.hosts if h not in route.tls_hosts)
+
+    def tls_hosts(self) -> list[str]:
+        return sorted(h for route in self.routes.values() for h in route.tls_hosts)
+
+
+def tls_policy_json(subjects: list[str]) -> dict:
+    return {"@id": TLS_POLICY_ID, "subjects": subjects, "on_demand": True}
+
+
+def site_route(
+    site_id: int,
+    port: int,
+    static: Optional[StaticFileRules] = None,
+    cache: Optional[PageCacheRules] = None,
+    domains: Iterable[Domain] = (),
+) -> SiteRoute:
+    domains = [d for d in domains if d.is_active]
+    return SiteRoute(
+        site_id=site_id,
+        port=port,
+        hosts=sorted(d.domain.lower() for d in domains),
+        tls_hosts=sorted(d.domain.lower() for d in domains if d.ssl_enabled),
+        cache=cache,
+        static=static,
+    )
+
+
+class CaddyAdminError(Exception):
+    """Non-2xx response from the Caddy admin API"""
+
+    def __init__(self, method: str, path: str, status_code: int, body: str):
+        super().__init__(f"Caddy admin {method} {path} failed with {status_code}: {body.strip()}")
+        self.status_code = status_code
+
+
+class CaddyAdminClient:
+    """Thin async client for Caddy's admin endpoint (default http://localhost:2019)"""
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 10.0):
+        self.base_url = (base_url or settings.CADDY_ADMIN_URL).rstrip("/")
+        self.timeout = timeout
+
+    async def request(self, method: str, path: str, body: Any = None) -> Any:
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+            response = await client.request(method, path, json=body)
+        if response.status_code >= 400:
+            raise CaddyAdminError(method, path, response.status_code, response.text)
+        if not response.content:
+            return None
+        return response.json()
+
+    async def get(self, path: str) -> Any:
+        return await self.request("GET", path)
+
+    async def get_config_by_id(self, object_id: str) -> Any:
+        """Config object with an @id, or None if there is none"""
+        try:
+            return await self.get(f"/id/{object_id}")
+        except CaddyAdminError as e:
+            if e.status_code in (400, 404):
+                return None
+            raise
+
+    async def get_config(self, segments: Iterable[str]) -> Any:
+        """Config value at a path, or None where the path does not exist"""
+        try:
+            return await self.get("/config/" + "/".join(segments))
+        except CaddyAdminError as e:
+            if e.status_code in (400, 404):
+                return None
+            raise
+
+
+class CaddyAdminService:
+    """Keeps Caddy's routes in line with the sites and domains tables, one site at a time"""
+
+    def __init__(self, client: Optional[CaddyAdminClient] = None):
+        self.client = client or CaddyAdminClient()
+        self.model: Optional[CaddyConfigModel] = None
+        self._lock = asyncio.Lock()
+
+    async def sync_site(self, db: AsyncSession, site_id: int, exclude_domain_ids: Iterable[int] = ()):
+        """Add, update or remove one site's route to match the database.
+
+        Called with caddy_service.reload_lock() held. Other processes change
+        routes too, so the change is worked out against Caddy's live config,
+        not this process's model. Raises CaddyAdminError/httpx.HTTPError if
+        neither the change nor a full load of the config could be applied.
+        """
+        excluded = set(exclude_domain_ids)
+        result = await db.execute(
+            select(Site.worker_port, Site.site_type, Site.path, Site.config).where(Site.id == site_id)
+        )
+        site = result.one_or_none()
+        result = await db.execute(select(Domain).where(Domain.site_id == site_id))
+        domains = [d for d in result.scalars().all() if d.id not in excluded]
+        route = None
+        if site is not None:
+            port, site_type, path, config = site
+            static, cache = site_rules(site_id, site_type, path, config)
+            route = site_route(site_id, upstream_port(site_id, port), static, cache, domains)
+        if route is not None and not route.hosts:
+            route = None
+
+        async with self._lock:
+            await self._apply(lambda: self._sync_route(site_id, route), db, site_id, route)
+
+    async def switch_upstream(self, db: AsyncSession, site_id: int, port: int):
+        """Point a site's route at another worker port (blue/green reloads)"""
+        async with self._lock:
+            try:
+                await self.client.request(
+                    "PATCH", f"/id/{upstream_id(site_id)}/upstreams", [{"dial": f"127.0.0.1:{port}"}]
+                )
+            except CaddyAdminError as e:
+                if e.status_code not in (400, 404):
+                    raise
+                return  # The site has no route (no active domains)
+            if self.model is not None and site_id in self.model.routes:
+                self.model.routes[site_id].port = port
+
+    async def sync(self, db: AsyncSession, rebuild: bool = True) -> bool:
+        """Compare Caddy with the model and load the FrankenPanel config in full on drift; True if it drifted"""
+        from app.services.caddy_service import reload_lock
+        # Same order as a reload batch (flock, then the process lock) so the two cannot deadlock
+        async with reload_lock(), self._lock:
+            if rebuild or self.model is None:
+                await self._rebuild(db)
+            return await self._full_load_if_drifted()
+
+    async def is_loaded(self) -> bool:
+        """False once Caddy has lost the FrankenPanel server, e.g. after a restart or a Caddyfile reload"""
+        return await self.client.get_config(SERVER_PATH + ("listen",)) is not None
+
+    async def _rebuild(self, db: AsyncSession):
+        self.model = await CaddyConfigModel.from_db(db)
+        for route in self.model.routes.values():
+            route.port = upstream_port(route.site_id, route.port)
+
+    async def _apply(self, operation, db: AsyncSession, site_id: int, route: Optional[SiteRoute]):
+        """Run an incremental update; fall back to a full load when Caddy disagrees with it"""
+        try:
+            await operation()
+        except (CaddyAdminError, httpx.HTTPError) as e:
+            logger.warning("Incremental Caddy update failed (%s); reloading FrankenPanel config", e)
+            await self._rebuild(db)
+            # The caller's view wins for its site, e.g. a domain that is being deleted
+            if route is None:
+                self.model.routes.pop(site_id, None)
+            else:
+                self.model.routes[site_id] = route
+            await self._full_load_if_drifted()
+
+    async def _sync_route(self, site_id: int, route: Optional[SiteRoute]):
+        live = await self.client.get_config_by_id(route_id(site_id))
+        try:
+            live_hosts = set(live["match"][0]["host"]) if live else set()
+        except (KeyError, IndexError, TypeError):
+            live_hosts = set()
+        if route is None:
+            if live is not None:
+                await self.client.request("DELETE", f"/id/{route_id(site_id)}")
+        elif live is None:
+            await self.client.request("POST", "/config/" + "/".join(SERVER_PATH + ("routes",)), route.to_json())
+        elif live != route.to_json():
+            await self.client.request("PATCH", f"/id/{route_id(site_id)}", route.to_json())
+        if self.model is not None:
+            if route is None:
+                self.model.routes.pop(site_id, None)
+            else:
+                self.model.routes[site_id] = route
+        await self._update_host_lists(live_hosts, route)
+
+    async def _update_host_lists(self, previous_hosts: set[str], route: Optional[SiteRoute]):
+        """Swap one site's hosts in the live skip list and TLS policy, keeping every other site's"""
+        hosts = set(route.hosts) if route else set()
+        tls_hosts = set(route.tls_hosts) if route else set()
+        skip_path = SERVER_PATH + ("automatic_https", "skip")
+        current = set(await self.client.get_config(skip_path) or [])
+        skip = (current - previous_hosts - hosts) | (hosts - tls_hosts)
+        if skip != current:
+            await self._load(skip_path, sorted(skip))
+        await self._sync_tls_policy((previous_hosts | hosts, tls_hosts))
+
+    async def _sync_tls_policy(self, change: Optional[tuple[set[str], set[str]]] = None) -> bool:
+        """Keep the on-demand TLS policy listing exactly the TLS-enabled hosts; True if it changed.
+
+        With change=(replaced, added) only those hosts of the live policy are
+        replaced; without it the policy is set from the model.
+        """
+        policies = await self.client.get_config(TLS_POLICIES_PATH)
+        current = next((p for p in policies or [] if p.get("@id") == TLS_POLICY_ID), None)
+        if change is None:
+            subjects = self.model.tls_hosts()
+        else:
+            replaced, added = change
+            subjects = sorted((set((current or {}).get("subjects") or []) - replaced) | added)
+        # A policy without subjects would match every host, so drop it instead
+        policy = tls_policy_json(subjects) if subjects else None
+        if current == policy:
+            return False
+        if policy is None:
+            await self.client.request("DELETE", f"/id/{TLS_POLICY_ID}")
+        elif current is not None:
+            await self.client.request("PATCH", f"/id/{TLS_POLICY_ID}", policy)
+        elif policies is not None:
+            await self.client.request("POST", "/config/" + "/".join(TLS_POLICIES_PATH), policy)
+        else:
+            await self._load(TLS_POLICIES_PATH, [policy])
+        return True
+
+    async def _full_load_if_drifted(self) -> bool:
+        drifted = False
+        server = self.model.server_json()
+        if not _same_server(await self.client.get_config(SERVER_PATH), server):
+            await self._load(SERVER_PATH, server)
+            drifted = True
+        drifted = await self._sync_tls_policy() or drifted
+        if settings.PAGE_CACHE_ENABLED and await self.client.get_config(CACHE_API_PATH) != {"enable": True}:
+            # Purges go through the cache module's API on the admin endpoint
+            await self._load(CACHE_API_PATH, {"enable": True})
+            drifted = True
+        if settings.ACCESS_LOG_ENABLED:
+            access_log = self.model.access_log_json()
+            if await self.client.get_config(ACCESS_LOG_PATH) != access_log:
+                await self._load(ACCESS_LOG_PATH, access_log)
+                drifted = True
+        if settings.TLS_ASK_URL:
+            on_demand = {"ask": settings.TLS_ASK_URL}
+            if await self.client.get_config(TLS_ON_DEMAND_PATH) != on_demand:
+                await self._load(TLS_ON_DEMAND_PATH, on_demand)
+                drifted = True
+        if drifted:
+            logger.info("Loaded FrankenPanel Caddy config (%s site routes)", len(self.model.routes))
+        return drifted
+
+    async def _load(self, segments: tuple[str, ...], value: Any):
+        """Set a config path, creating missing parent objects"""
+        if await self.client.get_config(segments) is not None:
+            await self.client.request("PATCH", "/config/" + "/".join(segments), value)
+            return
+        # Find the deepest existing parent and create the rest in one PUT
+        depth = len(segments) - 1
+        while depth > 0 and await self.client.get_config(segments[:depth]) is None:
+            depth -= 1
+        for key in reversed(segments[depth + 1:]):
+            value = {key: value}
+        await self.client.request("PUT", "/config/" + "/".join(segments[:depth + 1]), value)
+
+
+def _same_server(current: Any, desired: dict) -> bool:
+    """Server configs are equal up to route order (incremental adds append routes)"""
+    if not isinstance(current, dict):
+        return False
+    by_id = lambda routes: {route.get("@id"): route for route in routes or []}
+    return (
+        {k: v for k, v in current.items() if k != "routes"} == {k: v for k, v in desired.items() if k != "routes"}
+        and by_id(current.get("routes")) == by_id(desired["routes"])
+        and len(current.get("routes") or []) == len(desired["routes"])
+    )
+
+
+_admin: Optional[CaddyAdminService] = None
+
+
+def get_caddy_admin() -> CaddyAdminService:
+    """Process-wide Caddy admin backend"""
+    global _admin
+    if _admin is None:
+        _admin = CaddyAdminService()
+    return _admin
+
+
+async def sync_caddy_config():
+    """Background job: repair drift between Caddy and the database"""
+    from app.core.database import AsyncSessionLocal
+    from app.services.caddy_service import CaddyService
+    # Site blocks left from the Caddyfile backend would bind :80/:443 next to frankenpanel_sites
+    if await CaddyService().clear_caddyfile_sites():
+        logger.info("Removed generated site blocks from the Caddyfile; sites are served through the admin API")
+    async with AsyncSessionLocal() as db:
+        await get_caddy_admin().sync(db)
+
+
+async def watch_caddy_config():
+    """Background job: reload the FrankenPanel config as soon as Caddy comes back without it
+
+    Config pushed through the admin API lives only in Caddy's memory; a
+    restart starts Caddy from the Caddyfile alone.
+    """
+    admin = get_caddy_admin()
+    try:
+        if await admin.is_loaded():
+            return
+    except httpx.HTTPError:
+        return  # Caddy is down; checked again on the next run
+    logger.warning("Caddy is running without the FrankenPanel sites (restarted?); loading them again")
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await admin.sync(db)
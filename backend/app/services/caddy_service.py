@@ -2,14 +2,173 @@
 Caddy reverse proxy management service
 """
 from app.models.domain import Domain
-from app.models.site import Site
+from app.models.site import Site, SiteType
 from app.core.config import settings
+from app.services import page_cache_service
+from app.services.page_cache_service import PageCacheRules
+from app.services.static_files_service import StaticFileRules
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+import fcntl
+import logging
 import os
+import re
 import subprocess
 import asyncio
-from typing import Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# The sites section of the Caddyfile is owned by FrankenPanel; everything outside it is kept as is
+BEGIN_MARKER = "# BEGIN FrankenPanel sites (generated, do not edit)"
+END_MARKER = "# END FrankenPanel sites"
+
+SECURITY_HEADERS_BLOCK = (
+    "    header {\n"
+    '        X-Content-Type-Options "nosniff"\n'
+    '        X-Frame-Options "DENY"\n'
+    '        X-XSS-Protection "1; mode=block"\n'
+    "    }\n"
+)
+TLS_BLOCK = "    tls {\n        on_demand\n    }\n"
+
+GLOBAL_BEGIN_MARKER = "# BEGIN FrankenPanel global options"
+GLOBAL_END_MARKER = "# END FrankenPanel global options"
+GLOBAL_SECTION_RE = re.compile(
+    re.escape(GLOBAL_BEGIN_MARKER) + r"\n.*?" + re.escape(GLOBAL_END_MARKER) + r"\n+", re.S
+)
+
+UPSTREAM_RE = re.compile(r"reverse_proxy 127\.0\.0\.1:(\d+)")
+
+# Upstreams switched by blue/green reloads before the new port is committed: site_id -> (port, since).
+# Process-local: other backend processes render the stored port until reload_worker commits the new
+# one, which it does right after the switch; only this process regenerates config in between.
+_switched_upstreams: dict[int, tuple[int, float]] = {}
+
+
+class CaddyConfigError(Exception):
+    """The regenerated Caddyfile did not pass `caddy validate`; the current one was kept"""
+
+
+def pin_upstream(site_id: int, port: int):
+    """Route a site to port even while the database still holds its previous worker port"""
+    _switched_upstreams[site_id] = (port, time.monotonic())
+
+
+def unpin_upstream(site_id: int):
+    """Drop a pin whose switch failed, so regenerations route to the stored port again"""
+    _switched_upstreams.pop(site_id, None)
+
+
+def upstream_port(site_id: int, db_port: int) -> int:
+    """Worker port to route to: a just-switched upstream wins until the database catches up"""
+    switched = _switched_upstreams.get(site_id)
+    if switched is None:
+        return db_port
+    port, since = switched
+    if port == db_port or time.monotonic() - since > settings.CADDY_SWITCH_PIN_SECONDS:
+        del _switched_upstreams[site_id]
+        return db_port
+    return port
+
+
+def access_log_block() -> str:
+    """JSON access log shared by all sites (Caddy opens one writer per file); ingested into traffic rollups"""
+    if not settings.ACCESS_LOG_ENABLED:
+        return ""
+    return (
+        "    log {\n"
+        f"        output file {settings.ACCESS_LOG_FILE} {{\n"
+        f"            roll_size {settings.ACCESS_LOG_ROLL_SIZE_MB}MiB\n"
+        f"            roll_keep {settings.ACCESS_LOG_ROLL_KEEP}\n"
+        # Rolled files stay plain so the ingester can finish reading them
+        "            roll_uncompressed\n"
+        "        }\n"
+        "        format json\n"
+        "    }\n"
+    )
+
+
+def render_site_body(port: int, static: StaticFileRules, cache: PageCacheRules) -> str:
+    """Handlers of a site: static files from disk, then the page cache and the worker"""
+    if static.static_site:
+        return static.caddyfile()
+    exclude = static.path_patterns() if static.active else None
+    return f"{static.caddyfile()}{cache.caddyfile(exclude)}    reverse_proxy 127.0.0.1:{port}\n"
+
+
+def render_site_block(domain: str, ssl_enabled: bool, body: str) -> str:
+    """Caddyfile block of one domain"""
+    if ssl_enabled:
+        return f"{domain} {{\n{body}{TLS_BLOCK}{SECURITY_HEADERS_BLOCK}{access_log_block()}}}\n\n"
+    return f"http://{domain} {{\n{body}{SECURITY_HEADERS_BLOCK}{access_log_block()}}}\n\n"
+
+
+def render_sites(rows: Iterable[tuple[str, bool, str]]) -> str:
+    """Sites section for (domain, ssl_enabled, body) rows; byte-stable for the same set of rows"""
+    return "".join(render_site_block(*row) for row in sorted(rows))
+
+
+def site_rules(
+    site_id: int, site_type: SiteType, path: str, config: Optional[dict]
+) -> tuple[StaticFileRules, PageCacheRules]:
+    """A site's static file and page cache rules; invalid stored rules are ignored rather than break the config"""
+    try:
+        static = StaticFileRules.for_site(site_type, path, config)
+    except (ValueError, TypeError) as e:
+        logger.warning("Ignoring invalid static file rules of site %s: %s", site_id, e)
+        static = StaticFileRules(root=path, enabled=False, static_site=site_type == SiteType.STATIC)
+    try:
+        cache = PageCacheRules.for_site(site_type, config)
+    except (ValueError, TypeError) as e:
+        logger.warning("Ignoring invalid page cache rules of site %s: %s", site_id, e)
+        cache = PageCacheRules()
+    return static, cache
+
+
+def set_global_options(content: str) -> str:
+    """Global options owned by FrankenPanel: the on-demand TLS ask endpoint and the page cache"""
+    content = GLOBAL_SECTION_RE.sub("", content)
+    options = page_cache_service.global_options()
+    if settings.TLS_ASK_URL:
+        # Only our domains can trigger certificate issuance
+        options += f"    on_demand_tls {{\n        ask {settings.TLS_ASK_URL}\n    }}\n"
+    if not options:
+        return content
+    lines = content.splitlines(keepends=True)
+    # Caddy allows one global options block, and only as the first block: merge into an existing one
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped == "{":
+            head, tail = "".join(lines[:i + 1]), "".join(lines[i + 1:])
+            return f"{head}{GLOBAL_BEGIN_MARKER}\n{options}{GLOBAL_END_MARKER}\n{tail}"
+        break
+    return f"{GLOBAL_BEGIN_MARKER}\n{{\n{options}}}\n{GLOBAL_END_MARKER}\n\n{content}"
+
+
+def strip_legacy_blocks(content: str) -> str:
+    """Remove site blocks appended by older versions (top-level blocks proxying to a worker port)"""
+    low = settings.FRANKENPHP_WORKER_START_PORT
+    high = low + 2 * settings.FRANKENPHP_WORKER_MAX
+    kept, block, depth = [], [], 0
+    for line in content.splitlines(keepends=True):
+        if depth == 0 and not line.rstrip().endswith("{"):
+            kept.append(line)
+            continue
+        block.append(line)
+        depth += line.count("{") - line.count("}")
+        if depth <= 0:
+            depth = 0
+            ports = [int(p) for p in UPSTREAM_RE.findall("".join(block))]
+            if not (ports and all(low <= p < high for p in ports)):
+                kept.extend(block)
+            block = []
+    kept.extend(block)
+    return re.sub(r"\n{3,}", "\n\n", "".join(kept))
 
 
 class CaddyService:
@@ -19,93 +178,259 @@ class CaddyService:
         self.caddy_config_file = settings.CADDY_CONFIG_FILE
         self.caddy_bin = settings.CADDY_BIN
     
+    @property
+    def uses_admin_api(self) -> bool:
+        return settings.CADDY_BACKEND == "admin_api"
+    
     async def add_domain(self, domain: Domain):
         """Add domain to Caddy configuration"""
-        # Get site
-        from app.core.database import get_db
-        async for db in get_db():
-            result = await db.execute(select(Site).where(Site.id == domain.site_id))
-            site = result.scalar_one_or_none()
-            break
-        
-        if not site:
-            return
-        
-        # Generate Caddyfile block
-        caddy_block = self._generate_caddy_block(domain, site)
-        
-        # Append to Caddyfile
-        await self._append_to_caddyfile(caddy_block)
-        
-        # Reload Caddy
-        await self._reload_caddy()
+        await get_reload_coordinator().submit(domain.site_id)
     
     async def update_domain(self, domain: Domain):
         """Update domain in Caddy configuration"""
-        # Regenerate entire Caddyfile
-        await self._regenerate_caddyfile()
-        await self._reload_caddy()
+        await get_reload_coordinator().submit(domain.site_id)
     
     async def remove_domain(self, domain: Domain):
         """Remove domain from Caddy configuration"""
-        # Regenerate Caddyfile without this domain
-        await self._regenerate_caddyfile()
-        await self._reload_caddy()
+        # Called before the domain row is deleted
+        await get_reload_coordinator().submit(domain.site_id, exclude_domain_ids=[domain.id])
     
-    def _generate_caddy_block(self, domain: Domain, site: Site) -> str:
-        """Generate Caddyfile block for a domain"""
-        lines = []
-        
-        # Domain line
-        if domain.ssl_enabled:
-            lines.append(f"{domain.domain} {{")
-        else:
-            lines.append(f"http://{domain.domain} {{")
+    async def update_site(self, site_id: int):
+        """Apply a change of a site's proxy settings (e.g. page cache rules)"""
+        await get_reload_coordinator().submit(site_id)
+    
+    async def remove_site(self, site_id: int):
+        """Drop a deleted site's domains from Caddy configuration"""
+        await get_reload_coordinator().submit(site_id)
+    
+    async def switch_upstream(self, site: Site, old_port: int, new_port: int):
+        """Point every proxy block of a site from old_port to new_port and reload Caddy.
         
-        # Reverse proxy to FrankenPHP worker
-        lines.append(f"    reverse_proxy 127.0.0.1:{site.worker_port}")
+        new_port is pinned in this process only (see _switched_upstreams); the
+        caller commits it as the site's worker_port once this returns. If the
+        switch fails the pin is dropped again before the error is raised.
+        """
+        pin_upstream(site.id, new_port)
+        try:
+            if self.uses_admin_api:
+                # A single PATCH; no need to wait for a batch
+                from app.core.database import AsyncSessionLocal
+                from app.services.caddy_admin_service import get_caddy_admin
+                async with AsyncSessionLocal() as db:
+                    await get_caddy_admin().switch_upstream(db, site.id, new_port)
+                return
+            
+            await get_reload_coordinator().submit(site.id)
+        except Exception:
+            unpin_upstream(site.id)
+            raise
+    
+    async def apply_changes(self, site_ids: set[int], exclude_domain_ids: set[int]) -> bool:
+        """Bring Caddy in line with the database for a batch of changed sites; True if anything changed"""
+        if self.uses_admin_api:
+            from app.core.database import AsyncSessionLocal
+            from app.services.caddy_admin_service import get_caddy_admin
+            async with AsyncSessionLocal() as db:
+                for site_id in sorted(site_ids):
+                    await get_caddy_admin().sync_site(db, site_id, exclude_domain_ids)
+            return True
         
-        # SSL configuration (Caddy handles automatically)
-        if domain.ssl_enabled:
-            lines.append("    tls {")
-            lines.append("        on_demand")
-            lines.append("    }")
+        # Regenerate entire Caddyfile
+        if await self._regenerate_caddyfile(exclude_domain_ids):
+            await self._reload_caddy()
+            return True
+        return False
+    
+    async def clear_caddyfile_sites(self) -> bool:
+        """Empty the generated sites section (the admin API backend serves the sites); True if Caddy reloaded"""
+        if not await asyncio.to_thread(self._write_caddyfile, []):
+            return False
+        await self._reload_caddy()
+        return True
+    
+    async def _regenerate_caddyfile(self, exclude_domain_ids: Iterable[int] = ()) -> bool:
+        """Regenerate the sites section from the database; True if the Caddyfile changed, CaddyConfigError if invalid"""
+        from app.core.database import AsyncSessionLocal
+        excluded = set(exclude_domain_ids)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    Domain.id, Domain.domain, Domain.ssl_enabled,
+                    Site.id, Site.worker_port, Site.site_type, Site.path, Site.config,
+                )
+                .join(Site, Domain.site_id == Site.id)
+                .where(Domain.is_active == True)  # noqa: E712
+            )
+            rows, bodies = [], {}
+            for domain_id, domain, ssl_enabled, site_id, port, site_type, path, config in result.all():
+                if domain_id in excluded:
+                    continue
+                if site_id not in bodies:
+                    static, cache = site_rules(site_id, site_type, path, config)
+                    bodies[site_id] = render_site_body(upstream_port(site_id, port), static, cache)
+                rows.append((domain, bool(ssl_enabled), bodies[site_id]))
+        return await asyncio.to_thread(self._write_caddyfile, rows)
+    
+    def _write_caddyfile(self, rows: list[tuple[str, bool, str]]) -> bool:
+        """Swap in the rendered Caddyfile if it differs from the current one and validates"""
+        try:
+            with open(self.caddy_config_file, "r") as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = ""
         
-        # Security headers
-        lines.append("    header {")
-        lines.append('        X-Content-Type-Options "nosniff"')
-        lines.append('        X-Frame-Options "DENY"')
-        lines.append('        X-XSS-Protection "1; mode=block"')
-        lines.append("    }")
+        begin, end = current.find(BEGIN_MARKER), current.find(END_MARKER)
+        if begin != -1 and end > begin:
+            before = current[:begin]
+            after = current[end + len(END_MARKER):].lstrip("\n")
+        else:
+            before, after = strip_legacy_blocks(current), ""
+        before = before.rstrip("\n") + "\n\n" if before.strip() else ""
+        content = set_global_options(f"{before}{BEGIN_MARKER}\n\n{render_sites(rows)}{END_MARKER}\n{after}")
         
-        lines.append("}")
-        lines.append("")
+        if content == current:
+            return False
         
-        return "\n".join(lines)
-    
-    async def _append_to_caddyfile(self, block: str):
-        """Append block to Caddyfile"""
-        with open(self.caddy_config_file, "a") as f:
-            f.write(block)
+        # Write, validate and rename so Caddy never reads a half-written or invalid file
+        tmp_path = f"{self.caddy_config_file}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        try:
+            self._validate(tmp_path)
+        except CaddyConfigError:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self.caddy_config_file)
+        logger.info("Regenerated Caddyfile with %s site domains", len(rows))
+        return True
     
-    async def _regenerate_caddyfile(self):
-        """Regenerate entire Caddyfile from database"""
-        # This would query all domains and regenerate the file
-        # For now, we'll use a simpler append approach
-        pass
+    def _validate(self, path: str):
+        """Raise CaddyConfigError with Caddy's output if the file at path is not a valid Caddyfile"""
+        try:
+            result = subprocess.run(
+                [self.caddy_bin, "validate", "--adapter", "caddyfile", "--config", path],
+                capture_output=True,
+                text=True,
+                timeout=60,
+            )
+        except FileNotFoundError:
+            logger.warning("%s not found; installing Caddyfile without validation", self.caddy_bin)
+            return
+        except subprocess.TimeoutExpired:
+            raise CaddyConfigError("caddy validate timed out; kept the current Caddyfile")
+        if result.returncode != 0:
+            raise CaddyConfigError(f"Generated Caddyfile is invalid; kept the current one: {result.stderr.strip()}")
     
     async def _reload_caddy(self):
         """Reload Caddy configuration"""
         try:
             # Use Caddy's API or signal to reload
-            subprocess.run(
-                [self.caddy_bin, "reload", "--config", self.caddy_config_file],
-                check=True,
-                timeout=10,
-            )
-        except subprocess.TimeoutExpired:
+            await _run(self.caddy_bin, "reload", "--config", self.caddy_config_file, check=True, timeout=10)
+        except asyncio.TimeoutError:
             # Fallback: restart Caddy service
-            subprocess.run(["systemctl", "reload", "caddy"], check=False)
+            await _run("systemctl", "reload", "caddy")
         except Exception:
             # If reload fails, try restart
-            subprocess.run(["systemctl", "restart", "caddy"], check=False)
+            await _run("systemctl", "restart", "caddy")
+
+
+async def _run(*cmd: str, check: bool = False, timeout: Optional[float] = None):
+    """Run a command without blocking the event loop"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+
+
+@asynccontextmanager
+async def reload_lock():
+    """Cross-process lock (flock on RUNTIME_DIR/caddy_reload.lock) held while Caddy's config is changed"""
+    os.makedirs(settings.RUNTIME_DIR, exist_ok=True)
+    fd = os.open(os.path.join(settings.RUNTIME_DIR, "caddy_reload.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Also releases the flock
+
+
+class _Batch:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.site_ids: set[int] = set()
+        self.exclude_domain_ids: set[int] = set()
+        self.opened = self.touched = time.monotonic()
+
+
+class ReloadCoordinator:
+    """Coalesces Caddy config changes so that a burst of domain changes costs one reload.
+
+    Changes submitted within CADDY_RELOAD_DEBOUNCE seconds of each other (and
+    at most CADDY_RELOAD_MAX_DELAY after the first) are applied together.
+    Only one batch is applied at a time, in this process through a lock and
+    across uvicorn workers through a flock on RUNTIME_DIR/caddy_reload.lock.
+    """
+    
+    def __init__(self, debounce: Optional[float] = None, max_delay: Optional[float] = None):
+        self.debounce = settings.CADDY_RELOAD_DEBOUNCE if debounce is None else debounce
+        self.max_delay = settings.CADDY_RELOAD_MAX_DELAY if max_delay is None else max_delay
+        self.reloads = 0
+        self._pending: Optional[_Batch] = None
+        self._applying = asyncio.Lock()
+    
+    async def submit(self, site_id: int, exclude_domain_ids: Iterable[int] = ()) -> bool:
+        """Queue a change of one site's domains and wait until it is live; True if Caddy changed"""
+        batch = self._pending
+        if batch is None:
+            batch = self._pending = _Batch(asyncio.get_running_loop().create_future())
+            asyncio.create_task(self._flush(batch))
+        batch.site_ids.add(site_id)
+        batch.exclude_domain_ids.update(exclude_domain_ids)
+        batch.touched = time.monotonic()
+        # Shielded: a cancelled caller must not cancel the batch for everyone else
+        return await asyncio.shield(batch.future)
+    
+    async def _flush(self, batch: _Batch):
+        while True:
+            due = min(batch.touched + self.debounce, batch.opened + self.max_delay)
+            delay = due - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        async with self._applying:
+            # Close the batch only now: changes made while the previous batch was applying join this one
+            if self._pending is batch:
+                self._pending = None
+            try:
+                changed = await self._apply(batch)
+            except Exception as e:
+                logger.exception("Applying Caddy changes for sites %s failed", sorted(batch.site_ids))
+                batch.future.set_exception(e)
+                batch.future.exception()  # Mark retrieved in case every caller went away
+            else:
+                batch.future.set_result(changed)
+    
+    async def _apply(self, batch: _Batch) -> bool:
+        async with reload_lock():
+            changed = await CaddyService().apply_changes(batch.site_ids, batch.exclude_domain_ids)
+        if changed:
+            self.reloads += 1
+        return changed
+
+
+_coordinator: Optional[ReloadCoordinator] = None
+
+
+def get_reload_coordinator() -> ReloadCoordinator:
+    """Process-wide reload coordinator"""
+    global _coordinator
+    if _coordinator is None:
+        _coordinator = ReloadCoordinator()
+    return _coordinator
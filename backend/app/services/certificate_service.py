@@ -0,0 +1,216 @@
+"""
+Inventory of the certificates Caddy obtained, read from its storage into ssl_certificates
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_
+from sqlalchemy.dialects.postgresql import insert
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509.oid import NameOID
+from app.models.domain import Domain
+from app.models.ssl import SSLCertificate
+from app.core.config import settings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CertificateInfo:
+    """Metadata of the leaf certificate in one storage file"""
+    domain: str
+    path: str
+    issuer: str
+    issued_at: datetime
+    expires_at: datetime
+    serial_number: str
+    fingerprint: str
+
+
+def storage_domain(directory: str) -> str:
+    """Domain of a storage directory; Caddy stores *.example.com as wildcard_.example.com"""
+    name = directory.lower()
+    return "*" + name[len("wildcard_"):] if name.startswith("wildcard_") else name
+
+
+def parse_certificate(path: str, domain: str) -> Optional[CertificateInfo]:
+    """Read the leaf (first) certificate of a PEM bundle"""
+    try:
+        with open(path, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+    except (OSError, ValueError) as e:
+        logger.warning("Could not parse certificate %s: %s", path, e)
+        return None
+    names = cert.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+    organizations = cert.issuer.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)
+    issuer = " ".join(str(a.value) for a in organizations[:1] + names[:1]) or cert.issuer.rfc4514_string()
+    return CertificateInfo(
+        domain=domain,
+        path=path,
+        issuer=issuer[:255],
+        issued_at=cert.not_valid_before_utc,
+        expires_at=cert.not_valid_after_utc,
+        serial_number=format(cert.serial_number, "x")[:64],
+        fingerprint=cert.fingerprint(hashes.SHA256()).hex(),
+    )
+
+
+def scan_storage(root: str) -> dict[str, dict[str, tuple[int, int]]]:
+    """Certificate files by domain: {domain: {path: (mtime_ns, size)}} over all issuer directories"""
+    found: dict[str, dict[str, tuple[int, int]]] = {}
+    try:
+        issuers = [e for e in os.scandir(root) if e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return found
+    for issuer in issuers:
+        try:
+            directories = [e for e in os.scandir(issuer.path) if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue
+        for directory in directories:
+            path = os.path.join(directory.path, directory.name + ".crt")
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.setdefault(storage_domain(directory.name), {})[path] = (st.st_mtime_ns, st.st_size)
+    return found
+
+
+class CertificateScanner:
+    """Keeps ssl_certificates in line with Caddy's certificate storage, incrementally.
+
+    A checkpoint (RUNTIME_DIR/cert_scan.json) records the mtime and size of
+    every certificate file seen, so only domains whose files were added,
+    renewed or removed are parsed again. When a domain has certificates from
+    several issuers (e.g. after switching CAs), the one expiring last wins.
+    """
+
+    def __init__(self, storage_dir: Optional[str] = None):
+        self.storage_dir = storage_dir or os.path.join(settings.CADDY_DATA_DIR, "certificates")
+        self.checkpoint_file = os.path.join(settings.RUNTIME_DIR, "cert_scan.json")
+
+    async def run(self, db: AsyncSession) -> dict:
+        """One scan; all changes are written in a single transaction"""
+        found = await asyncio.to_thread(scan_storage, self.storage_dir)
+        previous = self._load_checkpoint()
+        current = {path: list(state) for files in found.values() for path, state in files.items()}
+        changed = {
+            domain for domain, files in found.items()
+            if any(previous.get(path) != list(state) for path, state in files.items())
+        }
+        vanished = [path for path in previous if path not in current]
+        # A domain that lost one of several certificates falls back to the remaining ones
+        changed |= {storage_domain(os.path.basename(os.path.dirname(path))) for path in vanished} & set(found)
+
+        infos: list[Optional[CertificateInfo]] = []
+        jobs = [(path, domain) for domain in changed for path in found[domain]]
+        if jobs:
+            with ThreadPoolExecutor(max_workers=settings.CERT_SCAN_WORKERS) as pool:
+                infos = await asyncio.to_thread(lambda: list(pool.map(lambda job: parse_certificate(*job), jobs)))
+
+        latest: dict[str, CertificateInfo] = {}
+        for info in infos:
+            if info and (info.domain not in latest or info.expires_at > latest[info.domain].expires_at):
+                latest[info.domain] = info
+
+        now = datetime.now(timezone.utc)
+        if latest:
+            rows = [
+                {
+                    "domain": info.domain,
+                    "issuer": info.issuer,
+                    "issued_at": info.issued_at,
+                    "expires_at": info.expires_at,
+                    "serial_number": info.serial_number,
+                    "fingerprint": info.fingerprint,
+                    "storage_path": info.path,
+                    "is_valid": info.issued_at <= now < info.expires_at,
+                    "scanned_at": now,
+                    "caddy_managed": True,
+                    "auto_renew": True,
+                    "caddy_config": {},
+                }
+                for info in latest.values()
+            ]
+            table = SSLCertificate.__table__
+            for start in range(0, len(rows), 500):
+                stmt = insert(table).values(rows[start:start + 500])
+                await db.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["domain"],
+                        set_={
+                            column: stmt.excluded[column]
+                            for column in (
+                                "issuer", "issued_at", "expires_at", "serial_number", "fingerprint",
+                                "storage_path", "is_valid", "scanned_at",
+                            )
+                        } | {"updated_at": now},
+                    )
+                )
+        if vanished:
+            # Only rows still pointing at a removed file; a renewal by another issuer has replaced the others
+            await db.execute(
+                update(SSLCertificate)
+                .where(SSLCertificate.storage_path.in_(vanished))
+                .values(is_valid=False, scanned_at=now)
+            )
+        # Certificates that ran out since the last scan without Caddy renewing them
+        await db.execute(
+            update(SSLCertificate)
+            .where(SSLCertificate.is_valid.is_(True), SSLCertificate.expires_at <= now)
+            .values(is_valid=False)
+        )
+        # Domains added before their certificate existed
+        await db.execute(
+            update(Domain)
+            .where(and_(Domain.ssl_certificate_id.is_(None), Domain.domain == SSLCertificate.domain))
+            .values(ssl_certificate_id=SSLCertificate.id)
+        )
+        await db.commit()
+        self._save_checkpoint(current)
+
+        report = {"files": len(current), "parsed": len(jobs), "updated": len(latest), "vanished": len(vanished)}
+        if latest or vanished:
+            logger.info("Certificate scan: %s", report)
+        return report
+
+    def _load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, files: dict):
+        os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(files, f, separators=(",", ":"))
+        os.replace(tmp_path, self.checkpoint_file)
+
+
+async def expiring_certificates(db: AsyncSession, days: int, limit: int = 100) -> list[SSLCertificate]:
+    """Certificates expiring within days (or expired already), soonest first; a range scan of the expires_at index"""
+    cutoff = datetime.now(timezone.utc) + timedelta(days=days)
+    result = await db.execute(
+        select(SSLCertificate)
+        .where(SSLCertificate.expires_at < cutoff)
+        .order_by(SSLCertificate.expires_at)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def scan_certificates():
+    """Background job: incremental certificate inventory scan"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await CertificateScanner().run(db)
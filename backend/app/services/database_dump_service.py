@@ -0,0 +1,563 @@
+"""
+Parallel per-table MySQL dump and load from one consistent snapshot, for backups, clones and migrations
+"""
+from app.core.config import settings
+from app.services.mysql_admin_service import connect, quote_identifier
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+import asyncio
+import gzip
+import json
+import logging
+import math
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+FETCH_ROWS = 1000
+
+INTEGER_TYPES = {"tinyint", "smallint", "mediumint", "int", "bigint"}
+# Dumped as hex literals: arbitrary bytes, or (spatial types) MySQL's internal format
+BINARY_TYPES = {
+    "binary", "varbinary", "tinyblob", "blob", "mediumblob", "longblob", "bit",
+    "geometry", "point", "linestring", "polygon", "multipoint", "multilinestring", "multipolygon",
+    "geometrycollection", "geomcollection",
+}
+GENERATED_EXTRAS = {"VIRTUAL GENERATED", "STORED GENERATED", "VIRTUAL", "PERSISTENT", "STORED"}
+
+# Loaders keep zeros in AUTO_INCREMENT columns, accept zero dates and skip checks a consistent dump passes anyway
+LOAD_SESSION = (
+    "SET SESSION sql_mode = 'NO_AUTO_VALUE_ON_ZERO', foreign_key_checks = 0, unique_checks = 0, "
+    "time_zone = '+00:00'"
+)
+
+_KEY_RE = re.compile(r"^(?:UNIQUE |FULLTEXT |SPATIAL )?KEY ")
+_FOREIGN_KEY_RE = re.compile(r"^CONSTRAINT .* FOREIGN KEY ", re.S)
+_DEFINER_RE = re.compile(r"DEFINER=`(?:[^`]|``)*`@`(?:[^`]|``)*`")
+
+
+class DumpError(Exception):
+    """A dump or load failed"""
+    pass
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def value_expression(column: str, data_type: str) -> str:
+    """SQL that renders one column as a literal on one line, so the server does the escaping"""
+    quoted = _quote(column)
+    if data_type in BINARY_TYPES:
+        return f"IF({quoted} IS NULL, 'NULL', CONCAT('X''', HEX({quoted}), ''''))"
+    # QUOTE() gives NULL or an escaped string literal; newlines are escaped too, one statement per line
+    return rf"REPLACE(REPLACE(QUOTE({quoted}), '\n', '\\n'), '\r', '\\r')"
+
+
+def split_create_table(create: str) -> tuple[str, list[str], list[str]]:
+    """CREATE TABLE without secondary indexes and foreign keys, plus those definitions (added after the load)"""
+    lines = create.split("\n")
+    end = max(i for i, line in enumerate(lines) if line.startswith(")"))
+    definitions: list[str] = []
+    # SHOW CREATE TABLE writes one definition per line, indented by two spaces
+    for line in lines[1:end]:
+        if line.startswith("  ") or not definitions:
+            definitions.append(line.strip())
+        else:
+            definitions[-1] += "\n" + line
+    kept, keys, foreign_keys = [], [], []
+    for definition in definitions:
+        definition = definition[:-1] if definition.endswith(",") else definition
+        if _KEY_RE.match(definition):
+            keys.append(definition)
+        elif _FOREIGN_KEY_RE.match(definition):
+            foreign_keys.append(definition)
+        else:
+            kept.append(definition)
+    body = ",\n".join("  " + definition for definition in kept)
+    return "\n".join([lines[0], body] + lines[end:]), keys, foreign_keys
+
+
+@dataclass
+class Chunk:
+    """One file of a table's rows: the whole table or a primary key range"""
+    file: str
+    where: str = ""
+    estimate: int = 0
+    rows: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class TablePlan:
+    name: str
+    columns: list[str]
+    expressions: list[str]
+    rows_estimate: int = 0
+    chunk_key: Optional[str] = None  # Single-column integer primary key, if any
+    defer_keys: bool = True
+    create: str = ""
+    keys: list[str] = field(default_factory=list)
+    foreign_keys: list[str] = field(default_factory=list)
+    chunks: list[Chunk] = field(default_factory=list)
+
+
+class DumpEngine:
+    """Dumps a database as compressed per-table chunks and loads such a dump, on parallel connections.
+
+    A dump first takes a brief read lock on the database's tables
+    (FLUSH TABLES ... WITH READ LOCK), starts a consistent snapshot
+    transaction on every worker connection and releases the lock, so all
+    workers read the same point in time (InnoDB). Tables with an integer
+    primary key are split into key ranges of about DB_DUMP_CHUNK_ROWS rows;
+    each chunk is a gzip file of multi-row INSERT statements, one per line.
+
+    A load creates the tables without secondary indexes and foreign keys,
+    loads chunks in parallel (largest first), then builds each table's
+    indexes in one ALTER TABLE and adds foreign keys, views and triggers.
+    connect is called for every connection, so a dump can be loaded on
+    another server (migrations) or into another database (clones).
+    """
+
+    def __init__(self, threads: Optional[int] = None, connect: Callable[..., Any] = connect):
+        self.threads = max(1, threads or settings.DB_DUMP_THREADS)
+        self.connect = connect
+        self._stop = threading.Event()
+
+    # Dump
+
+    def dump(self, database: str, directory: str) -> dict:
+        """Dump database into directory (chunk files plus manifest.json); returns a report"""
+        schema = quote_identifier(database)
+        started = time.monotonic()
+        self._stop.clear()
+        os.makedirs(directory, exist_ok=True)
+        control = self.connect(charset="utf8mb4", autocommit=True)
+        connections: list = []
+        try:
+            tables, views = self._inspect(control, database)
+            connections = self._snapshot(control, schema, tables)
+            reader = connections[0].cursor(buffered=True)
+            for index, table in enumerate(tables):
+                self._plan(reader, schema, table, index)
+            views = [{"name": name, "create": self._show_create(reader, "VIEW", schema, name)} for name in views]
+            triggers = self._triggers(reader, database, schema)
+            reader.close()
+
+            chunks = sorted(
+                ((table, chunk) for table in tables for chunk in table.chunks),
+                key=lambda job: job[1].estimate,
+                reverse=True,
+            )
+            self._parallel(connections, [
+                lambda connection, job=job: self._dump_chunk(connection, schema, job[0], job[1], directory)
+                for job in chunks
+            ])
+        except Error as e:
+            raise DumpError(f"Dump of {database} failed: {e}")
+        finally:
+            for connection in connections:
+                self._close(connection)
+            self._close(control)
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "database": database,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "threads": len(connections),
+            "tables": [
+                {
+                    "name": table.name,
+                    "create": table.create,
+                    "keys": table.keys,
+                    "foreign_keys": table.foreign_keys,
+                    "chunks": [{"file": c.file, "rows": c.rows, "bytes": c.bytes} for c in table.chunks],
+                }
+                for table in tables
+            ],
+            "views": views,
+            "triggers": triggers,
+        }
+        tmp_path = os.path.join(directory, MANIFEST + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST))
+
+        report = {
+            "tables": len(tables),
+            "chunks": len(chunks),
+            "rows": sum(c.rows for _, c in chunks),
+            "bytes": sum(c.bytes for _, c in chunks),
+            "threads": len(connections),
+            "seconds": round(time.monotonic() - started, 2),
+        }
+        logger.info("Dumped %s: %s", database, report)
+        return report
+
+    def _inspect(self, connection, database: str) -> tuple[list[TablePlan], list[str]]:
+        """Base tables with their dumpable columns, and view names"""
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT TABLE_NAME, TABLE_TYPE, TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME",
+            (database,),
+        )
+        listed = cursor.fetchall()
+        cursor.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, EXTRA, COLUMN_KEY FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, ORDINAL_POSITION",
+            (database,),
+        )
+        columns: dict[str, list[tuple]] = {}
+        for table, column, data_type, extra, key in cursor.fetchall():
+            columns.setdefault(table, []).append((column, (data_type or "").lower(), extra or "", key or ""))
+        cursor.close()
+
+        tables, views = [], []
+        for name, table_type, rows in listed:
+            if table_type == "VIEW":
+                views.append(name)
+                continue
+            if table_type != "BASE TABLE":
+                continue
+            stored = [c for c in columns.get(name, []) if c[2].upper() not in GENERATED_EXTRAS]
+            primary = [c for c in columns.get(name, []) if c[3] == "PRI"]
+            tables.append(TablePlan(
+                name=name,
+                columns=[c[0] for c in stored],
+                expressions=[value_expression(c[0], c[1]) for c in stored],
+                rows_estimate=int(rows or 0),
+                chunk_key=primary[0][0] if len(primary) == 1 and primary[0][1] in INTEGER_TYPES else None,
+                # An AUTO_INCREMENT column must be indexed; if only a secondary key covers it, keep the keys
+                defer_keys=not any("auto_increment" in c[2] and c[3] != "PRI" for c in columns.get(name, [])),
+            ))
+        return tables, views
+
+    def _snapshot(self, control, schema: str, tables: list[TablePlan]) -> list:
+        """Worker connections inside transactions that all see the same committed state"""
+        threads = self.threads
+        cursor = control.cursor()
+        locked = False
+        if threads > 1 and tables:
+            try:
+                cursor.execute("SET SESSION lock_wait_timeout = %s", (settings.DB_DUMP_LOCK_WAIT_TIMEOUT,))
+                names = ", ".join(f"{schema}.{_quote(table.name)}" for table in tables)
+                cursor.execute(f"FLUSH TABLES {names} WITH READ LOCK")
+                locked = True
+            except Error as e:
+                # Without the lock, snapshots started at different times could disagree: use a single one
+                logger.warning("Could not lock %s to share a snapshot (%s); dumping on one connection", schema, e)
+                threads = 1
+        connections = []
+        try:
+            for _ in range(threads):
+                connection = self.connect(charset="utf8mb4")
+                connections.append(connection)
+                worker = connection.cursor()
+                worker.execute("SET SESSION sql_mode = '', time_zone = '+00:00'")
+                worker.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                worker.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+                worker.close()
+        except Exception:
+            for connection in connections:
+                self._close(connection)
+            raise
+        finally:
+            if locked:
+                cursor.execute("UNLOCK TABLES")
+            cursor.close()
+        return connections
+
+    def _plan(self, cursor, schema: str, table: TablePlan, index: int):
+        """Table definition and chunk ranges, read inside the snapshot"""
+        create = self._show_create(cursor, "TABLE", schema, table.name)
+        if table.defer_keys:
+            table.create, table.keys, table.foreign_keys = split_create_table(create)
+        else:
+            table.create = create
+        ranges = [""]
+        if table.chunk_key and table.rows_estimate > settings.DB_DUMP_CHUNK_ROWS:
+            key = _quote(table.chunk_key)
+            cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {schema}.{_quote(table.name)}")
+            low, high = cursor.fetchone()
+            if low is not None:
+                count = math.ceil(table.rows_estimate / settings.DB_DUMP_CHUNK_ROWS)
+                step = max(1, math.ceil((int(high) - int(low) + 1) / count))
+                bounds = list(range(int(low) + step, int(high) + 1, step))
+                if bounds:
+                    ranges = (
+                        [f"{key} < {bounds[0]}"]
+                        + [f"{key} >= {lo} AND {key} < {hi}" for lo, hi in zip(bounds, bounds[1:])]
+                        + [f"{key} >= {bounds[-1]}"]
+                    )
+        estimate = table.rows_estimate // len(ranges)
+        table.chunks = [
+            Chunk(file=f"{index:04d}.{n:05d}.sql.gz", where=where, estimate=estimate)
+            for n, where in enumerate(ranges)
+        ]
+
+    def _show_create(self, cursor, kind: str, schema: str, name: str) -> str:
+        cursor.execute(f"SHOW CREATE {kind} {schema}.{_quote(name)}")
+        value = cursor.fetchone()[1]
+        return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+    def _triggers(self, cursor, database: str, schema: str) -> list[dict]:
+        cursor.execute(
+            "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = %s "
+            "ORDER BY EVENT_OBJECT_TABLE, ACTION_ORDER",
+            (database,),
+        )
+        triggers = []
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"SHOW CREATE TRIGGER {schema}.{_quote(name)}")
+            row = cursor.fetchone()
+            triggers.append({"name": name, "sql_mode": row[1], "create": row[2]})
+        return triggers
+
+    def _dump_chunk(self, connection, schema: str, table: TablePlan, chunk: Chunk, directory: str):
+        """Stream one chunk's rows, already rendered as literals by the server, into its gzip file"""
+        row = "CONCAT('(', CONCAT_WS(',', " + ", ".join(table.expressions) + "), ')')"
+        sql = f"SELECT {row} FROM {schema}.{_quote(table.name)}"
+        if chunk.where:
+            sql += f" WHERE {chunk.where}"
+        prefix = f"INSERT INTO {_quote(table.name)} ({', '.join(_quote(c) for c in table.columns)}) VALUES ".encode()
+        limit = settings.DB_DUMP_STATEMENT_BYTES
+        path = os.path.join(directory, chunk.file)
+        cursor = connection.cursor(raw=True)
+        try:
+            cursor.execute(sql)
+            with gzip.open(path, "wb", compresslevel=settings.DB_DUMP_COMPRESS_LEVEL) as out:
+                batch: list = []
+                size = 0
+                while True:
+                    rows = cursor.fetchmany(FETCH_ROWS)
+                    if not rows:
+                        break
+                    if self._stop.is_set():
+                        raise DumpError("Cancelled")
+                    chunk.rows += len(rows)
+                    for (values,) in rows:
+                        batch.append(values)
+                        size += len(values) + 1
+                        if size >= limit:
+                            out.write(prefix + b",".join(batch) + b";\n")
+                            batch.clear()
+                            size = 0
+                if batch:
+                    out.write(prefix + b",".join(batch) + b";\n")
+        finally:
+            cursor.close()
+        chunk.bytes = os.path.getsize(path)
+
+    # Load
+
+    def load(self, directory: str, database: str, definer: Optional[str] = None) -> dict:
+        """Load a dump into database (which must exist), replacing the dumped tables and views.
+
+        definer (e.g. "`user`@`localhost`") replaces the DEFINER of views and
+        triggers, for loading into a database owned by another user.
+        """
+        manifest = read_manifest(directory)
+        quote_identifier(database)
+        started = time.monotonic()
+        self._stop.clear()
+        source, tables = manifest["database"], manifest["tables"]
+        connections = []
+        try:
+            for _ in range(self.threads):
+                connection = self.connect(charset="utf8mb4", database=database, autocommit=True)
+                connections.append(connection)
+                cursor = connection.cursor()
+                cursor.execute(LOAD_SESSION)
+                cursor.close()
+
+            cursor = connections[0].cursor()
+            for view in manifest["views"]:
+                cursor.execute(f"DROP VIEW IF EXISTS {_quote(view['name'])}")
+            for table in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {_quote(table['name'])}")
+                cursor.execute(table["create"])
+            cursor.close()
+
+            chunks = sorted(
+                ((table["name"], chunk) for table in tables for chunk in table["chunks"]),
+                key=lambda job: job[1]["bytes"],
+                reverse=True,
+            )
+            self._parallel(connections, [
+                lambda connection, file=chunk["file"]: self._load_chunk(connection, os.path.join(directory, file))
+                for _, chunk in chunks
+            ])
+            # Each table's secondary indexes are sorted and built once, in parallel across tables
+            by_size = sorted(tables, key=lambda t: sum(c["bytes"] for c in t["chunks"]), reverse=True)
+            self._parallel(connections, [
+                lambda connection, table=table: self._add_keys(connection, table)
+                for table in by_size if table["keys"]
+            ])
+            self._parallel(connections, [
+                lambda connection, table=table: self._execute(
+                    connection,
+                    f"ALTER TABLE {_quote(table['name'])} " + ", ".join(f"ADD {fk}" for fk in table["foreign_keys"]),
+                )
+                for table in tables if table["foreign_keys"]
+            ])
+            self._create_views(connections[0], manifest["views"], source, database, definer)
+            self._create_triggers(connections[0], manifest["triggers"], definer)
+        except Error as e:
+            raise DumpError(f"Load into {database} failed: {e}")
+        finally:
+            for connection in connections:
+                self._close(connection)
+
+        report = {
+            "tables": len(tables),
+            "chunks": len(chunks),
+            "rows": sum(chunk["rows"] for _, chunk in chunks),
+            "threads": len(connections),
+            "seconds": round(time.monotonic() - started, 2),
+        }
+        logger.info("Loaded %s into %s: %s", source, database, report)
+        return report
+
+    def _load_chunk(self, connection, path: str):
+        cursor = connection.cursor()
+        try:
+            with gzip.open(path, "rb") as f:
+                for statement in f:
+                    if self._stop.is_set():
+                        raise DumpError("Cancelled")
+                    cursor.execute(statement.rstrip(b"\n"))
+        finally:
+            cursor.close()
+
+    def _add_keys(self, connection, table: dict):
+        name = _quote(table["name"])
+        # InnoDB builds one FULLTEXT index per statement
+        regular = [key for key in table["keys"] if not key.startswith("FULLTEXT ")]
+        fulltext = [key for key in table["keys"] if key.startswith("FULLTEXT ")]
+        if regular:
+            self._execute(connection, f"ALTER TABLE {name} " + ", ".join(f"ADD {key}" for key in regular))
+        for key in fulltext:
+            self._execute(connection, f"ALTER TABLE {name} ADD {key}")
+
+    def _create_views(self, connection, views: list[dict], source: str, database: str, definer: Optional[str]):
+        """Views may select from each other: retry the failed ones while each pass creates at least one"""
+        pending = []
+        for view in views:
+            create = view["create"]
+            if definer:
+                create = _DEFINER_RE.sub(f"DEFINER={definer}", create)
+            if source != database:
+                create = create.replace(f"{_quote(source)}.", f"{_quote(database)}.")
+            pending.append(create)
+        while pending:
+            failed, error = [], None
+            for create in pending:
+                try:
+                    self._execute(connection, create)
+                except Error as e:
+                    failed.append(create)
+                    error = e
+            if len(failed) == len(pending):
+                raise error
+            pending = failed
+
+    def _create_triggers(self, connection, triggers: list[dict], definer: Optional[str]):
+        for trigger in triggers:
+            create = _DEFINER_RE.sub(f"DEFINER={definer}", trigger["create"]) if definer else trigger["create"]
+            # Triggers keep the sql_mode they were created with
+            self._execute(connection, "SET SESSION sql_mode = %s", (trigger["sql_mode"],))
+            self._execute(connection, create)
+        if triggers:
+            self._execute(connection, LOAD_SESSION)
+
+    # Shared
+
+    def _parallel(self, connections: list, tasks: list[Callable[[Any], Any]]):
+        """Run fn(connection) tasks with each connection used by one task at a time; the first error stops the rest"""
+        if not tasks:
+            return
+        idle: queue.SimpleQueue = queue.SimpleQueue()
+        for connection in connections:
+            idle.put(connection)
+
+        def run(fn):
+            connection = idle.get()
+            try:
+                return fn(connection)
+            finally:
+                idle.put(connection)
+
+        with ThreadPoolExecutor(max_workers=len(connections), thread_name_prefix="db-dump") as pool:
+            futures = [pool.submit(run, task) for task in tasks]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [f for f in done if f.exception() is not None]
+            if failed:
+                self._stop.set()
+                for future in pending:
+                    future.cancel()
+        if failed:
+            raise failed[0].exception()
+
+    def _execute(self, connection, sql: str, params: tuple = ()):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params or None)
+        finally:
+            cursor.close()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def read_manifest(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise DumpError(f"No readable dump in {directory}: {e}")
+    if manifest.get("version") != FORMAT_VERSION:
+        raise DumpError(f"Unsupported dump format version: {manifest.get('version')}")
+    return manifest
+
+
+def is_dump(directory: str) -> bool:
+    return os.path.isfile(os.path.join(directory, MANIFEST))
+
+
+async def dump_database(database: str, directory: str, threads: Optional[int] = None) -> dict:
+    """Parallel dump of a local database, off the event loop"""
+    return await asyncio.to_thread(DumpEngine(threads).dump, database, directory)
+
+
+async def load_database(
+    directory: str, database: str, definer: Optional[str] = None, threads: Optional[int] = None
+) -> dict:
+    """Parallel load of a dump into a local database, off the event loop"""
+    return await asyncio.to_thread(DumpEngine(threads).load, directory, database, definer)
+
+
+async def clone_database(source: str, target: str, definer: Optional[str] = None, threads: Optional[int] = None) -> dict:
+    """Copy source into the existing database target through a temporary dump"""
+    os.makedirs(settings.BACKUPS_DIR, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=f"clone_{source}_", dir=settings.BACKUPS_DIR)
+    try:
+        await dump_database(source, directory, threads)
+        return await load_database(directory, target, definer, threads)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, directory, True)
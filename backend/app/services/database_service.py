@@ -7,8 +7,7 @@ from app.models.database import Database, DatabaseType
 from app.schemas.database import DatabaseCreate, DatabaseUpdate
 from app.core.config import settings
 from app.core.security import encrypt_secret, decrypt_secret
-import mysql.connector
-from mysql.connector import Error
+from app.services.mysql_admin_service import get_mysql_admin, MySQLAdminError
 import secrets
 import string
 from typing import Optional
@@ -112,92 +111,24 @@ class DatabaseService:
     
     async def _create_mysql_database(self, db_name: str, username: str, password: str):
         """Create database and user in MySQL/MariaDB"""
-        connection = None
         try:
-            # Connect as root
-            connection = mysql.connector.connect(
-                host=settings.MYSQL_HOST,
-                port=settings.MYSQL_PORT,
-                user=settings.MYSQL_ROOT_USER,
-                password=settings.MYSQL_ROOT_PASSWORD,
-                unix_socket=settings.MYSQL_SOCKET,
-            )
-            
-            cursor = connection.cursor()
-            
-            # Create database
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db_name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            
-            # Create user
-            cursor.execute(f"CREATE USER IF NOT EXISTS '{username}'@'localhost' IDENTIFIED BY '{password}'")
-            
-            # Grant privileges
-            cursor.execute(f"GRANT ALL PRIVILEGES ON `{db_name}`.* TO '{username}'@'localhost'")
-            cursor.execute("FLUSH PRIVILEGES")
-            
-            connection.commit()
-            
-        except Error as e:
+            await get_mysql_admin().create_database(db_name, username, password)
+        except MySQLAdminError as e:
             raise Exception(f"Failed to create MySQL database: {e}")
-        finally:
-            if connection and connection.is_connected():
-                cursor.close()
-                connection.close()
     
     async def _drop_mysql_database(self, db_name: str, username: str, password: str):
         """Drop database and user from MySQL/MariaDB"""
-        connection = None
         try:
-            connection = mysql.connector.connect(
-                host=settings.MYSQL_HOST,
-                port=settings.MYSQL_PORT,
-                user=settings.MYSQL_ROOT_USER,
-                password=settings.MYSQL_ROOT_PASSWORD,
-                unix_socket=settings.MYSQL_SOCKET,
-            )
-            
-            cursor = connection.cursor()
-            
-            # Drop database
-            cursor.execute(f"DROP DATABASE IF EXISTS `{db_name}`")
-            
-            # Drop user
-            cursor.execute(f"DROP USER IF EXISTS '{username}'@'localhost'")
-            cursor.execute("FLUSH PRIVILEGES")
-            
-            connection.commit()
-            
-        except Error as e:
+            await get_mysql_admin().drop_database(db_name, username)
+        except MySQLAdminError as e:
             raise Exception(f"Failed to drop MySQL database: {e}")
-        finally:
-            if connection and connection.is_connected():
-                cursor.close()
-                connection.close()
     
     async def _change_mysql_password(self, username: str, old_password: str, new_password: str):
         """Change MySQL user password"""
-        connection = None
         try:
-            connection = mysql.connector.connect(
-                host=settings.MYSQL_HOST,
-                port=settings.MYSQL_PORT,
-                user=settings.MYSQL_ROOT_USER,
-                password=settings.MYSQL_ROOT_PASSWORD,
-                unix_socket=settings.MYSQL_SOCKET,
-            )
-            
-            cursor = connection.cursor()
-            cursor.execute(f"ALTER USER '{username}'@'localhost' IDENTIFIED BY '{new_password}'")
-            cursor.execute("FLUSH PRIVILEGES")
-            
-            connection.commit()
-            
-        except Error as e:
+            await get_mysql_admin().change_password(username, new_password)
+        except MySQLAdminError as e:
             raise Exception(f"Failed to change MySQL password: {e}")
-        finally:
-            if connection and connection.is_connected():
-                cursor.close()
-                connection.close()
     
     def _generate_password(self, length: int = 32) -> str:
         """Generate secure random password"""
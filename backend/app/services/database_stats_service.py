@@ -0,0 +1,221 @@
+"""
+Size and table statistics of panel-managed MySQL databases, from information_schema in one query
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func
+from app.models.database import Database, DatabaseSizeSample
+from app.services.mysql_admin_service import get_mysql_admin
+from app.core.config import settings
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+LARGEST_TABLES = 20  # Tables kept per database in a snapshot
+
+# Base tables only: views have no storage. One row per table of every requested schema.
+TABLES_QUERY = (
+    "SELECT TABLE_SCHEMA, TABLE_NAME, ENGINE, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH, DATA_FREE "
+    "FROM information_schema.TABLES WHERE TABLE_TYPE = 'BASE TABLE' AND TABLE_SCHEMA IN ({placeholders})"
+)
+
+
+@dataclass
+class TableStats:
+    name: str
+    engine: Optional[str]
+    rows: int  # InnoDB's estimate
+    data_bytes: int
+    index_bytes: int
+    free_bytes: int
+
+    @property
+    def total_bytes(self) -> int:
+        return self.data_bytes + self.index_bytes
+
+
+@dataclass
+class SchemaStats:
+    """Totals of one database plus its largest tables"""
+    name: str
+    tables: int = 0
+    rows: int = 0
+    data_bytes: int = 0
+    index_bytes: int = 0
+    free_bytes: int = 0
+    table_stats: list[TableStats] = field(default_factory=list, repr=False)
+
+    @property
+    def total_bytes(self) -> int:
+        return self.data_bytes + self.index_bytes
+
+    @property
+    def fragmentation(self) -> float:
+        """Share of allocated space that is free (reclaimable with OPTIMIZE TABLE)"""
+        allocated = self.total_bytes + self.free_bytes
+        return round(self.free_bytes / allocated, 4) if allocated else 0.0
+
+    def add(self, table: TableStats):
+        self.tables += 1
+        self.rows += table.rows
+        self.data_bytes += table.data_bytes
+        self.index_bytes += table.index_bytes
+        self.free_bytes += table.free_bytes
+        self.table_stats.append(table)
+
+    def to_dict(self) -> dict:
+        largest = heapq.nlargest(LARGEST_TABLES, self.table_stats, key=lambda t: (t.total_bytes, t.name))
+        return {
+            "name": self.name,
+            "tables": self.tables,
+            "rows": self.rows,
+            "data_bytes": self.data_bytes,
+            "index_bytes": self.index_bytes,
+            "free_bytes": self.free_bytes,
+            "total_bytes": self.total_bytes,
+            "fragmentation": self.fragmentation,
+            "largest_tables": [asdict(t) | {"total_bytes": t.total_bytes} for t in largest],
+        }
+
+
+async def query_schema_stats(names: list[str]) -> dict[str, SchemaStats]:
+    """Stats of the given schemas with a single information_schema query"""
+    stats = {name: SchemaStats(name) for name in names}
+    if not names:
+        return stats
+    rows = await get_mysql_admin().fetch_all(
+        TABLES_QUERY.format(placeholders=", ".join(["%s"] * len(names))),
+        names,
+        timeout=settings.DB_STATS_QUERY_TIMEOUT,
+    )
+    for schema, table, engine, table_rows, data, index, free in rows:
+        schema = schema.decode() if isinstance(schema, (bytes, bytearray)) else schema
+        if schema in stats:
+            stats[schema].add(TableStats(
+                name=table.decode() if isinstance(table, (bytes, bytearray)) else table,
+                engine=engine.decode() if isinstance(engine, (bytes, bytearray)) else engine,
+                rows=int(table_rows or 0),
+                data_bytes=int(data or 0),
+                index_bytes=int(index or 0),
+                free_bytes=int(free or 0),
+            ))
+    return stats
+
+
+class DatabaseStatsCollector:
+    """Snapshot of all managed databases, refreshed at most every DB_STATS_CACHE_TTL seconds.
+
+    Concurrent callers during a refresh wait for the same query instead of
+    issuing their own, so information_schema is read once per TTL however
+    many requests come in.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.DB_STATS_CACHE_TTL if ttl is None else ttl
+        self.collected_at: Optional[datetime] = None
+        self._snapshot: dict[int, dict] = {}  # database_id -> stats dict (plus database_id/site_id)
+        self._fetched = 0.0
+        self._lock = asyncio.Lock()
+
+    async def snapshot(self, db: AsyncSession, refresh: bool = False) -> dict[int, dict]:
+        if not refresh and self._snapshot and time.monotonic() - self._fetched < self.ttl:
+            return self._snapshot
+        async with self._lock:
+            if not refresh and self._snapshot and time.monotonic() - self._fetched < self.ttl:
+                return self._snapshot
+            result = await db.execute(select(Database.id, Database.name, Database.site_id))
+            databases = result.all()
+            stats = await query_schema_stats([name for _, name, _ in databases])
+            self._snapshot = {
+                database_id: stats[name].to_dict() | {"database_id": database_id, "site_id": site_id}
+                for database_id, name, site_id in databases
+            }
+            self._fetched = time.monotonic()
+            self.collected_at = datetime.now(timezone.utc)
+        return self._snapshot
+
+    async def site_stats(self, db: AsyncSession, site_id: int) -> list[dict]:
+        snapshot = await self.snapshot(db)
+        return sorted((s for s in snapshot.values() if s["site_id"] == site_id), key=lambda s: s["name"])
+
+    async def largest(self, db: AsyncSession, limit: int) -> list[dict]:
+        snapshot = await self.snapshot(db)
+        return heapq.nlargest(limit, snapshot.values(), key=lambda s: s["total_bytes"])
+
+    async def record_history(self, db: AsyncSession) -> int:
+        """Store one size sample per database (fresh numbers) and prune old samples"""
+        snapshot = await self.snapshot(db, refresh=True)
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "database_id": database_id,
+                "sampled_at": now,
+                "tables": s["tables"],
+                "rows": s["rows"],
+                "data_bytes": s["data_bytes"],
+                "index_bytes": s["index_bytes"],
+                "free_bytes": s["free_bytes"],
+            }
+            for database_id, s in snapshot.items()
+        ]
+        for start in range(0, len(rows), 1000):
+            await db.execute(DatabaseSizeSample.__table__.insert(), rows[start:start + 1000])
+        cutoff = now - timedelta(days=settings.DB_STATS_RETENTION_DAYS)
+        await db.execute(delete(DatabaseSizeSample).where(DatabaseSizeSample.sampled_at < cutoff))
+        await db.commit()
+        return len(rows)
+
+
+async def size_history(db: AsyncSession, database_ids: list[int], days: int) -> dict[int, list[dict]]:
+    """Daily size points (last sample of each day) of databases over the last days"""
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    day = func.date_trunc("day", DatabaseSizeSample.sampled_at)
+    latest = (
+        select(DatabaseSizeSample.database_id, func.max(DatabaseSizeSample.sampled_at).label("sampled_at"))
+        .where(DatabaseSizeSample.database_id.in_(database_ids), DatabaseSizeSample.sampled_at >= since)
+        .group_by(DatabaseSizeSample.database_id, day)
+        .subquery()
+    )
+    result = await db.execute(
+        select(DatabaseSizeSample)
+        .join(
+            latest,
+            (DatabaseSizeSample.database_id == latest.c.database_id)
+            & (DatabaseSizeSample.sampled_at == latest.c.sampled_at),
+        )
+        .order_by(DatabaseSizeSample.sampled_at)
+    )
+    history: dict[int, list[dict]] = {database_id: [] for database_id in database_ids}
+    for sample in result.scalars().all():
+        history[sample.database_id].append({
+            "sampled_at": sample.sampled_at,
+            "rows": sample.rows,
+            "data_bytes": sample.data_bytes,
+            "index_bytes": sample.index_bytes,
+            "total_bytes": sample.data_bytes + sample.index_bytes,
+        })
+    return history
+
+
+_collector: Optional[DatabaseStatsCollector] = None
+
+
+def get_database_stats_collector() -> DatabaseStatsCollector:
+    """Process-wide stats collector (and cache)"""
+    global _collector
+    if _collector is None:
+        _collector = DatabaseStatsCollector()
+    return _collector
+
+
+async def record_database_sizes():
+    """Background job: daily growth history of every managed database"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        count = await get_database_stats_collector().record_history(db)
+        logger.debug("Recorded sizes of %s databases", count)
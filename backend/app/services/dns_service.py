@@ -0,0 +1,348 @@
+"""
+DNS pre-flight checks: does a domain point at this server before Caddy tries to get a certificate for it
+"""
+from app.core.config import settings
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import ipaddress
+import logging
+import random
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+TYPE_A, TYPE_CNAME, TYPE_AAAA = 1, 5, 28
+CLASS_IN = 1
+RCODE_NOERROR, RCODE_NXDOMAIN = 0, 3
+
+STATUS_OK = "ok"  # Points here, and only here
+STATUS_PARTIAL = "partial"  # Points here, plus addresses elsewhere (e.g. a stale AAAA record)
+STATUS_MISMATCH = "mismatch"  # Resolves, but not to this server
+STATUS_NXDOMAIN = "nxdomain"
+STATUS_NODATA = "nodata"  # Exists without A/AAAA records
+STATUS_UNVERIFIED = "unverified"  # Resolves; no expected targets configured to compare with
+STATUS_ERROR = "error"  # Resolver timeout or failure; says nothing about the domain
+
+# Certificates for these cannot be issued; the TLS ask refuses them
+BLOCKING_STATUSES = {STATUS_MISMATCH, STATUS_NXDOMAIN, STATUS_NODATA}
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR = struct.Struct("!HHIH")
+
+
+class DNSError(Exception):
+    """The resolver did not give a usable answer"""
+    pass
+
+
+def tls_allowed(dns_status: Optional[str]) -> bool:
+    """Whether the TLS ask may approve a domain with this DNS status (unchecked domains may)"""
+    return not settings.DNS_PREFLIGHT_ENABLED or dns_status not in BLOCKING_STATUSES
+
+
+def encode_query(query_id: int, name: str, qtype: int) -> bytes:
+    """A recursive query for one name and type"""
+    labels = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.rstrip(".").split("."))
+    return _HEADER.pack(query_id, 0x0100, 1, 0, 0, 0) + labels + b"\x00" + struct.pack("!HH", qtype, CLASS_IN)
+
+
+def _read_name(data: bytes, offset: int) -> tuple[str, int]:
+    """A possibly compressed name at offset; returns it and the offset after it"""
+    labels, end, jumps = [], None, 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            jumps += 1
+            if jumps > 32:
+                raise DNSError("Compression loop in response")
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    return ".".join(labels).lower(), end if end is not None else offset
+
+
+def parse_response(data: bytes, query_id: int) -> tuple[int, list[tuple[int, int, str]]]:
+    """rcode and (type, ttl, value) of the answer records of a response"""
+    try:
+        rid, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(data)
+        if rid != query_id or not flags & 0x8000:
+            raise DNSError("Unexpected response")
+        if flags & 0x0200:
+            raise DNSError("Truncated response")
+        offset = _HEADER.size
+        for _ in range(qdcount):
+            _, offset = _read_name(data, offset)
+            offset += 4
+        answers = []
+        for _ in range(ancount):
+            _, offset = _read_name(data, offset)
+            rtype, rclass, ttl, length = _RR.unpack_from(data, offset)
+            offset += _RR.size
+            rdata = data[offset:offset + length]
+            if rclass == CLASS_IN and rtype == TYPE_A and length == 4:
+                answers.append((rtype, ttl, str(ipaddress.IPv4Address(rdata))))
+            elif rclass == CLASS_IN and rtype == TYPE_AAAA and length == 16:
+                answers.append((rtype, ttl, str(ipaddress.IPv6Address(rdata))))
+            elif rclass == CLASS_IN and rtype == TYPE_CNAME:
+                answers.append((rtype, ttl, _read_name(data, offset)[0]))
+            offset += length
+    except (struct.error, IndexError) as e:
+        raise DNSError(f"Malformed response: {e}")
+    return flags & 0x000F, answers
+
+
+def system_nameservers(path: str = "/etc/resolv.conf") -> list[str]:
+    try:
+        with open(path, "r") as f:
+            servers = [line.split()[1] for line in f if line.startswith("nameserver") and len(line.split()) > 1]
+    except OSError:
+        servers = []
+    return servers or ["127.0.0.1"]
+
+
+def parse_nameserver(value: str) -> tuple[str, int]:
+    """host, [v6]:port or host:port"""
+    if value.startswith("["):
+        host, _, port = value[1:].partition("]")
+        return host, int(port.lstrip(":") or 53)
+    if value.count(":") == 1:
+        host, port = value.split(":")
+        return host, int(port)
+    return value, 53
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id: int):
+        self.query_id = query_id
+        self.future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        # Ignore stray datagrams; the ID check is repeated when parsing
+        if len(data) >= 2 and struct.unpack_from("!H", data)[0] == self.query_id and not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+@dataclass
+class DNSAnswer:
+    rcode: int
+    records: list[tuple[int, str]]  # (type, value)
+    expires: float  # time.monotonic() deadline of the cache entry
+
+
+class DNSResolver:
+    """Stub resolver over UDP with a TTL-respecting cache, in-flight deduplication and a concurrency limit.
+
+    Enough for A/AAAA/CNAME lookups through a recursive resolver (the system's,
+    or DNS_NAMESERVERS, which may point at a local stub server with a port).
+    """
+
+    def __init__(
+        self,
+        nameservers: Optional[list[str]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        servers = nameservers or settings.DNS_NAMESERVERS or system_nameservers()
+        self.nameservers = [parse_nameserver(s) for s in servers]
+        self.timeout = settings.DNS_TIMEOUT if timeout is None else timeout
+        self.retries = settings.DNS_RETRIES if retries is None else retries
+        self._semaphore = asyncio.Semaphore(settings.DNS_CONCURRENCY if concurrency is None else concurrency)
+        self._cache: dict[tuple[str, int], DNSAnswer] = {}
+        self._inflight: dict[tuple[str, int], asyncio.Future] = {}
+        self.queries = 0
+
+    async def query(self, name: str, qtype: int) -> DNSAnswer:
+        key = (name.rstrip(".").lower(), qtype)
+        cached = self._cache.get(key)
+        if cached and cached.expires > time.monotonic():
+            return cached
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = self._inflight[key] = asyncio.ensure_future(self._lookup(*key))
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _lookup(self, name: str, qtype: int) -> DNSAnswer:
+        async with self._semaphore:
+            error: Exception = DNSError("No nameservers")
+            for attempt in range(self.retries + 1):
+                host, port = self.nameservers[attempt % len(self.nameservers)]
+                try:
+                    rcode, answers = await self._send(host, port, name, qtype)
+                except (DNSError, OSError, asyncio.TimeoutError) as e:
+                    error = e
+                    continue
+                if rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+                    error = DNSError(f"rcode {rcode} from {host}")
+                    continue
+                break
+            else:
+                raise DNSError(f"{name}: {str(error) or type(error).__name__}")
+
+        if answers:
+            ttl = min(ttl for _, ttl, _ in answers)
+        else:
+            ttl = settings.DNS_NEGATIVE_TTL
+        ttl = max(0, min(ttl, settings.DNS_MAX_TTL))
+        answer = DNSAnswer(rcode, [(rtype, value) for rtype, _, value in answers], time.monotonic() + ttl)
+        if len(self._cache) >= settings.DNS_CACHE_SIZE:
+            self._prune()
+        self._cache[(name, qtype)] = answer
+        return answer
+
+    async def _send(self, host: str, port: int, name: str, qtype: int) -> tuple[int, list]:
+        self.queries += 1
+        query_id = random.getrandbits(16)
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _QueryProtocol(query_id), remote_addr=(host, port)
+        )
+        try:
+            transport.sendto(encode_query(query_id, name, qtype))
+            data = await asyncio.wait_for(protocol.future, self.timeout)
+        finally:
+            transport.close()
+        return parse_response(data, query_id)
+
+    def forget(self, name: str):
+        """Drop cached answers of a name, e.g. right after its owner fixed the records"""
+        name = name.rstrip(".").lower()
+        for qtype in (TYPE_A, TYPE_AAAA):
+            self._cache.pop((name, qtype), None)
+
+    def _prune(self):
+        now = time.monotonic()
+        self._cache = {k: v for k, v in self._cache.items() if v.expires > now}
+        while len(self._cache) >= settings.DNS_CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+
+
+@dataclass
+class DNSCheck:
+    """Outcome of a pre-flight check of one domain"""
+    status: str
+    a: list[str] = field(default_factory=list)
+    aaaa: list[str] = field(default_factory=list)
+    cname: list[str] = field(default_factory=list)  # CNAME chain, in order
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def summary(self) -> str:
+        if self.error:
+            return self.error
+        found = self.cname + self.a + self.aaaa
+        return f"{self.status} ({', '.join(found)})" if found else self.status
+
+
+async def check_domain(domain: str, resolver: Optional["DNSResolver"] = None) -> DNSCheck:
+    """Resolve a domain's A and AAAA records (following CNAMEs) and compare them with the expected targets"""
+    resolver = resolver or get_resolver()
+    try:
+        answers = await asyncio.gather(resolver.query(domain, TYPE_A), resolver.query(domain, TYPE_AAAA))
+    except DNSError as e:
+        return DNSCheck(STATUS_ERROR, error=str(e))
+    if any(answer.rcode == RCODE_NXDOMAIN for answer in answers):
+        return DNSCheck(STATUS_NXDOMAIN)
+
+    check = DNSCheck(STATUS_UNVERIFIED)
+    for answer in answers:
+        for rtype, value in answer.records:
+            target = {TYPE_A: check.a, TYPE_AAAA: check.aaaa, TYPE_CNAME: check.cname}[rtype]
+            if value not in target:
+                target.append(value)
+
+    expected_a = set(settings.DNS_EXPECTED_A)
+    expected_aaaa = {str(ipaddress.IPv6Address(ip)) for ip in settings.DNS_EXPECTED_AAAA}
+    expected_cname = {name.rstrip(".").lower() for name in settings.DNS_EXPECTED_CNAME}
+    if expected_cname & set(check.cname):
+        # Addresses behind an expected CNAME target are the operator's business
+        check.status = STATUS_OK
+    elif not check.a and not check.aaaa:
+        check.status = STATUS_NODATA
+    elif expected_a or expected_aaaa or expected_cname:
+        matched = expected_a & set(check.a) or expected_aaaa & set(check.aaaa)
+        stray = [ip for ip in check.a if expected_a and ip not in expected_a]
+        stray += [ip for ip in check.aaaa if expected_aaaa and ip not in expected_aaaa]
+        if not matched:
+            check.status = STATUS_MISMATCH
+        else:
+            check.status = STATUS_PARTIAL if stray else STATUS_OK
+    return check
+
+
+_resolver: Optional[DNSResolver] = None
+
+
+def get_resolver() -> DNSResolver:
+    """Process-wide resolver (and cache)"""
+    global _resolver
+    if _resolver is None:
+        _resolver = DNSResolver()
+    return _resolver
+
+
+async def recheck_domains():
+    """Background job: re-check domains whose DNS result is missing or due, and update the TLS ask index"""
+    from sqlalchemy import select, update, or_, and_
+    from app.core.database import AsyncSessionLocal
+    from app.models.domain import Domain
+    from app.services import domain_index_service
+
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Domain.id, Domain.domain, Domain.dns_status, Domain.ssl_enabled)
+            .where(
+                Domain.is_active == True,  # noqa: E712
+                or_(
+                    Domain.dns_checked_at.is_(None),
+                    Domain.dns_checked_at < now - timedelta(seconds=settings.DNS_RECHECK_MAX_AGE),
+                    and_(
+                        Domain.dns_status.in_(BLOCKING_STATUSES | {STATUS_ERROR}),
+                        Domain.dns_checked_at < now - timedelta(seconds=settings.DNS_RECHECK_FAILED_AGE),
+                    ),
+                ),
+            )
+            .order_by(Domain.dns_checked_at.asc().nulls_first())
+            .limit(settings.DNS_RECHECK_BATCH)
+        )
+        rows = result.all()
+        if not rows:
+            return
+
+        checks = await asyncio.gather(*(check_domain(domain) for _, domain, _, _ in rows))
+        await db.execute(
+            update(Domain),
+            [
+                {"id": domain_id, "dns_status": check.status, "dns_result": check.to_dict(), "dns_checked_at": now}
+                for (domain_id, _, _, _), check in zip(rows, checks)
+            ],
+        )
+        await db.commit()
+
+        add, remove = [], []
+        for (_, domain, old_status, ssl_enabled), check in zip(rows, checks):
+            if ssl_enabled and tls_allowed(old_status) != tls_allowed(check.status):
+                (add if tls_allowed(check.status) else remove).append(domain)
+        if add or remove:
+            await domain_index_service.publish(db, add=add, remove=remove)
+        logger.info(
+            "DNS re-check of %s domains: %s", len(rows),
+            {status: sum(1 for c in checks if c.status == status) for status in {c.status for c in checks}},
+        )
@@ -0,0 +1,282 @@
+"""
+In-memory index of TLS-enabled domains for Caddy's on-demand TLS ask endpoint
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text, or_
+from app.models.domain import Domain
+from app.core.config import settings
+from app.services.dns_service import BLOCKING_STATUSES
+from array import array
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "frankenpanel_domains"
+EMPTY, DELETED = 0, 1
+MASK64 = (1 << 64) - 1
+REASONS = {200: b"OK", 400: b"Bad Request", 403: b"Forbidden", 404: b"Not Found", 503: b"Service Unavailable"}
+PROXY_HEADERS = (b"\r\nx-forwarded-for:", b"\r\nforwarded:", b"\r\nvia:")
+
+
+def normalize(domain: str) -> str:
+    return domain.strip().rstrip(".").lower()
+
+
+def _key(domain: str) -> int:
+    """64-bit slot key of a normalized domain (0 and 1 mark empty and deleted slots)"""
+    key = hash(domain) & MASK64
+    return key if key > DELETED else key + 2
+
+
+class DomainIndex:
+    """Open-addressing hash set of domain keys in a flat array.
+
+    Only 64-bit keys are stored, not the strings: 1M domains take 16 MiB
+    instead of ~125 MiB for a set of str. Keys come from Python's
+    (per-process seeded) str hash, so the index is never shared between
+    processes; each worker loads its own.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._table = array("Q", bytes(8 * _capacity_for(capacity)))
+        self._mask = len(self._table) - 1
+        self._size = 0
+        self._used = 0  # Live plus deleted slots
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, domain: str) -> bool:
+        key = _key(normalize(domain))
+        table, mask = self._table, self._mask
+        slot = key & mask
+        while True:
+            value = table[slot]
+            if value == key:
+                return True
+            if value == EMPTY:
+                return False
+            slot = (slot + 1) & mask
+
+    def add(self, domain: str):
+        if (self._used + 1) * 2 > len(self._table):
+            self._resize(max(self._size + 1, 1) * 2)
+        key = _key(normalize(domain))
+        table, mask = self._table, self._mask
+        slot = key & mask
+        free = -1
+        while True:
+            value = table[slot]
+            if value == key:
+                return
+            if value == DELETED and free < 0:
+                free = slot
+            elif value == EMPTY:
+                break
+            slot = (slot + 1) & mask
+        if free < 0:
+            free = slot
+            self._used += 1
+        table[free] = key
+        self._size += 1
+
+    def discard(self, domain: str):
+        key = _key(normalize(domain))
+        table, mask = self._table, self._mask
+        slot = key & mask
+        while True:
+            value = table[slot]
+            if value == key:
+                table[slot] = DELETED
+                self._size -= 1
+                return
+            if value == EMPTY:
+                return
+            slot = (slot + 1) & mask
+
+    def replace(self, domains: Iterable[str]):
+        """Swap in a freshly built index of exactly these domains"""
+        keys = {_key(normalize(domain)) for domain in domains}
+        table = array("Q", bytes(8 * _capacity_for(len(keys))))
+        mask = len(table) - 1
+        for key in keys:
+            slot = key & mask
+            while table[slot]:
+                slot = (slot + 1) & mask
+            table[slot] = key
+        self._table, self._mask, self._size, self._used = table, mask, len(keys), len(keys)
+        self.loaded = True
+
+    def memory_bytes(self) -> int:
+        return self._table.itemsize * len(self._table)
+
+    def _resize(self, capacity: int):
+        old = self._table
+        self._table = array("Q", bytes(8 * _capacity_for(capacity)))
+        self._mask = len(self._table) - 1
+        self._size = self._used = 0
+        table, mask = self._table, self._mask
+        for key in old:
+            if key > DELETED:
+                slot = key & mask
+                while table[slot] != EMPTY:
+                    slot = (slot + 1) & mask
+                table[slot] = key
+                self._size += 1
+        self._used = self._size
+
+
+def _capacity_for(count: int) -> int:
+    """Power of two keeping the load factor at or below 1/2"""
+    capacity = 16
+    while capacity < count * 2:
+        capacity *= 2
+    return capacity
+
+
+async def load(db: AsyncSession):
+    """Rebuild this process's index from the domains table"""
+    query = select(Domain.domain).where(Domain.is_active == True, Domain.ssl_enabled == True)  # noqa: E712
+    if settings.DNS_PREFLIGHT_ENABLED:
+        # No certificate can be issued for these; don't let handshakes trigger ACME attempts
+        query = query.where(or_(Domain.dns_status.is_(None), Domain.dns_status.notin_(BLOCKING_STATUSES)))
+    result = await db.execute(query)
+    domains = result.scalars().all()
+    get_domain_index().replace(domains)
+    logger.info("Loaded %s domains into the TLS ask index", len(domains))
+
+
+async def publish(db: AsyncSession, add: Iterable[str] = (), remove: Iterable[str] = ()):
+    """Apply a domain change to this process's index and notify the other backend processes"""
+    add, remove = [normalize(d) for d in add], [normalize(d) for d in remove]
+    index = get_domain_index()
+    for domain in remove:
+        index.discard(domain)
+    for domain in add:
+        index.add(domain)
+    payload = json.dumps({"pid": os.getpid(), "add": add, "remove": remove})
+    if len(payload) > 7900:
+        # NOTIFY payloads are limited to 8000 bytes; ask listeners to reload instead
+        payload = json.dumps({"pid": os.getpid(), "reload": True})
+    try:
+        await db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+        await db.commit()
+    except Exception:
+        logger.exception("Could not notify other processes of domain changes")
+
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("pid") == os.getpid():
+        return
+    if message.get("reload"):
+        asyncio.get_running_loop().create_task(_reload())
+        return
+    index = get_domain_index()
+    for domain in message.get("remove", []):
+        index.discard(domain)
+    for domain in message.get("add", []):
+        index.add(domain)
+
+
+async def _reload():
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await load(db)
+
+
+async def listen():
+    """Long-running job (every process): keep the index loaded and follow other processes' changes"""
+    import asyncpg
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(
+                host=settings.POSTGRES_HOST,
+                port=settings.POSTGRES_PORT,
+                user=settings.POSTGRES_USER,
+                password=settings.POSTGRES_PASSWORD,
+                database=settings.POSTGRES_DB,
+            )
+            await connection.add_listener(CHANNEL, _on_notification)
+            # Load after subscribing so no change falls between the two
+            await _reload()
+            loop = asyncio.get_running_loop()
+            next_resync = loop.time() + settings.TLS_ASK_RESYNC_INTERVAL
+            while not connection.is_closed():
+                await asyncio.sleep(5)
+                if loop.time() >= next_resync:
+                    await _reload()
+                    next_resync = loop.time() + settings.TLS_ASK_RESYNC_INTERVAL
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Domain index listener failed; reconnecting")
+            await asyncio.sleep(5)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+
+def ask_status(request: bytes) -> int:
+    """Status answering one raw ask request head: 200 if the domain is ours, 404 if not, 503 until loaded"""
+    head = request.lower()
+    if any(header in head for header in PROXY_HEADERS):
+        return 403  # Relayed by a proxy, not Caddy asking directly
+    parts = request.split(b"\r\n", 1)[0].split(b" ")
+    if len(parts) != 3 or parts[0] != b"GET":
+        return 400
+    path, _, query = parts[1].decode("latin-1").partition("?")
+    if path != settings.TLS_ASK_PATH:
+        return 404
+    index = get_domain_index()
+    if not index.loaded:
+        return 503
+    domain = parse_qs(query).get("domain", [""])[0]
+    return 200 if domain and domain in index else 404
+
+
+async def _answer_asks(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            code = ask_status(await reader.readuntil(b"\r\n\r\n"))
+            writer.write(b"HTTP/1.1 %d %s\r\nContent-Length: 0\r\n\r\n" % (code, REASONS[code]))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_ask():
+    """Long-running job (every process): answer Caddy's on-demand TLS ask on TLS_ASK_HOST:TLS_ASK_PORT.
+
+    A listener of its own, not a route of the panel app: the panel port is
+    reached through Caddy's reverse_proxy, so there every client looks like
+    loopback. Minimal HTTP/1.1 with keep-alive, no routing, auth or database.
+    """
+    server = await asyncio.start_server(
+        _answer_asks, settings.TLS_ASK_HOST, settings.TLS_ASK_PORT, reuse_port=True
+    )
+    async with server:
+        await server.serve_forever()
+
+
+_index: Optional[DomainIndex] = None
+
+
+def get_domain_index() -> DomainIndex:
+    """Process-wide domain index"""
+    global _index
+    if _index is None:
+        _index = DomainIndex()
+    return _index
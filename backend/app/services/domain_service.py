@@ -2,12 +2,56 @@
 Domain management service
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, or_, func
+from sqlalchemy.dialects.postgresql import insert
 from app.models.domain import Domain, DomainType
+from app.models.site import Site
 from app.models.ssl import SSLCertificate
 from app.schemas.domain import DomainCreate, DomainUpdate
 from app.services.caddy_service import CaddyService
-from typing import Optional
+from app.services import domain_index_service
+from app.services.dns_service import BLOCKING_STATUSES, check_domain, get_resolver, tls_allowed
+from app.core.config import settings
+from typing import Any, AsyncIterator, Iterable, Optional
+import asyncio
+import codecs
+import csv
+import re
+
+DOMAIN_RE = re.compile(r'^([a-z0-9]+(-[a-z0-9]+)*\.)+[a-z]{2,}$')
+TRUE_VALUES = {"1", "true", "yes", "on"}
+FALSE_VALUES = {"0", "false", "no", "off"}
+IMPORT_CHUNK = 1000  # Rows per multi-row INSERT
+
+
+async def read_csv_rows(chunks: AsyncIterator[bytes], max_rows: int) -> list[dict[str, str]]:
+    """Rows of a streamed CSV upload with a header line (domain,site_id|site[,domain_type][,ssl_enabled])"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header: Optional[list[str]] = None
+    rows: list[dict[str, str]] = []
+    buffer = ""
+    
+    def consume(lines: list[str]):
+        nonlocal header
+        for values in csv.reader(line.rstrip("\r") for line in lines):
+            if not any(v.strip() for v in values):
+                continue
+            if header is None:
+                header = [v.strip().lower() for v in values]
+                if "domain" not in header:
+                    raise ValueError("CSV header must include a domain column")
+                continue
+            if len(rows) >= max_rows:
+                raise ValueError(f"Import is limited to {max_rows} rows")
+            rows.append(dict(zip(header, (v.strip() for v in values))))
+    
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        consume(lines)
+    consume([buffer + decoder.decode(b"", final=True)])
+    return rows
 
 
 class DomainService:
@@ -28,6 +72,13 @@ class DomainService:
         # Validate domain format
         self._validate_domain(domain)
         
+        # DNS pre-flight: only record the result unless DNS_PREFLIGHT_ENFORCE
+        dns = None
+        if settings.DNS_PREFLIGHT_ENABLED:
+            dns = await check_domain(domain)
+            if settings.DNS_PREFLIGHT_ENFORCE and dns.status in BLOCKING_STATUSES:
+                raise ValueError(f"{domain} does not point at this server: {dns.summary()}")
+        
         # Create domain record
         domain_record = Domain(
             domain=domain,
@@ -35,6 +86,10 @@ class DomainService:
             site_id=site_id,
             ssl_enabled=ssl_enabled,
         )
+        if dns:
+            domain_record.dns_status = dns.status
+            domain_record.dns_result = dns.to_dict()
+            domain_record.dns_checked_at = func.now()
         
         self.db.add(domain_record)
         await self.db.flush()
@@ -47,6 +102,9 @@ class DomainService:
         await self.db.commit()
         await self.db.refresh(domain_record)
         
+        if domain_record.ssl_enabled and tls_allowed(domain_record.dns_status):
+            await domain_index_service.publish(self.db, add=[domain_record.domain])
+        
         # Update Caddy configuration
         await self.caddy_service.add_domain(domain_record)
         
@@ -72,6 +130,11 @@ class DomainService:
         await self.db.commit()
         await self.db.refresh(domain)
         
+        if domain.is_active and domain.ssl_enabled and tls_allowed(domain.dns_status):
+            await domain_index_service.publish(self.db, add=[domain.domain])
+        else:
+            await domain_index_service.publish(self.db, remove=[domain.domain])
+        
         # Update Caddy configuration
         await self.caddy_service.update_domain(domain)
         
@@ -92,8 +155,33 @@ class DomainService:
         await self.db.delete(domain)
         await self.db.commit()
         
+        await domain_index_service.publish(self.db, remove=[domain.domain])
+        
         return True
     
+    async def check_dns(self, domain_id: int) -> Domain:
+        """Re-run the DNS pre-flight of a domain now, bypassing cached answers"""
+        domain = await self.get_domain(domain_id)
+        if not domain:
+            raise ValueError(f"Domain {domain_id} not found")
+        
+        get_resolver().forget(domain.domain)
+        dns = await check_domain(domain.domain)
+        was_allowed = tls_allowed(domain.dns_status)
+        domain.dns_status = dns.status
+        domain.dns_result = dns.to_dict()
+        domain.dns_checked_at = func.now()
+        await self.db.commit()
+        await self.db.refresh(domain)
+        
+        if domain.is_active and domain.ssl_enabled and was_allowed != tls_allowed(dns.status):
+            if tls_allowed(dns.status):
+                await domain_index_service.publish(self.db, add=[domain.domain])
+            else:
+                await domain_index_service.publish(self.db, remove=[domain.domain])
+        
+        return domain
+    
     async def get_domain(self, domain_id: int) -> Optional[Domain]:
         """Get a domain by ID"""
         result = await self.db.execute(select(Domain).where(Domain.id == domain_id))
@@ -130,7 +218,158 @@ class DomainService:
     
     def _validate_domain(self, domain: str):
         """Validate domain format"""
-        import re
-        pattern = r'^([a-z0-9]+(-[a-z0-9]+)*\.)+[a-z]{2,}$'
-        if not re.match(pattern, domain.lower()):
+        if len(domain) > 253 or not DOMAIN_RE.match(domain.lower()):
             raise ValueError(f"Invalid domain format: {domain}")
+    
+    async def import_domains(self, rows: Iterable[dict[str, Any]], dry_run: bool = False) -> dict:
+        """Create many domains in one transaction and one Caddy update; bad rows are reported, not fatal.
+        
+        Rows carry domain, site_id or site (slug or name), and optionally
+        domain_type and ssl_enabled. Row numbers in errors start at 1.
+        """
+        errors, parsed, seen = [], [], set()
+        received = 0
+        for number, row in enumerate(rows, start=1):
+            received = number
+            try:
+                item = self._parse_import_row(row)
+                if item["domain"] in seen:
+                    raise ValueError("Duplicate domain in import")
+            except ValueError as e:
+                errors.append({"row": number, "domain": str(row.get("domain") or ""), "error": str(e)})
+                continue
+            seen.add(item["domain"])
+            parsed.append((number, item))
+        
+        # Site references and existing domains, one query each
+        ids = {item["site_id"] for _, item in parsed if item["site_id"] is not None}
+        refs = {item["site"] for _, item in parsed if item["site"] is not None}
+        sites: dict[Any, int] = {}
+        if ids or refs:
+            result = await self.db.execute(
+                select(Site.id, Site.slug, Site.name).where(
+                    or_(Site.id.in_(ids), Site.slug.in_(refs), Site.name.in_(refs))
+                )
+            )
+            for site_id, slug, name in result.all():
+                sites[site_id] = sites[slug] = sites[name] = site_id
+        existing = set()
+        names = [item["domain"] for _, item in parsed]
+        for start in range(0, len(names), IMPORT_CHUNK):
+            result = await self.db.execute(
+                select(Domain.domain).where(Domain.domain.in_(names[start:start + IMPORT_CHUNK]))
+            )
+            existing.update(result.scalars().all())
+        
+        valid = []
+        for number, item in parsed:
+            site_id = sites.get(item["site_id"] if item["site_id"] is not None else item["site"])
+            if site_id is None:
+                errors.append({"row": number, "domain": item["domain"], "error": "Site not found"})
+            elif item["domain"] in existing:
+                errors.append({"row": number, "domain": item["domain"], "error": "Domain already exists"})
+            else:
+                item["site_id"] = site_id
+                valid.append((number, item))
+        
+        created: list[dict] = []
+        if valid and not dry_run:
+            created, conflicts = await self._insert_domains([item for _, item in valid])
+            # Rows taken by a concurrent request between the check and the insert
+            for number, item in valid:
+                if item["domain"] in conflicts:
+                    errors.append({"row": number, "domain": item["domain"], "error": "Domain already exists"})
+            await self.db.commit()
+            
+            ssl_domains = [d["domain"] for d in created if d["ssl_enabled"]]
+            if ssl_domains:
+                await domain_index_service.publish(self.db, add=ssl_domains)
+            # Submitted together, the reload coordinator applies every site in one batch
+            site_ids = {d["site_id"] for d in created}
+            await asyncio.gather(*(self.caddy_service.update_site(site_id) for site_id in site_ids))
+        
+        errors.sort(key=lambda e: e["row"])
+        return {
+            "received": received,
+            "created": len(valid) if dry_run else len(created),
+            "failed": len(errors),
+            "dry_run": dry_run,
+            "errors": errors,
+        }
+    
+    def _parse_import_row(self, row: dict[str, Any]) -> dict[str, Any]:
+        domain = str(row.get("domain") or "").strip().lower().rstrip(".")
+        if not domain:
+            raise ValueError("Missing domain")
+        self._validate_domain(domain)
+        
+        site_id, site = row.get("site_id"), row.get("site")
+        if site_id not in (None, ""):
+            try:
+                site_id = int(site_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid site_id: {site_id}")
+            site = None
+        elif site not in (None, ""):
+            site_id, site = None, str(site).strip()
+        else:
+            raise ValueError("Missing site_id or site")
+        
+        try:
+            domain_type = DomainType(str(row.get("domain_type") or DomainType.PRIMARY.value).strip().lower())
+        except ValueError:
+            raise ValueError(f"Invalid domain_type: {row.get('domain_type')}")
+        
+        ssl_enabled = row.get("ssl_enabled")
+        if ssl_enabled in (None, ""):
+            ssl_enabled = True
+        elif not isinstance(ssl_enabled, bool):
+            value = str(ssl_enabled).strip().lower()
+            if value not in TRUE_VALUES | FALSE_VALUES:
+                raise ValueError(f"Invalid ssl_enabled: {ssl_enabled}")
+            ssl_enabled = value in TRUE_VALUES
+        
+        return {"domain": domain, "site_id": site_id, "site": site, "domain_type": domain_type, "ssl_enabled": ssl_enabled}
+    
+    async def _insert_domains(self, items: list[dict]) -> tuple[list[dict], set[str]]:
+        """Multi-row inserts of SSL records and domains (not committed); returns created rows and conflicts"""
+        ssl_names = [item["domain"] for item in items if item["ssl_enabled"]]
+        certificates = {}
+        for start in range(0, len(ssl_names), IMPORT_CHUNK):
+            chunk = ssl_names[start:start + IMPORT_CHUNK]
+            await self.db.execute(
+                insert(SSLCertificate.__table__)
+                .values([
+                    {"domain": name, "caddy_managed": True, "auto_renew": True, "is_valid": True, "caddy_config": {}}
+                    for name in chunk
+                ])
+                .on_conflict_do_nothing(index_elements=["domain"])
+            )
+            result = await self.db.execute(
+                select(SSLCertificate.domain, SSLCertificate.id).where(SSLCertificate.domain.in_(chunk))
+            )
+            certificates.update(result.all())
+        
+        created = []
+        for start in range(0, len(items), IMPORT_CHUNK):
+            chunk = items[start:start + IMPORT_CHUNK]
+            result = await self.db.execute(
+                insert(Domain.__table__)
+                .values([
+                    {
+                        "domain": item["domain"],
+                        "domain_type": item["domain_type"],
+                        "site_id": item["site_id"],
+                        "ssl_enabled": item["ssl_enabled"],
+                        "ssl_certificate_id": certificates.get(item["domain"]),
+                        "is_active": True,
+                    }
+                    for item in chunk
+                ])
+                .on_conflict_do_nothing(index_elements=["domain"])
+                .returning(Domain.id, Domain.domain, Domain.site_id, Domain.ssl_enabled)
+            )
+            created.extend(dict(row._mapping) for row in result.all())
+        
+        inserted = {d["domain"] for d in created}
+        return created, {item["domain"] for item in items} - inserted
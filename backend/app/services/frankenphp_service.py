@@ -1,13 +1,27 @@
 """
 FrankenPHP worker management service
 """
-from app.models.site import Site
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from app.models.site import Site, SiteStatus, SiteType
 from app.core.config import settings
+from app.services.placement_service import WorkerDemand, get_placement_service
+from app.services.resource_service import get_resource_sampler
+from app.services import log_service
+from app.services.log_service import LogFilter, LogSegments, worker_log_path
+from app.services.log_rotation_service import LogRotationService
+from app.services.health_service import get_health_prober, health_path, invalidate_sites, wait_ready
+from app.services import opcache_service
 import os
 import json
 import subprocess
 import asyncio
-from typing import Optional
+from typing import AsyncIterator, Optional
+
+
+def needs_worker(site: Site) -> bool:
+    """Static sites are served by Caddy from disk and have no PHP worker"""
+    return site.site_type != SiteType.STATIC
 
 
 class FrankenPHPService:
@@ -26,6 +40,7 @@ class FrankenPHPService:
             "port": site.worker_port,
             "php_version": site.php_version,
             "worker_file": os.path.join(self.runtime_dir, f"worker_{site.id}.json"),
+            "php_ini_scan_dir": opcache_service.php_config_dir(site.id),  # Written by _spawn
         }
         
         config_path = os.path.join(self.runtime_dir, f"worker_{site.id}.json")
@@ -38,36 +53,24 @@ class FrankenPHPService:
     
     async def start_worker(self, site: Site) -> bool:
         """Start FrankenPHP worker for site"""
+        if not needs_worker(site):
+            return True
+        
         config_path = os.path.join(self.runtime_dir, f"worker_{site.id}.json")
         
         if not os.path.exists(config_path):
             await self.create_worker_config(site)
         
-        # FrankenPHP command
-        # FrankenPHP runs as a worker that serves PHP files
-        cmd = [
-            self.frankenphp_bin,
-            "worker",
-            "--port", str(site.worker_port),
-            "--root", site.path,
-        ]
+        # Rotate the log first: nothing holds it open yet
+        rotation = LogRotationService()
+        max_bytes = int((site.config or {}).get("log_max_bytes", settings.LOG_ROTATE_MAX_BYTES))
+        if rotation.should_rotate(site.id, max_bytes, settings.LOG_ROTATE_INTERVAL_HOURS * 3600):
+            rotation.rotate(site.id, running=False)
         
-        # Start worker process
-        log_file = os.path.join(settings.LOGS_DIR, f"frankenphp_{site.id}.log")
-        os.makedirs(settings.LOGS_DIR, exist_ok=True)
-        
-        with open(log_file, "a") as log:
-            process = subprocess.Popen(
-                cmd,
-                stdout=log,
-                stderr=subprocess.STDOUT,
-                cwd=site.path,
-            )
+        pid = await asyncio.to_thread(self._spawn, site, site.worker_port)
         
         # Store PID
-        pid_file = os.path.join(self.runtime_dir, f"worker_{site.id}.pid")
-        with open(pid_file, "w") as f:
-            f.write(str(process.pid))
+        self._write_pid(site, pid)
         
         return True
     
@@ -81,23 +84,12 @@ class FrankenPHPService:
         with open(pid_file, "r") as f:
             pid = int(f.read().strip())
         
-        try:
-            # Send SIGTERM
-            os.kill(pid, 15)
-            
-            # Wait a bit, then force kill if needed
-            await asyncio.sleep(2)
-            try:
-                os.kill(pid, 0)  # Check if process exists
-                os.kill(pid, 9)  # Force kill
-            except ProcessLookupError:
-                pass  # Process already terminated
-            
+        if await self._terminate(pid):
             # Remove PID file
             os.remove(pid_file)
-            
-        except ProcessLookupError:
-            pass  # Process already stopped
+        
+        if settings.FRANKENPHP_PLACEMENT_ENABLED:
+            get_placement_service().forget(site.id)
         
         return True
     
@@ -107,6 +99,73 @@ class FrankenPHPService:
         await asyncio.sleep(1)
         return await self.start_worker(site)
     
+    async def reload_worker(self, site: Site) -> int:
+        """Zero-downtime blue/green reload; returns the worker port now serving the site.
+        
+        Starts a replacement worker on the site's alternate port, waits until it
+        answers, switches the Caddy upstream to it, drains in-flight requests on
+        the old worker and then stops it. The new port is stored as soon as Caddy
+        points at it, so a crash while draining cannot leave the database naming
+        the stopped worker. A site whose worker is not running is simply started.
+        """
+        if not needs_worker(site):
+            return site.worker_port
+        status = await self.get_worker_status(site)
+        if status["status"] != "running":
+            await self.create_worker_config(site)
+            await self.start_worker(site)
+            return site.worker_port
+        
+        old_port, old_pid = site.worker_port, status["pid"]
+        new_port = alternate_port(old_port)
+        if await _port_in_use(new_port):
+            raise RuntimeError(f"Alternate port {new_port} for site {site.id} is in use")
+        
+        new_pid = await asyncio.to_thread(self._spawn, site, new_port)
+        site.worker_port = new_port
+        if not await self.wait_until_ready(site):
+            site.worker_port = old_port
+            await self._terminate(new_pid)
+            raise RuntimeError(f"Replacement worker for site {site.id} did not become ready; kept the old worker")
+        
+        from app.services.caddy_service import CaddyService
+        try:
+            await CaddyService().switch_upstream(site, old_port, new_port)
+        except Exception:
+            site.worker_port = old_port
+            await self._terminate(new_pid)
+            raise
+        
+        await _store_worker_port(site.id, new_port)
+        self._write_pid(site, new_pid)
+        await self.create_worker_config(site)
+        
+        await self._drain(old_port, settings.FRANKENPHP_DRAIN_TIMEOUT)
+        await self._terminate(old_pid)
+        return new_port
+    
+    async def wait_until_ready(self, site: Site, timeout: Optional[float] = None) -> bool:
+        """Wait until a started worker answers HTTP on its health path, then warm it up"""
+        if not needs_worker(site):
+            return True
+        path = health_path(site)
+        cold_ms = await wait_ready(
+            site.worker_port,
+            path,
+            settings.HEALTH_READY_TIMEOUT if timeout is None else timeout,
+        )
+        if cold_ms is None:
+            return False
+        if settings.WARMUP_ENABLED:
+            # The readiness probe made the worker's first request, so it is the cold sample
+            await opcache_service.warm_up(site, site.worker_port, cold=(path, cold_ms))
+        return True
+
+    
+    def get_worker_health(self, site: Site) -> Optional[dict]:
+        """Latest cached probe result for a site's worker"""
+        return get_health_prober().get(site.id)
+    
     async def get_worker_status(self, site: Site) -> dict:
         """Get worker status"""
         pid_file = os.path.join(self.runtime_dir, f"worker_{site.id}.pid")
@@ -123,13 +182,207 @@ class FrankenPHPService:
         except ProcessLookupError:
             return {"status": "stopped", "pid": None}
     
-    async def get_worker_logs(self, site: Site, lines: int = 100) -> list[str]:
-        """Get worker logs"""
-        log_file = os.path.join(settings.LOGS_DIR, f"frankenphp_{site.id}.log")
+    async def get_worker_logs(
+        self,
+        site: Site,
+        lines: int = 100,
+        before: Optional[int] = None,
+        log_filter: Optional[LogFilter] = None,
+    ) -> dict:
+        """Get the last worker log lines before a byte-offset cursor, optionally filtered.
         
+        Offsets are virtual: they span rotated (and compressed) segments too.
+        """
+        log = LogSegments(worker_log_path(site.id))
+        loop = asyncio.get_running_loop()
+        found, start, end = await loop.run_in_executor(None, log.tail, lines, before, log_filter)
+        return {"lines": found, "cursor": start, "end": end}
+    
+    async def follow_worker_logs(
+        self,
+        site: Site,
+        offset: Optional[int] = None,
+        log_filter: Optional[LogFilter] = None,
+    ) -> AsyncIterator[tuple[list[str], int]]:
+        """Stream new worker log lines as they are written"""
+        log_file = worker_log_path(site.id)
+        os.makedirs(settings.LOGS_DIR, exist_ok=True)
         if not os.path.exists(log_file):
-            return []
+            open(log_file, "a").close()
+        async for lines, next_offset in log_service.follow(log_file, offset, log_filter):
+            yield lines, next_offset
+    
+    async def rebalance_placement(self, db: AsyncSession) -> dict:
+        """Re-pin all running workers to CPU sets based on load observed since the last run"""
+        placement_service = get_placement_service()
+        result = await db.execute(select(Site).where(Site.status == SiteStatus.ACTIVE))
+        workers = []
+        for site in result.scalars().all():
+            status = await self.get_worker_status(site)
+            if status["status"] != "running":
+                continue
+            demand = WorkerDemand(
+                site_id=site.id,
+                load=placement_service.observe_load(status["pid"]),
+                dedicated_cpus=self._dedicated_cpus(site),
+            )
+            workers.append((demand, status["pid"]))
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, placement_service.rebalance, workers)
+        return placement_service.load_map()
+    
+    def get_worker_resources(self, site: Site, samples: Optional[int] = None) -> Optional[dict]:
+        """Latest resource usage and recent history of a site's worker"""
+        return get_resource_sampler().get_site(site.id, samples)
+    
+    def get_placement_map(self) -> dict:
+        """Current CPU/NUMA placement of all workers"""
+        return get_placement_service().load_map()
+    
+    def _spawn(self, site: Site, port: int) -> int:
+        """Launch a FrankenPHP worker process for site on port; returns its PID.
+
+        Blocking (placement flock, re-pinning neighbours with migratepages): call it via asyncio.to_thread.
+        """
+        # FrankenPHP command
+        # FrankenPHP runs as a worker that serves PHP files
+        cmd = [
+            self.frankenphp_bin,
+            "worker",
+            "--port", str(port),
+            "--root", site.path,
+        ]
+        
+        # Pin to a CPU set / NUMA node when placement is enabled
+        preexec_fn = None
+        if settings.FRANKENPHP_PLACEMENT_ENABLED:
+            placement_service = get_placement_service()
+            placement = placement_service.place(site.id, self._dedicated_cpus(site), self._read_pid)
+            cmd = placement_service.command_prefix(placement) + cmd
+            cpus = placement.cpus
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+        
+        log_file = worker_log_path(site.id)
+        os.makedirs(settings.LOGS_DIR, exist_ok=True)
+        
+        # Leading ":" keeps PHP's default scan dir and adds the site's opcache.ini
+        env = {**os.environ, "PHP_INI_SCAN_DIR": ":" + opcache_service.write_php_config(site)}
+        
+        with open(log_file, "a") as log:
+            process = subprocess.Popen(
+                cmd,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                cwd=site.path,
+                env=env,
+                preexec_fn=preexec_fn,
+            )
+        return process.pid
+    
+    def _read_pid(self, site_id: int) -> Optional[int]:
+        """PID of a site's running worker from its PID file, if any"""
+        try:
+            with open(os.path.join(self.runtime_dir, f"worker_{site_id}.pid"), "r") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_pid(self, site: Site, pid: int):
+        pid_file = os.path.join(self.runtime_dir, f"worker_{site.id}.pid")
+        os.makedirs(self.runtime_dir, exist_ok=True)
+        with open(pid_file, "w") as f:
+            f.write(str(pid))
+    
+    async def _terminate(self, pid: int, grace: float = 2.0) -> bool:
+        """SIGTERM, then SIGKILL after grace seconds; False if the process was already gone"""
+        try:
+            # Send SIGTERM
+            os.kill(pid, 15)
+        except ProcessLookupError:
+            return False  # Process already stopped
+        
+        # Wait a bit, then force kill if needed
+        await asyncio.sleep(grace)
+        try:
+            os.kill(pid, 0)  # Check if process exists
+            os.kill(pid, 9)  # Force kill
+        except ProcessLookupError:
+            pass  # Process already terminated
         
-        with open(log_file, "r") as f:
-            all_lines = f.readlines()
-            return all_lines[-lines:]
+        # Reap it if it is our child so it does not linger as a zombie
+        try:
+            os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            pass
+        return True
+    
+    async def _drain(self, port: int, timeout: float):
+        """Wait until no client connections to port remain, up to timeout seconds"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while asyncio.get_running_loop().time() < deadline:
+            if _established_connections(port) == 0:
+                return
+            await asyncio.sleep(0.5)
+    
+    def _dedicated_cpus(self, site: Site) -> int:
+        """Number of exclusive cores configured for a hot site (Site.config["dedicated_cpus"])"""
+        try:
+            return max(0, int((site.config or {}).get("dedicated_cpus", 0)))
+        except (TypeError, ValueError):
+            return 0
+
+
+async def rebalance_worker_placement():
+    """Background job: periodic CPU/NUMA rebalance of running workers"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await FrankenPHPService().rebalance_placement(db)
+
+
+async def _store_worker_port(site_id: int, port: int):
+    """Commit a site's worker port on its own session, leaving the caller's pending changes alone"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Site).where(Site.id == site_id).values(worker_port=port))
+        await db.commit()
+    # The prober caches sites; without this it would keep probing (and restarting) the old port
+    invalidate_sites()
+
+
+def alternate_port(port: int) -> int:
+    """Blue/green partner of a worker port: primary ports pair with port + FRANKENPHP_WORKER_MAX"""
+    start = settings.FRANKENPHP_WORKER_START_PORT
+    span = settings.FRANKENPHP_WORKER_MAX
+    return port + span if port < start + span else port - span
+
+
+def primary_port(port: int) -> int:
+    """The primary (blue) port of a blue/green pair"""
+    return min(port, alternate_port(port))
+
+
+async def _port_in_use(port: int) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), 1.0)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+def _established_connections(port: int) -> int:
+    """Established TCP connections whose local port is port (from /proc/net/tcp{,6})"""
+    count = 0
+    hex_port = f"{port:04X}"
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table, "r") as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 3 and fields[3] == "01" and fields[1].rsplit(":", 1)[-1] == hex_port:
+                        count += 1
+        except OSError:
+            continue
+    return count
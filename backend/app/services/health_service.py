@@ -0,0 +1,256 @@
+"""
+Worker liveness/readiness probing with automatic remediation
+"""
+from sqlalchemy import select
+from app.models.site import Site, SiteStatus, SiteType
+from app.core.config import settings
+from dataclasses import dataclass, asdict
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_RATIO = 0.6180339887
+SNAPSHOT_INTERVAL = 1.0  # Seconds between writes of the health snapshot while results change
+
+
+@dataclass
+class SiteHealth:
+    """Latest probe outcome of a site's worker"""
+    site_id: int
+    state: str = "unknown"  # unknown, healthy, degraded, down
+    consecutive_failures: int = 0
+    last_checked: Optional[float] = None
+    last_ok: Optional[float] = None
+    latency_ms: Optional[float] = None
+    status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    restarts: int = 0
+    last_restart: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def health_path(site: Site) -> str:
+    """Readiness URL path of a site (Site.config["health_path"], default "/")"""
+    path = (site.config or {}).get("health_path") or "/"
+    return path if path.startswith("/") else f"/{path}"
+
+
+async def probe(client: httpx.AsyncClient, port: int, path: str = "/", timeout: float = 2.0) -> tuple[bool, Optional[int], float, Optional[str]]:
+    """One HTTP probe of a worker; returns (ok, status code, latency ms, error)"""
+    started = time.perf_counter()
+    try:
+        response = await client.get(f"http://127.0.0.1:{port}{path}", timeout=timeout)
+    except httpx.HTTPError as e:
+        return False, None, (time.perf_counter() - started) * 1000, f"{type(e).__name__}: {e}"
+    latency = (time.perf_counter() - started) * 1000
+    ok = response.status_code < 500
+    return ok, response.status_code, latency, None if ok else f"HTTP {response.status_code}"
+
+
+async def wait_ready(port: int, path: str = "/", timeout: float = 30.0, interval: float = 0.25) -> Optional[float]:
+    """Poll a freshly started worker until it answers, or give up after timeout seconds.
+
+    Returns the latency (ms) of the first successful request, i.e. the worker's
+    cold start on path, or None if it never became ready.
+    """
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(follow_redirects=False) as client:
+        while time.monotonic() < deadline:
+            ok, _, latency, _ = await probe(client, port, path, timeout=min(2.0, max(0.1, deadline - time.monotonic())))
+            if ok:
+                return latency
+            await asyncio.sleep(interval)
+    return None
+
+
+def sites_stamp_path() -> str:
+    return os.path.join(settings.RUNTIME_DIR, "health_sites.stamp")
+
+
+def invalidate_sites():
+    """Make the prober (in whichever process leads) re-read sites now, e.g. after a worker port change"""
+    path = sites_stamp_path()
+    os.makedirs(settings.RUNTIME_DIR, exist_ok=True)
+    with open(path, "a"):
+        pass
+    os.utime(path)
+
+
+class HealthProber:
+    """Probes every active site on a fixed, per-site phase-shifted schedule.
+
+    Only the leader process probes; results are published to
+    RUNTIME_DIR/health.json so every API worker process serves the same view.
+    That snapshot is the source of truth for runtime health: Site.status is the
+    administrative state (it selects which sites are probed and kept running),
+    so a degraded or down worker is never written back to it.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.interval = interval or settings.HEALTH_CHECK_INTERVAL
+        self.concurrency = concurrency or settings.HEALTH_CHECK_CONCURRENCY
+        self.timeout = timeout or settings.HEALTH_CHECK_TIMEOUT
+        self.health: dict[int, SiteHealth] = {}
+        self._sites: dict[int, Site] = {}
+        self._queue: list[tuple[float, int]] = []
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: set[asyncio.Task] = set()
+        self._dirty = False
+        self._saved_at = 0.0
+        self._sites_stamp: Optional[int] = None  # mtime_ns of the stamp at the last refresh
+        self._snapshot: tuple[Optional[int], dict[int, dict]] = (None, {})  # (mtime_ns, health by site)
+
+    def get(self, site_id: int) -> Optional[dict]:
+        return self._load().get(site_id)
+
+    def all(self) -> list[dict]:
+        return [health for _, health in sorted(self._load().items())]
+
+    async def run(self):
+        """Scheduler loop: refresh the site list periodically and dispatch due probes"""
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            follow_redirects=False,
+        )
+        next_refresh = 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= next_refresh or self._read_sites_stamp() != self._sites_stamp:
+                    await self._refresh_sites()
+                    next_refresh = now + settings.HEALTH_CHECK_REFRESH_INTERVAL
+                while self._queue and self._queue[0][0] <= now:
+                    due, site_id = heapq.heappop(self._queue)
+                    if site_id not in self._sites:
+                        continue
+                    # Next slot keeps the site's phase; jitter only spreads within ±5%
+                    jitter = random.uniform(-0.05, 0.05) * self.interval
+                    heapq.heappush(self._queue, (max(now, due + self.interval + jitter), site_id))
+                    task = asyncio.create_task(self._check(self._sites[site_id]))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                if self._dirty and now - self._saved_at >= SNAPSHOT_INTERVAL:
+                    self._save()
+                sleep_for = self._queue[0][0] - time.monotonic() if self._queue else 1.0
+                await asyncio.sleep(min(max(sleep_for, 0.01), 1.0))
+        finally:
+            for task in list(self._inflight):
+                task.cancel()
+            await self._client.aclose()
+
+    def _path(self) -> str:
+        return os.path.join(settings.RUNTIME_DIR, "health.json")
+
+    def _save(self):
+        path = self._path()
+        os.makedirs(settings.RUNTIME_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump([h.to_dict() for h in sorted(self.health.values(), key=lambda h: h.site_id)], f)
+        os.replace(path + ".tmp", path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _load(self) -> dict[int, dict]:
+        """Health snapshot written by the leader, re-read only when the file changed"""
+        try:
+            mtime = os.stat(self._path()).st_mtime_ns
+        except OSError:
+            return {}
+        if self._snapshot[0] != mtime:
+            try:
+                with open(self._path(), "r") as f:
+                    self._snapshot = (mtime, {h["site_id"]: h for h in json.load(f)})
+            except (OSError, ValueError, KeyError, TypeError):
+                return self._snapshot[1]
+        return self._snapshot[1]
+
+    def _read_sites_stamp(self) -> Optional[int]:
+        try:
+            return os.stat(sites_stamp_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    async def _refresh_sites(self):
+        from app.core.database import AsyncSessionLocal
+        # Read the stamp first: an invalidation during the query triggers another refresh
+        self._sites_stamp = self._read_sites_stamp()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Site).where(Site.status == SiteStatus.ACTIVE, Site.site_type != SiteType.STATIC)
+            )
+            sites = {site.id: site for site in result.scalars().all()}
+        now = time.monotonic()
+        for site_id in sites.keys() - self._sites.keys():
+            # Spread first probes evenly over the interval (golden-ratio phase per site id)
+            phase = (site_id * GOLDEN_RATIO) % 1.0 * self.interval
+            heapq.heappush(self._queue, (now + phase, site_id))
+            self.health.setdefault(site_id, SiteHealth(site_id=site_id))
+        for site_id in self._sites.keys() - sites.keys():
+            self.health.pop(site_id, None)
+        self._sites = sites
+        self._dirty = True
+
+    async def _check(self, site: Site):
+        async with self._semaphore:
+            ok, code, latency, error = await probe(self._client, site.worker_port, health_path(site), self.timeout)
+        health = self.health.setdefault(site.id, SiteHealth(site_id=site.id))
+        self._dirty = True
+        health.last_checked = time.time()
+        health.latency_ms = round(latency, 2)
+        health.status_code = code
+        if ok:
+            health.state = "healthy"
+            health.consecutive_failures = 0
+            health.last_ok = health.last_checked
+            health.last_error = None
+            return
+
+        health.consecutive_failures += 1
+        health.last_error = error
+        if health.consecutive_failures < settings.HEALTH_FAILURE_THRESHOLD:
+            return
+        health.state = "down" if code is None else "degraded"
+        if health.consecutive_failures >= settings.HEALTH_RESTART_THRESHOLD:
+            await self._remediate(site, health)
+
+    async def _remediate(self, site: Site, health: SiteHealth):
+        """Restart a failing worker, at most once per HEALTH_RESTART_BACKOFF seconds"""
+        now = time.time()
+        if health.last_restart and now - health.last_restart < settings.HEALTH_RESTART_BACKOFF:
+            return
+        from app.services.frankenphp_service import FrankenPHPService
+        health.last_restart = now
+        health.restarts += 1
+        logger.warning("Restarting worker for site %s after %s failed probes", site.id, health.consecutive_failures)
+        try:
+            await FrankenPHPService().restart_worker(site)
+        except Exception:
+            logger.exception("Restart of worker for site %s failed", site.id)
+
+
+_prober: Optional[HealthProber] = None
+
+
+def get_health_prober() -> HealthProber:
+    """Process-wide health prober"""
+    global _prober
+    if _prober is None:
+        _prober = HealthProber()
+    return _prober
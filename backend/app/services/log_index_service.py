@@ -0,0 +1,380 @@
+"""
+Incremental inverted index over worker logs for cross-site search
+"""
+from app.core.config import settings
+from app.services.log_service import LogSegments
+from array import array
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import time
+from typing import Iterable, Optional
+
+# Index layout: <index dir>/<YYYYmmddHH>/<seq>.{dat,post,tok}, one immutable chunk per
+# ingest cycle and hour bucket. .dat holds records, .post record offsets grouped by
+# token, .tok a sorted table of (token hash, first posting, posting count). The .tok
+# file is written last and marks the chunk as complete.
+RECORD = struct.Struct("<IdQI")  # site_id, timestamp, virtual log offset, line length
+TOKEN = struct.Struct("<QII")  # token hash, posting start, posting count
+MAX_CHUNK_BYTES = 256 * 1024 * 1024
+MAX_LINE_BYTES = 16 * 1024
+
+_TOKEN_RE = re.compile(rb"[a-z0-9_]{2,64}")
+_ISO_RE = re.compile(rb"^\[?(\d{4})[-/](\d{2})[-/](\d{2})[T ](\d{2}):(\d{2}):(\d{2})")
+_LOG_FILE_RE = re.compile(r"^frankenphp_(\d+)\.log$")
+
+
+def token_hash(token: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(token, digest_size=8).digest(), "little")
+
+
+def site_token(site_id: int) -> int:
+    """Pseudo-token indexing every line of a site, used for site filters"""
+    return token_hash(b"\x00site:%d" % site_id)
+
+
+def tokenize(text: bytes) -> set[bytes]:
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def line_timestamp(line: bytes, default: float) -> float:
+    """Timestamp of a log line: JSON "ts" (Caddy/FrankenPHP) or a leading ISO date, else default"""
+    if line.startswith(b"{"):
+        try:
+            ts = json.loads(line).get("ts")
+            if isinstance(ts, (int, float)):
+                return float(ts)
+            if isinstance(ts, str):
+                return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except (ValueError, AttributeError):
+            pass
+    match = _ISO_RE.match(line)
+    if match:
+        try:
+            parts = [int(p) for p in match.groups()]
+            return datetime(*parts, tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            pass
+    return default
+
+
+def bucket_name(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d%H")
+
+
+def bucket_start(name: str) -> float:
+    return datetime.strptime(name, "%Y%m%d%H").replace(tzinfo=timezone.utc).timestamp()
+
+
+class _ChunkBuilder:
+    """Accumulates records and postings for one chunk in memory"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.postings: dict[int, array] = {}  # Token hash -> record offsets, 4 bytes each
+
+    def add(self, site_id: int, ts: float, offset: int, line: bytes):
+        line = line[:MAX_LINE_BYTES]
+        position = len(self.data)
+        self.data += RECORD.pack(site_id, ts, offset, len(line))
+        self.data += line
+        for key in [token_hash(token) for token in tokenize(line)] + [site_token(site_id)]:
+            entries = self.postings.get(key)
+            if entries is None:
+                entries = self.postings[key] = array("I")
+            entries.append(position)
+
+    def write(self, directory: str, seq: int) -> str:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{seq:010d}")
+        posts = array("I")
+        tokens = bytearray()
+        for key in sorted(self.postings):
+            entries = self.postings[key]
+            tokens += TOKEN.pack(key, len(posts), len(entries))
+            posts.extend(entries)
+        for ext, payload in ((".dat", self.data), (".post", posts.tobytes()), (".tok", tokens)):
+            with open(base + ext + ".tmp", "wb") as f:
+                f.write(payload)
+            os.replace(base + ext + ".tmp", base + ext)
+        return base
+
+
+class _Chunk:
+    """Memory-mapped, read-only view of a chunk"""
+
+    def __init__(self, base: str):
+        self._files = []
+        self.dat = self._map(base + ".dat")
+        self.post = self._map(base + ".post")
+        self.tok = self._map(base + ".tok")
+        self.count = len(self.tok) // TOKEN.size if self.tok else 0
+
+    def _map(self, path: str):
+        f = open(path, "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def lookup(self, key: int) -> list[int]:
+        """Record positions for a token hash (binary search over the token table)"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = struct.unpack_from("<Q", self.tok, mid * TOKEN.size)[0]
+            if value < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count:
+            return []
+        value, start, count = TOKEN.unpack_from(self.tok, lo * TOKEN.size)
+        if value != key:
+            return []
+        return array("I", self.post[start * 4:(start + count) * 4]).tolist()
+
+    def record(self, position: int) -> tuple[int, float, int, bytes]:
+        site_id, ts, offset, length = RECORD.unpack_from(self.dat, position)
+        start = position + RECORD.size
+        return site_id, ts, offset, bytes(self.dat[start:start + length])
+
+    def records(self) -> Iterable[tuple[int, float, int, bytes]]:
+        position = 0
+        while position < len(self.dat):
+            record = self.record(position)
+            yield record
+            position += RECORD.size + len(record[3])
+
+    def close(self):
+        for m in (self.dat, self.post, self.tok):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        for f in self._files:
+            f.close()
+
+
+class LogIndexService:
+    """Ingests frankenphp_{site_id}.log files into hourly indexed buckets and searches them"""
+
+    def __init__(self, logs_dir: Optional[str] = None, index_dir: Optional[str] = None):
+        self.logs_dir = logs_dir or settings.LOGS_DIR
+        self.index_dir = index_dir or settings.LOG_INDEX_DIR or os.path.join(self.logs_dir, "index")
+        self.checkpoint_file = os.path.join(self.index_dir, "checkpoints.json")
+
+    def ingest(self, max_lines_per_site: int = 100_000) -> int:
+        """Index new lines of every worker log since the last checkpoint; returns lines indexed"""
+        checkpoints = self._load_checkpoints()
+        builders: dict[str, _ChunkBuilder] = {}
+        now = time.time()
+        total = 0
+        try:
+            entries = os.listdir(self.logs_dir)
+        except OSError:
+            return 0
+
+        for entry in entries:
+            match = _LOG_FILE_RE.match(entry)
+            if not match:
+                continue
+            site_id = int(match.group(1))
+            log = LogSegments(os.path.join(self.logs_dir, entry))
+            offset = checkpoints.get(str(site_id), 0)
+            indexed = 0
+            while indexed < max_lines_per_site:
+                # Raw lines with their virtual offsets: decoding and re-encoding would shift them
+                records, next_offset = log.read_records(offset, 5000)
+                if next_offset == offset:
+                    break
+                for position, raw in records:
+                    ts = line_timestamp(raw, now)
+                    builder = builders.setdefault(bucket_name(ts), _ChunkBuilder())
+                    builder.add(site_id, ts, position, raw)
+                indexed += len(records)
+                offset = checkpoints[str(site_id)] = next_offset
+                if sum(len(b.data) for b in builders.values()) > MAX_CHUNK_BYTES:
+                    # Checkpoint with every flush, or a crash later in the run re-indexes this chunk
+                    self._flush(builders)
+                    self._save_checkpoints(checkpoints)
+            total += indexed
+
+        self._flush(builders)
+        self._save_checkpoints(checkpoints)
+        return total
+
+    def search(
+        self,
+        query: str = "",
+        site_ids: Optional[list[int]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Lines containing every term of query, newest first"""
+        terms = sorted(tokenize(query.encode()))
+        if not terms and not site_ids:
+            raise ValueError("Provide search terms or a site filter")
+        term_keys = [token_hash(t) for t in terms]
+        site_keys = [site_token(s) for s in site_ids or []]
+        results: list[dict] = []
+
+        for bucket in sorted(self._buckets(), reverse=True):
+            start = bucket_start(bucket)
+            if until is not None and start > until:
+                continue
+            if since is not None and start + 3600 <= since:
+                break
+            for base in sorted(self._chunks(bucket), reverse=True):
+                try:
+                    chunk = _Chunk(base)
+                except OSError:
+                    continue  # Removed by a concurrent compaction
+                try:
+                    self._search_chunk(chunk, terms, term_keys, site_keys, since, until, limit, results)
+                finally:
+                    chunk.close()
+            if len(results) >= limit:
+                break
+
+        results.sort(key=lambda r: r["timestamp"], reverse=True)
+        return results[:limit]
+
+    def compact(self) -> int:
+        """Merge the chunks of sealed (past) hour buckets into chunks of up to MAX_CHUNK_BYTES; returns chunks written"""
+        current = bucket_name(time.time())
+        compacted = 0
+        for bucket in self._buckets():
+            chunks = sorted(self._chunks(bucket))
+            if bucket >= current or len(chunks) < 2:
+                continue
+            seq = int(os.path.basename(chunks[-1]))
+            for run in self._compaction_runs(chunks):
+                seq += 1
+                self._merge(run, os.path.join(self.index_dir, bucket), seq)
+                compacted += 1
+        return compacted
+
+    def prune(self, retention_days: Optional[int] = None) -> int:
+        """Delete buckets older than the retention period"""
+        days = settings.LOG_INDEX_RETENTION_DAYS if retention_days is None else retention_days
+        cutoff = bucket_name(time.time() - days * 86400)
+        removed = 0
+        for bucket in self._buckets():
+            if bucket < cutoff:
+                shutil.rmtree(os.path.join(self.index_dir, bucket), ignore_errors=True)
+                removed += 1
+        return removed
+
+    async def run(self):
+        """Ingest, compact and prune off the event loop"""
+        await asyncio.to_thread(self.ingest)
+        await asyncio.to_thread(self.compact)
+        await asyncio.to_thread(self.prune)
+
+    def _search_chunk(self, chunk, terms, term_keys, site_keys, since, until, limit, results):
+        candidates: Optional[set[int]] = None
+        for positions in sorted((chunk.lookup(key) for key in term_keys), key=len):
+            candidates = set(positions) if candidates is None else candidates.intersection(positions)
+            if not candidates:
+                return
+        if site_keys:
+            in_sites = set()
+            for key in site_keys:
+                in_sites.update(chunk.lookup(key))
+            candidates = in_sites if candidates is None else candidates & in_sites
+        for position in sorted(candidates or (), reverse=True):
+            site_id, ts, offset, line = chunk.record(position)
+            if (since is not None and ts < since) or (until is not None and ts > until):
+                continue
+            lowered = line.lower()
+            if any(term not in lowered for term in terms):
+                continue  # Hash collision
+            results.append({
+                "site_id": site_id,
+                "timestamp": ts,
+                "offset": offset,
+                "line": line.decode("utf-8", "replace"),
+            })
+            if len(results) >= limit:
+                return
+
+    def _compaction_runs(self, chunks: list[str]) -> list[list[str]]:
+        """Consecutive chunks whose records fit one chunk of MAX_CHUNK_BYTES; single chunks are left alone"""
+        runs, run, run_bytes = [], [], 0
+        for base in chunks:
+            try:
+                size = os.path.getsize(base + ".dat")
+            except OSError:
+                continue
+            if run and run_bytes + size > MAX_CHUNK_BYTES:
+                runs.append(run)
+                run, run_bytes = [], 0
+            run.append(base)
+            run_bytes += size
+        runs.append(run)
+        return [run for run in runs if len(run) > 1]
+
+    def _merge(self, chunks: list[str], directory: str, seq: int):
+        builder = _ChunkBuilder()
+        for base in chunks:
+            chunk = _Chunk(base)
+            try:
+                for site_id, ts, offset, line in chunk.records():
+                    builder.add(site_id, ts, offset, line)
+            finally:
+                chunk.close()
+        builder.write(directory, seq)
+        for base in chunks:
+            for ext in (".tok", ".post", ".dat"):
+                try:
+                    os.remove(base + ext)
+                except OSError:
+                    pass
+
+    def _buckets(self) -> list[str]:
+        try:
+            return [d for d in os.listdir(self.index_dir) if d.isdigit() and len(d) == 10]
+        except OSError:
+            return []
+
+    def _chunks(self, bucket: str) -> list[str]:
+        directory = os.path.join(self.index_dir, bucket)
+        try:
+            return [os.path.join(directory, f[:-4]) for f in os.listdir(directory) if f.endswith(".tok")]
+        except OSError:
+            return []
+
+    def _flush(self, builders: dict[str, _ChunkBuilder]):
+        for bucket, builder in builders.items():
+            if not builder.data:
+                continue
+            directory = os.path.join(self.index_dir, bucket)
+            existing = self._chunks(bucket)
+            seq = max((int(os.path.basename(c)) for c in existing), default=0) + 1
+            builder.write(directory, seq)
+        builders.clear()
+
+    def _load_checkpoints(self) -> dict:
+        try:
+            with open(self.checkpoint_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoints(self, checkpoints: dict):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self.checkpoint_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoints, f)
+        os.replace(tmp_path, self.checkpoint_file)
+
+
+async def index_worker_logs():
+    """Background job: incremental log indexing"""
+    await LogIndexService().run()
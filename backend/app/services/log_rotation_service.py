@@ -0,0 +1,159 @@
+"""
+Worker log rotation, background compression and retention
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.site import Site
+from app.core.config import settings
+from app.services.log_service import LogSegments, worker_log_path, zstandard
+import asyncio
+import gzip
+import os
+import shutil
+import time
+from typing import Optional
+
+COPY_CHUNK = 4 * 1024 * 1024
+
+
+class LogRotationService:
+    """Rotates frankenphp_{site_id}.log by size or age and compresses rotated segments"""
+
+    def __init__(self, compression: Optional[str] = None):
+        self.compression = (compression or settings.LOG_COMPRESSION).lower()
+        if self.compression == "zstd" and zstandard is None:
+            self.compression = "gzip"
+
+    def should_rotate(self, site_id: int, max_bytes: int, max_age: float) -> bool:
+        """True when the current log exceeds max_bytes or was last rotated max_age seconds ago"""
+        path = worker_log_path(site_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if max_bytes and size >= max_bytes:
+            return True
+        try:
+            rotated_at = os.path.getmtime(path + ".base")
+        except OSError:
+            LogSegments(path).set_base(0)  # Start the rotation clock
+            return False
+        return bool(max_age) and time.time() - rotated_at >= max_age
+
+    def rotate(self, site_id: int, running: bool) -> Optional[str]:
+        """Move the current log into a segment; returns the segment path.
+
+        A stopped worker's log is simply renamed. A running worker keeps its
+        O_APPEND file descriptor, so its log is copied and truncated in place
+        and the worker continues writing at offset 0 of the same file.
+        """
+        path = worker_log_path(site_id)
+        log = LogSegments(path)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        base = log.base()
+
+        if not running:
+            size = os.path.getsize(path)
+            segment = f"{path}.{base}-{base + size}"
+            os.rename(path, segment)
+            log.set_base(base + size)
+            return segment
+
+        tmp_path = f"{path}.rotating"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            copied = self._copy_all(src, dst)
+            # Truncate immediately after catching up so the loss window is minimal
+            os.truncate(path, 0)
+        segment = f"{path}.{base}-{base + copied}"
+        os.replace(tmp_path, segment)
+        log.set_base(base + copied)
+        return segment
+
+    def compress(self, segment_path: str) -> str:
+        """Compress a plain segment next to itself and remove the original"""
+        if self.compression == "zstd":
+            target = segment_path + ".zst"
+            with open(segment_path, "rb") as src, open(target + ".tmp", "wb") as dst:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, dst)
+        else:
+            target = segment_path + ".gz"
+            with open(segment_path, "rb") as src, gzip.open(target + ".tmp", "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+        os.replace(target + ".tmp", target)
+        os.remove(segment_path)
+        return target
+
+    def compress_pending(self, site_id: int) -> int:
+        """Compress every uncompressed segment of a site (resumable after a crash)"""
+        log = LogSegments(worker_log_path(site_id))
+        count = 0
+        for segment in log.segments():
+            if not segment.compressed:
+                self.compress(segment.path)
+                count += 1
+        return count
+
+    def enforce_retention(self, site_id: int, max_segments: int, max_age: float) -> int:
+        """Delete the oldest segments beyond max_segments or older than max_age seconds"""
+        log = LogSegments(worker_log_path(site_id))
+        segments = log.segments()
+        now = time.time()
+        removed = 0
+        for index, segment in enumerate(segments):
+            keep_count = len(segments) - index <= max_segments if max_segments else True
+            try:
+                fresh = not max_age or now - os.path.getmtime(segment.path) < max_age
+            except OSError:
+                continue
+            if keep_count and fresh:
+                continue
+            for suffix in ("", ".gz", ".zst"):
+                plain = f"{log.path}.{segment.start}-{segment.end}{suffix}"
+                if os.path.exists(plain):
+                    os.remove(plain)
+            removed += 1
+        return removed
+
+    async def run(self, db: AsyncSession):
+        """Rotate, compress and prune the logs of all sites"""
+        from app.services.frankenphp_service import FrankenPHPService
+        frankenphp_service = FrankenPHPService()
+        result = await db.execute(select(Site))
+        for site in result.scalars().all():
+            config = site.config or {}
+            max_bytes = int(config.get("log_max_bytes", settings.LOG_ROTATE_MAX_BYTES))
+            max_age = settings.LOG_ROTATE_INTERVAL_HOURS * 3600
+            if self.should_rotate(site.id, max_bytes, max_age):
+                status = await frankenphp_service.get_worker_status(site)
+                await asyncio.to_thread(self.rotate, site.id, status["status"] == "running")
+            await asyncio.to_thread(self.compress_pending, site.id)
+            await asyncio.to_thread(
+                self.enforce_retention,
+                site.id,
+                int(config.get("log_retention_segments", settings.LOG_RETENTION_SEGMENTS)),
+                float(config.get("log_retention_days", settings.LOG_RETENTION_DAYS)) * 86400,
+            )
+
+    def _copy_all(self, src, dst) -> int:
+        """Copy src to dst until src stops growing; returns bytes copied"""
+        copied = 0
+        while True:
+            try:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK)
+            except (AttributeError, OSError):
+                chunk = os.read(src.fileno(), COPY_CHUNK)
+                os.write(dst.fileno(), chunk)
+                n = len(chunk)
+            if n == 0:
+                return copied
+            copied += n
+
+
+async def rotate_worker_logs():
+    """Background job: periodic log rotation for all sites"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await LogRotationService().run(db)
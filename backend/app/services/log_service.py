@@ -0,0 +1,449 @@
+"""
+Worker log reading: reverse-seek tailing, cursors, filtering and live follow
+"""
+from app.core.config import settings
+from collections import deque
+import asyncio
+import ctypes
+import ctypes.util
+import gzip
+import io
+import json
+import os
+import re
+import struct
+from typing import AsyncIterator, BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for LOG_COMPRESSION=zstd
+    zstandard = None
+
+BLOCK_SIZE = 64 * 1024
+MAX_LINE_BYTES = 64 * 1024  # Longer lines are truncated so memory stays bounded
+
+LEVELS = {"debug": 0, "info": 1, "notice": 1, "warn": 2, "warning": 2, "error": 3, "fatal": 4, "critical": 4, "panic": 4}
+_SEGMENT_RE = re.compile(r"^(\d+)-(\d+)(?:\.gz|\.zst)?$")
+_LEVEL_RE = re.compile(rb"\b(debug|info|notice|warn(?:ing)?|error|fatal|critical|panic)\b", re.IGNORECASE)
+
+
+class LogFilter:
+    """Server-side line filter by regex and minimum level"""
+
+    def __init__(self, pattern: Optional[str] = None, level: Optional[str] = None):
+        self.regex = re.compile(pattern.encode()) if pattern else None
+        if level is not None and level.lower() not in LEVELS:
+            raise ValueError(f"Unknown log level: {level}")
+        self.min_level = LEVELS[level.lower()] if level else None
+
+    def __bool__(self) -> bool:
+        return self.regex is not None or self.min_level is not None
+
+    def matches(self, line: bytes) -> bool:
+        if self.regex is not None and not self.regex.search(line):
+            return False
+        if self.min_level is not None:
+            level = line_level(line)
+            if level is None or level < self.min_level:
+                return False
+        return True
+
+
+def line_level(line: bytes) -> Optional[int]:
+    """Severity of a log line: "level" of JSON (Caddy/FrankenPHP) lines, else first level keyword"""
+    if line.startswith(b"{"):
+        try:
+            value = json.loads(line).get("level")
+            if isinstance(value, str) and value.lower() in LEVELS:
+                return LEVELS[value.lower()]
+        except (ValueError, AttributeError):
+            pass
+    match = _LEVEL_RE.search(line, 0, 512)
+    return LEVELS[match.group(1).lower().decode()] if match else None
+
+
+def tail(
+    path: str,
+    lines: int = 100,
+    before: Optional[int] = None,
+    log_filter: Optional[LogFilter] = None,
+) -> tuple[list[str], int, int]:
+    """Last `lines` matching lines ending at byte offset `before` (default: end of file).
+
+    Reads the file backwards in fixed blocks, so cost depends on the lines
+    returned, not the file size. Returns (lines oldest first, start offset,
+    end offset); pass the start offset as `before` to page further back.
+    """
+    found: list[bytes] = []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        end = size if before is None else max(0, min(before, size))
+        start = end
+        pos = end
+        data = b""  # Bytes [pos, end of the line being assembled)
+        first = True
+
+        def examine(line: bytes, line_start: int):
+            nonlocal start
+            start = line_start
+            if log_filter is None or not log_filter or log_filter.matches(line):
+                found.append(line[:MAX_LINE_BYTES])
+
+        while pos > 0 and len(found) < lines:
+            read_size = min(BLOCK_SIZE, pos)
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+            if first:
+                first = False
+                if data.endswith(b"\n"):
+                    data = data[:-1]  # Terminator of the last line in range
+            while len(found) < lines:
+                i = data.rfind(b"\n")
+                if i < 0:
+                    break
+                examine(data[i + 1:], pos + i + 1)
+                data = data[:i]
+            if len(data) > MAX_LINE_BYTES:
+                data = data[:MAX_LINE_BYTES]  # Keep only the head of an overlong line
+        if pos == 0 and len(found) < lines and end > 0 and start > 0:
+            examine(data, 0)
+    found.reverse()
+    return [line.decode("utf-8", "replace") for line in found], start, end
+
+
+def read_forward(
+    path: str,
+    after: int = 0,
+    lines: int = 100,
+    log_filter: Optional[LogFilter] = None,
+) -> tuple[list[str], int]:
+    """Up to `lines` complete matching lines starting at byte offset `after`; returns (lines, next offset)"""
+    records, offset = read_records(path, after, lines, log_filter)
+    return [line.decode("utf-8", "replace") for _, line in records], offset
+
+
+def read_records(
+    path: str,
+    after: int = 0,
+    lines: int = 100,
+    log_filter: Optional[LogFilter] = None,
+) -> tuple[list[tuple[int, bytes]], int]:
+    """Like read_forward(), but undecoded lines with the byte offset each starts at"""
+    with open(path, "rb") as f:
+        f.seek(after)
+        return _read_records(f, after, lines, log_filter, complete_only=True)
+
+
+def _read_records(
+    f: BinaryIO,
+    offset: int,
+    lines: int,
+    log_filter: Optional[LogFilter],
+    complete_only: bool,
+) -> tuple[list[tuple[int, bytes]], int]:
+    found: list[tuple[int, bytes]] = []
+    while len(found) < lines:
+        line = f.readline(MAX_LINE_BYTES)
+        if not line or complete_only and not line.endswith(b"\n") and len(line) < MAX_LINE_BYTES:
+            break  # EOF or a line still being written
+        start = offset
+        offset += len(line)
+        line = line.rstrip(b"\n")
+        if log_filter is None or not log_filter or log_filter.matches(line):
+            found.append((start, line))
+    return found, offset
+
+
+class InotifyWatcher:
+    """Minimal inotify binding (via libc) that wakes an asyncio waiter on file changes"""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVE_SELF = 0x00000800
+    IN_DELETE_SELF = 0x00000400
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    _libc = None
+
+    def __init__(self, path: str):
+        libc = self._load_libc()
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVE_SELF | self.IN_DELETE_SELF
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.fd, self._on_readable)
+        self.moved = False
+
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            cls._libc = libc
+        return cls._libc
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + 16 <= len(data):
+            _, mask, _, name_len = struct.unpack_from("iIII", data, offset)
+            if mask & (self.IN_MOVE_SELF | self.IN_DELETE_SELF):
+                self.moved = True
+            offset += 16 + name_len
+        self._event.set()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+    def close(self):
+        self._loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+def open_segment(path: str):
+    """Open a log segment for binary reading, decompressing .gz/.zst transparently"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise OSError(f"zstandard is not installed, cannot read {path}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+
+class Segment:
+    """A rotated log segment covering virtual byte offsets [start, end)"""
+
+    __slots__ = ("path", "start", "end")
+
+    def __init__(self, path: str, start: int, end: int):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def compressed(self) -> bool:
+        return self.path.endswith((".gz", ".zst"))
+
+    def tail(self, lines: int, before: int, log_filter: Optional[LogFilter]) -> tuple[list[str], int]:
+        """Last matching lines ending at local offset `before`; returns (lines, local start)"""
+        if not self.compressed:
+            found, start, _ = tail(self.path, lines, before, log_filter)
+            return found, start
+        # Compressed segments cannot seek backwards: stream forward keeping a bounded window
+        window: deque = deque(maxlen=lines)
+        offset = 0
+        with open_segment(self.path) as f:
+            while offset < before:
+                line = f.readline(MAX_LINE_BYTES)
+                if not line:
+                    break
+                line_start = offset
+                offset += len(line)
+                if offset > before:
+                    break
+                line = line.rstrip(b"\n")
+                if log_filter is None or not log_filter or log_filter.matches(line):
+                    window.append((line_start, line))
+        start = window[0][0] if len(window) == lines else 0
+        return [line.decode("utf-8", "replace") for _, line in window], start
+
+    def read_forward(self, after: int, lines: int, log_filter: Optional[LogFilter]) -> tuple[list[str], int]:
+        """Matching lines from local offset `after`; returns (lines, next local offset)"""
+        records, offset = self.read_records(after, lines, log_filter)
+        return [line.decode("utf-8", "replace") for _, line in records], offset
+
+    def read_records(
+        self, after: int, lines: int, log_filter: Optional[LogFilter]
+    ) -> tuple[list[tuple[int, bytes]], int]:
+        """Like read_forward(), but undecoded lines with their local start offsets"""
+        if not self.compressed:
+            return read_records(self.path, after, lines, log_filter)
+        offset = 0
+        with open_segment(self.path) as f:
+            while offset < after:
+                skipped = len(f.read(min(BLOCK_SIZE, after - offset)))
+                if not skipped:
+                    return [], offset
+                offset += skipped
+            # Nothing is appended to a rotated segment, so a last line without a newline is complete
+            return _read_records(f, offset, lines, log_filter, complete_only=False)
+
+
+class LogSegments:
+    """A worker log plus its rotated segments, addressed by stable virtual byte offsets.
+
+    Rotated segments are named ``<log>.<start>-<end>[.gz|.zst]`` and the current
+    file starts at the offset stored in ``<log>.base``, so cursors stay valid
+    across rotation, compression and retention.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.directory = os.path.dirname(path)
+        self.prefix = os.path.basename(path) + "."
+
+    def segments(self) -> list[Segment]:
+        """Rotated segments, oldest first (a plain and a compressed copy of one range count once)"""
+        found: dict[int, Segment] = {}
+        try:
+            entries = os.listdir(self.directory)
+        except OSError:
+            return []
+        for entry in entries:
+            match = _SEGMENT_RE.match(entry[len(self.prefix):]) if entry.startswith(self.prefix) else None
+            if not match:
+                continue
+            start, end = int(match.group(1)), int(match.group(2))
+            segment = Segment(os.path.join(self.directory, entry), start, end)
+            if start not in found or not segment.compressed:
+                found[start] = segment
+        return [found[start] for start in sorted(found)]
+
+    def base(self) -> int:
+        """Virtual offset of the first byte of the current file"""
+        try:
+            with open(self.path + ".base", "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def set_base(self, base: int):
+        tmp_path = self.path + ".base.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(base))
+        os.replace(tmp_path, self.path + ".base")
+
+    def end(self) -> int:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return self.base() + size
+
+    def tail(
+        self,
+        lines: int = 100,
+        before: Optional[int] = None,
+        log_filter: Optional[LogFilter] = None,
+    ) -> tuple[list[str], int, int]:
+        """Like tail(), across the current file and its rotated segments"""
+        base = self.base()
+        end = self.end() if before is None else min(before, self.end())
+        pages: list[list[str]] = []
+        remaining = lines
+        start = end
+        if end > base and os.path.exists(self.path):
+            found, local_start, _ = tail(self.path, remaining, end - base, log_filter)
+            pages.append(found)
+            remaining -= len(found)
+            start = base + local_start
+        for segment in reversed(self.segments()):
+            if remaining <= 0:
+                break
+            if segment.start >= start:
+                continue
+            found, local_start = segment.tail(remaining, min(start, segment.end) - segment.start, log_filter)
+            pages.append(found)
+            remaining -= len(found)
+            start = segment.start + local_start
+        result = [line for page in reversed(pages) for line in page]
+        return result, start, end
+
+    def read_forward(
+        self,
+        after: int,
+        lines: int = 100,
+        log_filter: Optional[LogFilter] = None,
+    ) -> tuple[list[str], int]:
+        """Like read_forward(), continuing from rotated segments into the current file"""
+        records, offset = self.read_records(after, lines, log_filter)
+        return [line.decode("utf-8", "replace") for _, line in records], offset
+
+    def read_records(
+        self,
+        after: int,
+        lines: int = 100,
+        log_filter: Optional[LogFilter] = None,
+    ) -> tuple[list[tuple[int, bytes]], int]:
+        """Like read_forward(), but undecoded lines with the virtual offset each starts at"""
+        base = self.base()
+        if after < base:
+            for segment in self.segments():
+                if segment.end <= after:
+                    continue
+                local = max(0, after - segment.start)
+                found, local_next = segment.read_records(local, lines, log_filter)
+                found = [(segment.start + start, line) for start, line in found]
+                if len(found) < lines:
+                    return found, segment.end  # Segment exhausted; continue with the next one
+                return found, segment.start + local_next
+            after = base
+        if not os.path.exists(self.path):
+            return [], after
+        local = min(after - base, os.path.getsize(self.path))
+        found, local_next = read_records(self.path, local, lines, log_filter)
+        return [(base + start, line) for start, line in found], base + local_next
+
+
+async def follow(
+    path: str,
+    offset: Optional[int] = None,
+    log_filter: Optional[LogFilter] = None,
+    heartbeat: float = 15.0,
+) -> AsyncIterator[tuple[list[str], int]]:
+    """Yield (new lines, next virtual offset) as the log grows; yields ([], offset) as a heartbeat.
+
+    Woken by inotify; falls back to polling once per second where inotify is
+    unavailable. Survives rotation: lines moved into a segment before they
+    were read are served from the segment.
+    """
+    log = LogSegments(path)
+    if offset is None:
+        offset = log.end()
+    watcher: Optional[InotifyWatcher] = None
+    try:
+        while True:
+            if watcher is None and os.path.exists(path):
+                try:
+                    watcher = InotifyWatcher(path)
+                except (OSError, AttributeError):
+                    watcher = None
+            lines, next_offset = log.read_forward(offset, 500, log_filter)
+            caught_up = next_offset == offset or next_offset >= log.end()
+            offset = next_offset
+            yield lines, offset
+            if not caught_up:
+                continue
+            if watcher is not None:
+                await watcher.wait(heartbeat)
+                if watcher.moved:
+                    watcher.close()
+                    watcher = None  # Renamed away by rotation; watch the new file
+            else:
+                await asyncio.sleep(1.0)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def worker_log_path(site_id: int) -> str:
+    """Log file of a site's FrankenPHP worker"""
+    return os.path.join(settings.LOGS_DIR, f"frankenphp_{site_id}.log")
@@ -0,0 +1,227 @@
+"""
+Pooled MySQL/MariaDB administration connections that keep blocking I/O off the event loop
+"""
+from app.core.config import settings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Sequence
+import asyncio
+import logging
+import re
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+logger = logging.getLogger(__name__)
+
+# Names the panel generates (site slugs plus "_db"); anything else is refused before it reaches SQL
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z0-9_$-]{1,64}$")
+
+
+class MySQLAdminError(Exception):
+    """A MySQL administration operation failed or timed out"""
+    pass
+
+
+def quote_identifier(name: str) -> str:
+    if not _IDENTIFIER_RE.match(name):
+        raise MySQLAdminError(f"Invalid MySQL identifier: {name!r}")
+    return f"`{name}`"
+
+
+def connect(**options):
+    """A new root connection to the local server (socket or TCP, per settings)"""
+    options = {
+        "user": settings.MYSQL_ROOT_USER,
+        "password": settings.MYSQL_ROOT_PASSWORD,
+        "connection_timeout": settings.MYSQL_ADMIN_CONNECT_TIMEOUT,
+    } | options
+    if settings.MYSQL_SOCKET:
+        options["unix_socket"] = settings.MYSQL_SOCKET
+    else:
+        options.update(host=settings.MYSQL_HOST, port=settings.MYSQL_PORT)
+    return mysql.connector.connect(**options)
+
+
+class _PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection_id = connection.connection_id
+        self.released = time.monotonic()
+        self.broken = False
+
+
+class MySQLAdmin:
+    """Root connections to MySQL, reused across operations and used from a dedicated thread pool.
+
+    The pool has MYSQL_ADMIN_POOL_SIZE threads and at most as many
+    connections, created on demand and closed after MYSQL_ADMIN_IDLE_TIMEOUT
+    seconds unused. Every operation has a timeout; when it expires the
+    statement still running is killed (KILL QUERY) and its connection is
+    discarded rather than returned to the pool.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.MYSQL_ADMIN_POOL_SIZE
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="mysql-admin")
+        self._idle: list[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self.connects = 0
+
+    def _connect(self) -> _PooledConnection:
+        self.connects += 1
+        return _PooledConnection(connect(autocommit=True))
+
+    def _checkout(self) -> _PooledConnection:
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                return self._connect()
+            idle = now - pooled.released
+            if idle > settings.MYSQL_ADMIN_IDLE_TIMEOUT:
+                self._close(pooled)
+                continue
+            if idle > settings.MYSQL_ADMIN_PING_AFTER:
+                # Server-side wait_timeout may have dropped it
+                try:
+                    pooled.connection.ping(reconnect=False)
+                except Error:
+                    self._close(pooled)
+                    continue
+            return pooled
+
+    def _checkin(self, pooled: _PooledConnection):
+        if pooled.broken:
+            self._close(pooled)
+            return
+        pooled.released = time.monotonic()
+        with self._lock:
+            self._idle.append(pooled)
+
+    def _close(self, pooled: _PooledConnection):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _call(self, fn: Callable[[Any], Any], slot: dict) -> Any:
+        """Runs in a pool thread: check out a connection, run fn(cursor), check it back in"""
+        if slot.get("timed_out"):
+            # Timed out while queued for a thread; the caller is gone
+            return None
+        pooled = self._checkout()
+        slot["pooled"] = pooled
+        if slot.get("timed_out"):
+            # Timed out while connecting: the caller already saw a failure, so fn must not run.
+            # Set after "pooled" above, so run() either sees the connection to kill or we see this.
+            self._checkin(pooled)
+            return None
+        try:
+            cursor = pooled.connection.cursor()
+            try:
+                return fn(cursor)
+            finally:
+                cursor.close()
+        except Error:
+            # The session may be in any state after a failed statement
+            pooled.broken = True
+            raise
+        finally:
+            if slot.get("timed_out"):
+                pooled.broken = True
+            self._checkin(pooled)
+
+    async def run(self, fn: Callable[[Any], Any], timeout: Optional[float] = None) -> Any:
+        """Run fn(cursor) on a pooled connection without blocking the event loop"""
+        timeout = settings.MYSQL_ADMIN_TIMEOUT if timeout is None else timeout
+        slot: dict = {}
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, slot)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            slot["timed_out"] = True
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            pooled = slot.get("pooled")
+            if pooled is not None:
+                await self._kill(pooled.connection_id)
+            raise MySQLAdminError(f"MySQL operation timed out after {timeout}s")
+        except Error as e:
+            raise MySQLAdminError(str(e))
+
+    async def _kill(self, connection_id: int):
+        """Abort the statement a timed-out operation is still running, from outside the pool"""
+        def kill():
+            pooled = self._connect()
+            try:
+                cursor = pooled.connection.cursor()
+                cursor.execute(f"KILL QUERY {int(connection_id)}")
+                cursor.close()
+            finally:
+                self._close(pooled)
+        try:
+            await asyncio.wait_for(asyncio.to_thread(kill), settings.MYSQL_ADMIN_CONNECT_TIMEOUT + 2)
+        except Exception as e:
+            logger.warning("Could not kill MySQL query on connection %s: %s", connection_id, e)
+
+    async def execute(self, *statements: tuple[str, Sequence], timeout: Optional[float] = None):
+        """Run (sql, params) statements in order on one connection"""
+        def fn(cursor):
+            for sql, params in statements:
+                cursor.execute(sql, params or ())
+        await self.run(fn, timeout)
+
+    async def fetch_all(self, sql: str, params: Sequence = (), timeout: Optional[float] = None) -> list[tuple]:
+        def fn(cursor):
+            cursor.execute(sql, params or ())
+            return cursor.fetchall()
+        return await self.run(fn, timeout)
+
+    async def create_database(self, name: str, username: str, password: str):
+        """Database plus a local user with all privileges on it (idempotent)"""
+        database = quote_identifier(name)
+        quote_identifier(username)
+        await self.execute(
+            (f"CREATE DATABASE IF NOT EXISTS {database} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci", ()),
+            ("CREATE USER IF NOT EXISTS %s@'localhost' IDENTIFIED BY %s", (username, password)),
+            (f"GRANT ALL PRIVILEGES ON {database}.* TO %s@'localhost'", (username,)),
+        )
+
+    async def drop_database(self, name: str, username: str):
+        database = quote_identifier(name)
+        quote_identifier(username)
+        await self.execute(
+            (f"DROP DATABASE IF EXISTS {database}", ()),
+            ("DROP USER IF EXISTS %s@'localhost'", (username,)),
+        )
+
+    async def change_password(self, username: str, password: str):
+        quote_identifier(username)
+        await self.execute(("ALTER USER %s@'localhost' IDENTIFIED BY %s", (username, password)))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close(pooled)
+        self._executor.shutdown(wait=False)
+
+
+_admin: Optional[MySQLAdmin] = None
+
+
+def get_mysql_admin() -> MySQLAdmin:
+    """Process-wide MySQL admin pool"""
+    global _admin
+    if _admin is None:
+        _admin = MySQLAdmin()
+    return _admin
+
+
+def close_mysql_admin():
+    global _admin
+    if _admin is not None:
+        _admin.close()
+        _admin = None
@@ -0,0 +1,181 @@
+"""
+Per-site OPcache/preload configuration and post-start warmup
+"""
+from app.models.site import Site, SiteType
+from app.core.config import settings
+from dataclasses import dataclass, field, asdict
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+import httpx
+
+DEFAULT_WARMUP_URLS = {
+    SiteType.WORDPRESS: ["/", "/wp-login.php", "/wp-json/", "/feed/"],
+    SiteType.JOOMLA: ["/", "/administrator/"],
+}
+
+PRELOAD_TEMPLATE = """<?php
+// Generated by FrankenPanel: compile hot files into OPcache when the worker starts
+$root = {root};
+foreach ({patterns} as $pattern) {{
+    foreach (glob($root . '/' . $pattern) ?: [] as $file) {{
+        try {{
+            @opcache_compile_file($file);
+        }} catch (\\Throwable $e) {{
+            // Files that cannot be compiled standalone are compiled on first use instead
+        }}
+    }}
+}}
+"""
+
+
+@dataclass
+class WarmupReport:
+    """First-request latency of a worker before and after warmup"""
+    site_id: int
+    port: int
+    timestamp: float
+    sample_url: Optional[str] = None  # URL timed cold and warm
+    cold_ms: Optional[float] = None  # First request to the fresh worker
+    warm_ms: Optional[float] = None  # Same URL again after warmup
+    urls: int = 0
+    errors: int = 0
+    duration_ms: float = 0.0
+    failed_urls: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def php_config_dir(site_id: int) -> str:
+    """PHP_INI_SCAN_DIR entry with the site's generated .ini files"""
+    return os.path.join(settings.RUNTIME_DIR, "php", str(site_id))
+
+
+def preload_paths(site: Site) -> list[str]:
+    """Opt-in: preloaded files ignore validate_timestamps, so core updates need a worker reload"""
+    return list((site.config or {}).get("preload_paths") or [])
+
+
+def warmup_urls(site: Site) -> list[str]:
+    """Hot URLs of a site: config["warmup_urls"], else defaults for its type"""
+    urls = (site.config or {}).get("warmup_urls")
+    if urls is None:
+        urls = DEFAULT_WARMUP_URLS.get(site.site_type, ["/"])
+    return [url if url.startswith("/") else f"/{url}" for url in urls][: settings.WARMUP_MAX_URLS]
+
+
+def write_php_config(site: Site) -> str:
+    """Write opcache.ini (and preload.php) for a site; returns the config directory"""
+    config = site.config or {}
+    directory = php_config_dir(site.id)
+    os.makedirs(directory, exist_ok=True)
+
+    lines = [
+        "; Generated by FrankenPanel",
+        f"opcache.enable={1 if settings.OPCACHE_ENABLED else 0}",
+        "opcache.enable_cli=0",
+        f"opcache.memory_consumption={int(config.get('opcache_memory_mb', settings.OPCACHE_MEMORY_MB))}",
+        "opcache.interned_strings_buffer=16",
+        f"opcache.max_accelerated_files={int(config.get('opcache_max_files', settings.OPCACHE_MAX_FILES))}",
+        "opcache.validate_timestamps=1",
+        f"opcache.revalidate_freq={settings.OPCACHE_REVALIDATE_FREQ}",
+    ]
+    if settings.OPCACHE_FILE_CACHE:
+        # Second-level cache on disk: a restarted worker loads compiled scripts instead of recompiling
+        file_cache = os.path.join(directory, "file_cache")
+        os.makedirs(file_cache, exist_ok=True)
+        lines.append(f"opcache.file_cache={file_cache}")
+
+    preload_file = os.path.join(directory, "preload.php")
+    patterns = preload_paths(site)
+    if settings.OPCACHE_PRELOAD_ENABLED and patterns:
+        with open(preload_file, "w") as f:
+            f.write(PRELOAD_TEMPLATE.format(root=json.dumps(site.path), patterns=json.dumps(patterns)))
+        lines.append(f"opcache.preload={preload_file}")
+        lines.append(f"opcache.preload_user={settings.OPCACHE_PRELOAD_USER}")
+    elif os.path.exists(preload_file):
+        os.remove(preload_file)
+
+    ini_path = os.path.join(directory, "opcache.ini")
+    with open(ini_path + ".tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(ini_path + ".tmp", ini_path)
+    return directory
+
+
+async def warm_up(
+    site: Site,
+    port: int,
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    cold: Optional[tuple[str, float]] = None,
+) -> WarmupReport:
+    """Request a site's hot URLs on a fresh worker so its first real visitors hit warm OPcache.
+
+    cold is (path, latency ms) of a request already made to the worker, e.g. by the
+    readiness probe; without it the first hot URL is timed before the others.
+    """
+    concurrency = concurrency or settings.WARMUP_CONCURRENCY
+    timeout = timeout or settings.WARMUP_TIMEOUT
+    urls = warmup_urls(site)
+    report = WarmupReport(site_id=site.id, port=port, timestamp=time.time(), urls=len(urls))
+    if not urls:
+        return report
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(follow_redirects=False, timeout=timeout) as client:
+
+        async def fetch(url: str) -> Optional[float]:
+            async with semaphore:
+                request_started = time.perf_counter()
+                try:
+                    response = await client.get(f"http://127.0.0.1:{port}{url}")
+                except httpx.HTTPError:
+                    report.errors += 1
+                    report.failed_urls.append(url)
+                    return None
+                if response.status_code >= 500:
+                    report.errors += 1
+                    report.failed_urls.append(url)
+                return (time.perf_counter() - request_started) * 1000
+
+        if cold is not None:
+            report.sample_url, report.cold_ms = cold
+            await asyncio.gather(*(fetch(url) for url in urls))
+        else:
+            # The first URL alone measures the cold start; the rest warm up in parallel
+            report.sample_url = urls[0]
+            report.cold_ms = await fetch(urls[0])
+            await asyncio.gather(*(fetch(url) for url in urls[1:]))
+        report.warm_ms = await fetch(report.sample_url)
+
+    report.cold_ms = round(report.cold_ms, 2) if report.cold_ms is not None else None
+    report.warm_ms = round(report.warm_ms, 2) if report.warm_ms is not None else None
+    report.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    save_report(report)
+    return report
+
+
+def _report_path(site_id: int) -> str:
+    return os.path.join(settings.RUNTIME_DIR, f"warmup_{site_id}.json")
+
+
+def save_report(report: WarmupReport):
+    path = _report_path(report.site_id)
+    with open(path + ".tmp", "w") as f:
+        json.dump(report.to_dict(), f)
+    os.replace(path + ".tmp", path)
+
+
+def load_report(site_id: int) -> Optional[dict]:
+    """Last warmup report of a site, if any"""
+    try:
+        with open(_report_path(site_id), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
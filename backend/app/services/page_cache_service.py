@@ -0,0 +1,189 @@
+"""
+Proxy-level full-page cache rules and purging (Caddy cache-handler module)
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from app.models.domain import Domain
+from app.models.site import Site, SiteType
+from app.models.traffic import TrafficRollup
+from app.core.config import settings
+from dataclasses import dataclass, field, fields, asdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from urllib.parse import quote, urlsplit
+import re
+
+# Site.config keys that only affect the proxy, not the worker
+PROXY_CONFIG_KEYS = {"page_cache", "static_files"}
+
+# Requests carrying these cookies (name prefixes) go to PHP uncached
+DEFAULT_BYPASS_COOKIES = {
+    SiteType.WORDPRESS: [
+        "wordpress_logged_in_",
+        "wp-postpass_",
+        "comment_author_",
+        "woocommerce_items_in_cart",
+        "woocommerce_cart_hash",
+    ],
+    SiteType.JOOMLA: ["joomla_user_state"],
+}
+
+DEFAULT_BYPASS_PATHS = {
+    SiteType.WORDPRESS: ["/wp-admin*", "/wp-login.php", "/wp-cron.php", "/xmlrpc.php", "/cart*", "/checkout*", "/my-account*"],
+    SiteType.JOOMLA: ["/administrator*"],
+}
+
+_COOKIE_RE = re.compile(r"^[A-Za-z0-9_.\-]+$")
+_HEADER_RE = re.compile(r"^[A-Za-z0-9\-]+$")
+
+
+@dataclass
+class PageCacheRules:
+    """Cache settings of one site, stored in Site.config["page_cache"]"""
+    enabled: bool = False
+    ttl: int = 300  # Seconds a page is served from cache
+    stale: int = 60  # Seconds an expired page may still be served while it is refreshed
+    bypass_cookies: list[str] = field(default_factory=list)
+    bypass_paths: list[str] = field(default_factory=list)
+    ignore_query: bool = False  # One cache entry per path, whatever the query string
+    vary_headers: list[str] = field(default_factory=list)  # Request headers added to the cache key
+
+    @classmethod
+    def for_site(cls, site_type: SiteType, config: Optional[dict]) -> "PageCacheRules":
+        stored = dict((config or {}).get("page_cache") or {})
+        rules = cls(
+            bypass_cookies=list(DEFAULT_BYPASS_COOKIES.get(site_type, [])),
+            bypass_paths=list(DEFAULT_BYPASS_PATHS.get(site_type, [])),
+        )
+        names = {f.name for f in fields(cls)}
+        for key, value in stored.items():
+            if key in names:
+                setattr(rules, key, value)
+        rules.validate()
+        return rules
+
+    def validate(self):
+        if self.ttl <= 0 or self.stale < 0:
+            raise ValueError("ttl must be positive and stale not negative")
+        for cookie in self.bypass_cookies:
+            if not _COOKIE_RE.match(cookie):
+                raise ValueError(f"Invalid cookie name: {cookie!r}")
+        for path in self.bypass_paths:
+            if not path.startswith("/") or any(c.isspace() or c in '"{}' for c in path):
+                raise ValueError(f"Invalid path: {path!r}")
+        for header in self.vary_headers:
+            if not _HEADER_RE.match(header):
+                raise ValueError(f"Invalid header name: {header!r}")
+
+    @property
+    def active(self) -> bool:
+        return settings.PAGE_CACHE_ENABLED and self.enabled
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def cookie_pattern(self) -> str:
+        return "(?:^|;\\s*)(?:" + "|".join(re.escape(c) for c in self.bypass_cookies) + ")"
+
+    def caddyfile(self, exclude_paths: Optional[list[str]] = None) -> str:
+        """Site block lines: cache GET/HEAD requests that carry no bypass cookie and hit no bypass path"""
+        if not self.active:
+            return ""
+        matcher = "    @page_cache {\n        method GET HEAD\n"
+        if self.bypass_cookies:
+            matcher += f'        not header_regexp Cookie "{self.cookie_pattern()}"\n'
+        if self.bypass_paths:
+            matcher += f"        not path {' '.join(self.bypass_paths)}\n"
+        if exclude_paths:
+            # Served from disk by Caddy already
+            matcher += f"        not path {' '.join(exclude_paths)}\n"
+        matcher += "    }\n"
+        key = ""
+        if self.ignore_query or self.vary_headers:
+            key = "        key {\n"
+            if self.ignore_query:
+                key += "            disable_query\n"
+            if self.vary_headers:
+                key += f"            headers {' '.join(self.vary_headers)}\n"
+            key += "        }\n"
+        return f"{matcher}    cache @page_cache {{\n        ttl {self.ttl}s\n        stale {self.stale}s\n{key}    }}\n"
+
+    def matcher_json(self) -> dict:
+        excluded = []
+        if self.bypass_cookies:
+            excluded.append({"header_regexp": {"Cookie": {"pattern": self.cookie_pattern()}}})
+        if self.bypass_paths:
+            excluded.append({"path": self.bypass_paths})
+        matcher: dict[str, Any] = {"method": ["GET", "HEAD"]}
+        if excluded:
+            matcher["not"] = excluded
+        return matcher
+
+    def handler_json(self) -> dict:
+        handler: dict[str, Any] = {"handler": "cache", "ttl": f"{self.ttl}s", "stale": f"{self.stale}s"}
+        key = {}
+        if self.ignore_query:
+            key["disable_query"] = True
+        if self.vary_headers:
+            key["headers"] = self.vary_headers
+        if key:
+            handler["key"] = key
+        return handler
+
+
+def global_options() -> str:
+    """Global Caddyfile options the cache directive needs"""
+    if not settings.PAGE_CACHE_ENABLED:
+        return ""
+    return "    order cache before rewrite\n    cache {\n        api {\n            souin\n        }\n    }\n"
+
+
+def purge_patterns(hosts: list[str], url: Optional[str] = None, prefix: Optional[str] = None) -> list[str]:
+    """Regexes over cache keys ("METHOD-scheme-host-uri") of a site's hosts, a URL or a path prefix"""
+    if url:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        if host not in hosts:
+            raise ValueError(f"{host or url} is not a domain of this site")
+        uri = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        return [f"^[A-Z]+-https?-{re.escape(host)}-{re.escape(uri)}$"]
+    if prefix is not None:
+        if not prefix.startswith("/"):
+            raise ValueError("prefix must start with /")
+        return [f"^[A-Z]+-https?-{re.escape(host)}-{re.escape(prefix)}.*" for host in hosts]
+    return [f"^[A-Z]+-https?-{re.escape(host)}-.*" for host in hosts]
+
+
+async def purge(db: AsyncSession, site: Site, url: Optional[str] = None, prefix: Optional[str] = None) -> int:
+    """Drop a site's cached pages (one URL, a path prefix or all); returns the number of purge calls"""
+    from app.services.caddy_admin_service import CaddyAdminClient
+    result = await db.execute(select(Domain.domain).where(Domain.site_id == site.id))
+    hosts = [d.lower() for d in result.scalars().all()]
+    patterns = purge_patterns(hosts, url, prefix)
+    client = CaddyAdminClient()
+    for pattern in patterns:
+        await client.request("PURGE", f"{settings.PAGE_CACHE_API_PATH}/{quote(pattern, safe='')}")
+    return len(patterns)
+
+
+async def cache_stats(db: AsyncSession, site_id: int, hours: int = 24) -> dict:
+    """Hits, misses and hit ratio of a site's page cache over the last hours, from traffic rollups"""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(TrafficRollup.requests), 0),
+            func.coalesce(func.sum(TrafficRollup.cache_hits), 0),
+            func.coalesce(func.sum(TrafficRollup.cache_misses), 0),
+        ).where(TrafficRollup.site_id == site_id, TrafficRollup.minute >= since)
+    )
+    requests, hits, misses = (int(v) for v in result.one())
+    lookups = hits + misses
+    return {
+        "since": since,
+        "requests": requests,
+        "hits": hits,
+        "misses": misses,
+        "bypassed": max(requests - lookups, 0),
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        "offload_ratio": round(hits / requests, 4) if requests else None,
+    }
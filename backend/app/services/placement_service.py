@@ -0,0 +1,378 @@
+"""
+CPU topology discovery and NUMA-aware placement of FrankenPHP workers
+"""
+from app.core.config import settings
+from dataclasses import dataclass, field, asdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import fcntl
+import os
+import json
+import shutil
+import subprocess
+import time
+from typing import Callable, Iterable, Optional
+
+
+def parse_cpulist(text: str) -> list[int]:
+    """Parse a sysfs cpulist such as "0-3,8,10-11" into sorted CPU ids"""
+    cpus = set()
+    for part in text.strip().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpulist(cpus: Iterable[int]) -> str:
+    """Format CPU ids as a compact cpulist ("0-3,8")"""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+@dataclass
+class CpuTopology:
+    """CPUs grouped by NUMA node"""
+    nodes: dict[int, list[int]]
+
+    @classmethod
+    def from_sysfs(cls, root: str = "/sys") -> "CpuTopology":
+        """Read NUMA nodes from sysfs; falls back to a single node of online CPUs"""
+        nodes: dict[int, list[int]] = {}
+        node_dir = os.path.join(root, "devices", "system", "node")
+        if os.path.isdir(node_dir):
+            for entry in os.listdir(node_dir):
+                if not (entry.startswith("node") and entry[4:].isdigit()):
+                    continue
+                try:
+                    with open(os.path.join(node_dir, entry, "cpulist"), "r") as f:
+                        cpus = parse_cpulist(f.read())
+                except (OSError, ValueError):
+                    continue
+                if cpus:
+                    nodes[int(entry[4:])] = cpus
+
+        if not nodes:
+            try:
+                with open(os.path.join(root, "devices", "system", "cpu", "online"), "r") as f:
+                    cpus = parse_cpulist(f.read())
+            except (OSError, ValueError):
+                cpus = list(range(os.cpu_count() or 1))
+            nodes = {0: cpus}
+
+        return cls(nodes=dict(sorted(nodes.items())))
+
+    @property
+    def cpus(self) -> list[int]:
+        return sorted(cpu for cpus in self.nodes.values() for cpu in cpus)
+
+
+@dataclass
+class WorkerDemand:
+    """Input to the scheduler: a running worker and its observed load"""
+    site_id: int
+    load: float = 0.0  # CPU cores in use, averaged since the last rebalance
+    dedicated_cpus: int = 0  # >0 pins the site to that many exclusive cores
+
+
+@dataclass
+class WorkerPlacement:
+    """CPU set and NUMA node assigned to a worker"""
+    site_id: int
+    node: int
+    cpus: list[int] = field(default_factory=list)
+    dedicated: bool = False
+    load: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["cpulist"] = format_cpulist(self.cpus)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WorkerPlacement":
+        return cls(
+            site_id=int(data["site_id"]),
+            node=int(data["node"]),
+            cpus=[int(cpu) for cpu in data.get("cpus") or []],
+            dedicated=bool(data.get("dedicated")),
+            load=float(data.get("load") or 0.0),
+        )
+
+
+class PlacementService:
+    """Assigns FrankenPHP workers to CPU sets and NUMA nodes based on observed load.
+
+    Every API worker process may start workers, so the placement map lives in
+    state_file: each change re-reads it under a flock, updates it and writes
+    it back, instead of each process overwriting it with its own view.
+    """
+
+    def __init__(
+        self,
+        topology: Optional[CpuTopology] = None,
+        state_file: Optional[str] = None,
+        reserved_cpus: Optional[str] = None,
+        tolerance: Optional[float] = None,
+        proc_root: str = "/proc",
+    ):
+        self.topology = topology or CpuTopology.from_sysfs()
+        self.state_file = state_file or os.path.join(settings.RUNTIME_DIR, "placement.json")
+        reserved = settings.FRANKENPHP_PLACEMENT_RESERVED_CPUS if reserved_cpus is None else reserved_cpus
+        self.reserved = set(parse_cpulist(reserved))
+        self.tolerance = settings.FRANKENPHP_PLACEMENT_TOLERANCE if tolerance is None else tolerance
+        self.proc_root = proc_root
+        self.placements: dict[int, WorkerPlacement] = self._load_placements()
+        self._ticks: dict[int, tuple[int, float]] = {}  # pid -> (cpu ticks, monotonic time)
+        self._clk_tck = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def plan(
+        self,
+        demands: list[WorkerDemand],
+        previous: Optional[dict[int, WorkerPlacement]] = None,
+    ) -> dict[int, WorkerPlacement]:
+        """Compute a placement for all workers. Pure: does not touch processes."""
+        previous = self.placements if previous is None else previous
+        free = {
+            node: [cpu for cpu in cpus if cpu not in self.reserved]
+            for node, cpus in self.topology.nodes.items()
+        }
+        total_free = sum(len(cpus) for cpus in free.values())
+        result: dict[int, WorkerPlacement] = {}
+
+        # Dedicated cores first, largest requests first, always leaving one shared CPU
+        dedicated = sorted(
+            (d for d in demands if d.dedicated_cpus > 0),
+            key=lambda d: (-d.dedicated_cpus, d.site_id),
+        )
+        shared = [d for d in demands if d.dedicated_cpus <= 0]
+        for demand in dedicated:
+            wanted = demand.dedicated_cpus
+            if total_free - wanted < 1:
+                shared.append(demand)
+                continue
+            prev = previous.get(demand.site_id)
+            if (
+                prev is not None
+                and prev.dedicated
+                and len(prev.cpus) == wanted
+                and set(prev.cpus) <= set(free.get(prev.node, []))
+            ):
+                node, cpus = prev.node, list(prev.cpus)
+            else:
+                candidates = [n for n, c in free.items() if len(c) >= wanted]
+                if not candidates:
+                    shared.append(demand)
+                    continue
+                node = max(candidates, key=lambda n: (len(free[n]), -n))
+                cpus = free[node][:wanted]
+            free[node] = [cpu for cpu in free[node] if cpu not in cpus]
+            total_free -= wanted
+            result[demand.site_id] = WorkerPlacement(
+                site_id=demand.site_id, node=node, cpus=cpus, dedicated=True, load=demand.load
+            )
+
+        # Everything else shares the remaining CPUs of one node, balanced by load per CPU
+        pools = {node: cpus for node, cpus in free.items() if cpus}
+        if not pools:
+            return result
+        capacity = {node: len(cpus) for node, cpus in pools.items()}
+        node_load = {node: 0.0 for node in pools}
+        node_count = {node: 0 for node in pools}
+        target = sum(d.load for d in shared) / sum(capacity.values())
+        limit = target * (1 + self.tolerance)
+
+        for demand in sorted(shared, key=lambda d: (-d.load, d.site_id)):
+            prev = previous.get(demand.site_id)
+            if (
+                prev is not None
+                and prev.node in pools
+                and (node_load[prev.node] + demand.load) / capacity[prev.node] <= limit
+            ):
+                node = prev.node
+            else:
+                node = min(
+                    pools,
+                    key=lambda n: (
+                        (node_load[n] + demand.load) / capacity[n],
+                        node_count[n] / capacity[n],
+                        n,
+                    ),
+                )
+            node_load[node] += demand.load
+            node_count[node] += 1
+            result[demand.site_id] = WorkerPlacement(
+                site_id=demand.site_id, node=node, cpus=list(pools[node]), load=demand.load
+            )
+
+        return result
+
+    def place(
+        self,
+        site_id: int,
+        dedicated_cpus: int = 0,
+        pid_of: Optional[Callable[[int], Optional[int]]] = None,
+    ) -> WorkerPlacement:
+        """Place a single new worker; shared workers whose CPU set shrank are re-pinned via pid_of(site_id)"""
+        with self._locked():
+            self.placements = self._load_placements()
+            demands = [
+                WorkerDemand(site_id=p.site_id, load=p.load, dedicated_cpus=len(p.cpus) if p.dedicated else 0)
+                for p in self.placements.values()
+                if p.site_id != site_id
+            ]
+            demands.append(WorkerDemand(site_id=site_id, dedicated_cpus=dedicated_cpus))
+            previous, self.placements = self.placements, self.plan(demands)
+            self._save()
+
+        # A dedicated placement takes cores from the shared pool its neighbours were pinned to
+        for other, placement in self.placements.items():
+            old = previous.get(other)
+            if other == site_id or old is None or (old.cpus, old.node) == (placement.cpus, placement.node):
+                continue
+            pid = pid_of(other) if pid_of else None
+            if pid is not None:
+                self.apply(pid, placement, old_node=old.node)
+        return self.placements[site_id]
+
+    def forget(self, site_id: int):
+        """Drop a stopped worker from the placement map"""
+        with self._locked():
+            self.placements = self._load_placements()
+            if self.placements.pop(site_id, None) is not None:
+                self._save()
+
+    def observe_load(self, pid: int) -> float:
+        """CPU cores used by pid since the previous observation (0.0 on first call)"""
+        ticks = self._read_cpu_ticks(pid)
+        now = time.monotonic()
+        if ticks is None:
+            self._ticks.pop(pid, None)
+            return 0.0
+        last = self._ticks.get(pid)
+        self._ticks[pid] = (ticks, now)
+        if last is None or now <= last[1]:
+            return 0.0
+        return max(0.0, (ticks - last[0]) / self._clk_tck / (now - last[1]))
+
+    def rebalance(self, workers: list[tuple[WorkerDemand, int]]) -> dict[int, WorkerPlacement]:
+        """Re-plan all running workers and move the ones whose placement changed"""
+        with self._locked():
+            previous = self._load_placements()
+            planned = self.plan([demand for demand, _ in workers], previous)
+            self.placements = planned
+            self._save()
+        pids = {demand.site_id: pid for demand, pid in workers}
+        for site_id, placement in planned.items():
+            old = previous.get(site_id)
+            if old is None or old.cpus != placement.cpus or old.node != placement.node:
+                self.apply(pids[site_id], placement, old_node=old.node if old else None)
+        live = set(pids.values())
+        self._ticks = {pid: v for pid, v in self._ticks.items() if pid in live}
+        return planned
+
+    def apply(self, pid: int, placement: WorkerPlacement, old_node: Optional[int] = None):
+        """Set the CPU affinity of every thread of pid and migrate its memory if the node changed"""
+        task_dir = os.path.join(self.proc_root, str(pid), "task")
+        try:
+            tids = [int(tid) for tid in os.listdir(task_dir)]
+        except OSError:
+            tids = [pid]
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, placement.cpus)
+            except (OSError, AttributeError):
+                pass
+
+        migratepages = shutil.which("migratepages")
+        if old_node is not None and old_node != placement.node and migratepages:
+            subprocess.run(
+                [migratepages, str(pid), str(old_node), str(placement.node)],
+                check=False,
+                timeout=30,
+            )
+
+    def command_prefix(self, placement: WorkerPlacement) -> list[str]:
+        """numactl prefix binding a new worker's memory to its NUMA node"""
+        numactl = shutil.which("numactl")
+        if not numactl or len(self.topology.nodes) < 2:
+            return []
+        return [numactl, f"--preferred={placement.node}"]
+
+    def load_map(self) -> dict:
+        """Read the persisted placement map (works from any API worker process)"""
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return {
+            "topology": {str(n): format_cpulist(c) for n, c in self.topology.nodes.items()},
+            "reserved": format_cpulist(self.reserved),
+            "placements": [p.to_dict() for p in sorted(self.placements.values(), key=lambda p: p.site_id)],
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _load_placements(self) -> dict[int, WorkerPlacement]:
+        """Placements saved by any process; empty if there is no readable state file"""
+        try:
+            with open(self.state_file, "r") as f:
+                saved = json.load(f).get("placements") or []
+            placements = [WorkerPlacement.from_dict(p) for p in saved]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+        return {p.site_id: p for p in placements}
+
+    @contextmanager
+    def _locked(self):
+        """Serialize read-modify-write of state_file across processes"""
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        fd = os.open(f"{self.state_file}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Also releases the flock
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._snapshot(), f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _read_cpu_ticks(self, pid: int) -> Optional[int]:
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "stat"), "r") as f:
+                stat = f.read()
+        except OSError:
+            return None
+        # Fields after the parenthesised comm; utime and stime are fields 14 and 15
+        fields = stat[stat.rfind(")") + 2:].split()
+        try:
+            return int(fields[11]) + int(fields[12])
+        except (IndexError, ValueError):
+            return None
+
+
+_placement_service: Optional[PlacementService] = None
+
+
+def get_placement_service() -> PlacementService:
+    """Process-wide placement scheduler"""
+    global _placement_service
+    if _placement_service is None:
+        _placement_service = PlacementService()
+    return _placement_service
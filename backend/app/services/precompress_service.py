@@ -0,0 +1,281 @@
+"""
+Background precompression of static assets into .br/.gz siblings served by Caddy
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.site import Site, SiteStatus, SiteType
+from app.core.config import settings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Iterator, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Text-like formats worth compressing; images, fonts in woff/woff2 and media are compressed already
+COMPRESSIBLE_EXTENSIONS = {
+    "css", "js", "mjs", "map", "svg", "json", "xml", "txt", "html", "htm", "ttf", "otf", "eot", "ico", "wasm",
+}
+SIBLING_SUFFIXES = (".br", ".gz")
+BATCH_FILES = 64  # Files per process pool batch; the manifest is saved after each batch
+
+
+def encodings() -> list[str]:
+    """Encodings generated, in Caddy's order of preference"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _compress_file(path: str, mtime_ns: int, min_ratio: float, owned: list[str]) -> tuple[str, int, dict, int]:
+    """Process pool task: write path.br/path.gz next to path; returns (path, size, {suffix: size}, foreign).
+
+    Existing siblings whose suffix is not in owned (i.e. not written by us)
+    belong to the site or a build tool and are left alone; foreign counts them.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    written = {}
+    variants = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.insert(0, (".br", lambda: brotli.compress(data, quality=11)))
+    mode = os.stat(path).st_mode & 0o777
+    foreign = 0
+    for suffix, compress in variants:
+        target = path + suffix
+        if suffix not in owned and os.path.lexists(target):
+            foreign += 1
+            continue
+        body = compress()
+        if len(body) > len(data) * min_ratio:
+            # Not worth it: Caddy serves the original
+            _remove(target)
+            continue
+        tmp_path = f"{os.path.dirname(path)}/.{os.path.basename(target)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.chmod(tmp_path, mode)
+        # Same mtime as the source so Last-Modified/ETag agree whichever file Caddy serves
+        os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_path, target)
+        written[suffix] = len(body)
+    return path, len(data), written, foreign
+
+
+def _owned(entry: Optional[list]) -> list[str]:
+    """Sibling suffixes a manifest entry records as written by us"""
+    return list(entry[2]) if entry and len(entry) > 2 else []
+
+
+def _lower_priority():
+    try:
+        os.nice(settings.PRECOMPRESS_NICE)
+    except OSError:
+        pass
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass
+class PrecompressReport:
+    """Outcome of one precompression pass over a site"""
+    site_id: int
+    scanned: int = 0
+    compressed: int = 0
+    skipped: int = 0  # Compressible but already up to date
+    removed: int = 0  # Stale siblings of deleted or changed files
+    foreign: int = 0  # Existing siblings not written by the panel, left alone
+    bytes_in: int = 0
+    bytes_out: int = 0
+    complete: bool = True  # False when the run's budget ran out; the next run resumes
+    duration: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class PrecompressService:
+    """Keeps .br/.gz siblings of a site's compressible assets in line with the files, incrementally.
+
+    A per-site manifest (RUNTIME_DIR/precompress/<site_id>.json) records the
+    size and mtime each file had when its siblings were written, so only new
+    or changed files are compressed. Siblings of files that disappeared are
+    removed. Only siblings listed in the manifest are ever deleted.
+    """
+
+    def __init__(self, pool: Optional[ProcessPoolExecutor] = None):
+        self.pool = pool
+        self.manifest_dir = os.path.join(settings.RUNTIME_DIR, "precompress")
+
+    def extensions(self, site: Site) -> set[str]:
+        from app.services.static_files_service import StaticFileRules
+        if site.site_type == SiteType.STATIC:
+            return COMPRESSIBLE_EXTENSIONS
+        try:
+            rules = StaticFileRules.for_site(site.site_type, site.path, site.config)
+        except (ValueError, TypeError):
+            return set()
+        # Only what Caddy serves from disk; everything else goes through the worker
+        return COMPRESSIBLE_EXTENSIONS & set(rules.extensions) if rules.active else set()
+
+    async def run_site(self, site: Site, max_bytes: Optional[int] = None) -> PrecompressReport:
+        """One incremental pass over a site's tree within a byte budget"""
+        clock = time.monotonic()
+        report = PrecompressReport(site_id=site.id)
+        extensions = self.extensions(site)
+        manifest = self._load_manifest(site.id)
+        budget = settings.PRECOMPRESS_MAX_BYTES_PER_RUN if max_bytes is None else max_bytes
+
+        pending, seen = [], set()
+        for path, st in await asyncio.to_thread(lambda: list(_walk(site.path, extensions))):
+            report.scanned += 1
+            rel = os.path.relpath(path, site.path)
+            seen.add(rel)
+            entry = manifest.get(rel)
+            if entry and entry[:2] == [st.st_mtime_ns, st.st_size]:
+                report.skipped += 1
+                continue
+            if entry:
+                # Changed: drop our stale siblings now so Caddy serves the fresh original until they are rewritten
+                for suffix in _owned(entry):
+                    if os.path.exists(path + suffix):
+                        _remove(path + suffix)
+                        report.removed += 1
+                manifest[rel] = [None, None, []]
+            if budget <= 0:
+                report.complete = False
+                continue
+            budget -= st.st_size
+            pending.append((path, st.st_mtime_ns, []))
+
+        for rel in [rel for rel in manifest if rel not in seen]:
+            # The file is gone (or no longer served from disk): drop our siblings
+            for suffix in _owned(manifest[rel]):
+                if os.path.exists(os.path.join(site.path, rel + suffix)):
+                    _remove(os.path.join(site.path, rel + suffix))
+                    report.removed += 1
+            del manifest[rel]
+
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(pending), BATCH_FILES):
+            batch = pending[start:start + BATCH_FILES]
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        self.pool, _compress_file, path, mtime_ns, settings.PRECOMPRESS_MIN_RATIO, owned
+                    )
+                    for path, mtime_ns, owned in batch
+                ),
+                return_exceptions=True,
+            )
+            for (path, mtime_ns, _), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    logger.warning("Could not precompress %s: %s", path, result)
+                    continue
+                _, size, written, foreign = result
+                manifest[os.path.relpath(path, site.path)] = [mtime_ns, size, sorted(written)]
+                report.compressed += 1
+                report.foreign += foreign
+                report.bytes_in += size
+                report.bytes_out += min(written.values(), default=size)
+            # Checkpoint: an interrupted run resumes after the last finished batch
+            self._save_manifest(site.id, manifest)
+
+        self._save_manifest(site.id, manifest)
+        report.duration = round(time.monotonic() - clock, 3)
+        return report
+
+    async def run(self, db: AsyncSession) -> list[PrecompressReport]:
+        """One pass over every active site, sharing the run's byte budget"""
+        result = await db.execute(select(Site).where(Site.status == SiteStatus.ACTIVE).order_by(Site.id))
+        sites = result.scalars().all()
+        reports = []
+        budget = settings.PRECOMPRESS_MAX_BYTES_PER_RUN
+        own_pool = self.pool is None
+        if own_pool:
+            self.pool = ProcessPoolExecutor(max_workers=settings.PRECOMPRESS_WORKERS, initializer=_lower_priority)
+        try:
+            for site in sites:
+                if not os.path.isdir(site.path):
+                    continue
+                report = await self.run_site(site, budget)
+                budget -= report.bytes_in
+                reports.append(report)
+                if report.compressed or report.removed:
+                    logger.info("Precompressed site %s: %s", site.id, report.to_dict())
+        finally:
+            if own_pool:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+        return reports
+
+    def forget(self, site_id: int):
+        _remove(self._manifest_path(site_id))
+
+    def _manifest_path(self, site_id: int) -> str:
+        return os.path.join(self.manifest_dir, f"{site_id}.json")
+
+    def _load_manifest(self, site_id: int) -> dict:
+        try:
+            with open(self._manifest_path(site_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, site_id: int, manifest: dict):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        tmp_path = self._manifest_path(site_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, self._manifest_path(site_id))
+
+
+def _walk(root: str, extensions: set[str]) -> Iterator[tuple[str, os.stat_result]]:
+    """Compressible regular files under root, skipping dot directories and symlinks"""
+    if not extensions:
+        return
+    min_size = settings.PRECOMPRESS_MIN_SIZE
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                extension = entry.name.rsplit(".", 1)[-1].lower() if "." in entry.name else ""
+                if extension not in extensions:
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if st.st_size >= min_size:
+                yield entry.path, st
+
+
+async def precompress_sites():
+    """Background job: incremental precompression of all active sites"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await PrecompressService().run(db)
@@ -0,0 +1,214 @@
+"""
+Worker reconciliation: bring running FrankenPHP workers in line with the sites table
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.site import Site, SiteStatus
+from app.core.config import settings
+from dataclasses import dataclass, field, asdict
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PID_FILE_RE = re.compile(r"worker_(\d+)\.pid$")
+
+
+@dataclass
+class ReconcileReport:
+    """Outcome of one reconciliation pass"""
+    started_at: float
+    duration: float = 0.0
+    desired: int = 0
+    running: int = 0
+    started: list[int] = field(default_factory=list)
+    failed: list[int] = field(default_factory=list)
+    stopped: list[int] = field(default_factory=list)
+    stale_pid_files: list[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def worker_alive(pid: int, site_path: Optional[str] = None) -> bool:
+    """True if pid is a live FrankenPHP worker (serving site_path, when given).
+
+    A PID file that survived a reboot may name an unrelated process that
+    reused the PID, so the command line is checked, not only the PID.
+    """
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            argv = [arg.decode(errors="replace") for arg in f.read().split(b"\0") if arg]
+    except OSError:
+        return False
+    binary = os.path.basename(settings.FRANKENPHP_BIN)
+    if not any(os.path.basename(arg) == binary for arg in argv):
+        return False
+    if site_path is None:
+        return True
+    return "--root" in argv and site_path in argv
+
+
+class WorkerReconciler:
+    """Starts missing workers of active sites, stops unwanted ones, and removes stale PID files.
+
+    The leader's periodic pass and manual passes from any API worker process
+    are serialized by a flock on RUNTIME_DIR/reconcile.lock; the last report
+    is kept in RUNTIME_DIR/reconcile_report.json.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, stagger: Optional[float] = None):
+        self.concurrency = concurrency or settings.RECONCILE_CONCURRENCY
+        self.stagger = settings.RECONCILE_STAGGER if stagger is None else stagger
+        self._lock = asyncio.Lock()
+
+    @property
+    def last_report(self) -> Optional[dict]:
+        """Report of the last pass in any process, if any"""
+        try:
+            with open(self._report_path(), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def run(self, db: AsyncSession) -> ReconcileReport:
+        """One reconciliation pass"""
+        async with self._lock:
+            os.makedirs(settings.RUNTIME_DIR, exist_ok=True)
+            fd = os.open(os.path.join(settings.RUNTIME_DIR, "reconcile.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+                report = await self._run(db)
+                self._save_report(report)
+            finally:
+                os.close(fd)  # Also releases the flock
+        if report.started or report.failed or report.stopped or report.stale_pid_files:
+            logger.info(
+                "Reconciled %s/%s workers in %.2fs: started %s, failed %s, stopped %s, stale PID files %s",
+                report.running, report.desired, report.duration,
+                len(report.started), len(report.failed), len(report.stopped), len(report.stale_pid_files),
+            )
+        return report
+
+    async def _run(self, db: AsyncSession) -> ReconcileReport:
+        from app.services.frankenphp_service import FrankenPHPService, needs_worker
+        frankenphp_service = FrankenPHPService()
+        report = ReconcileReport(started_at=time.time())
+        clock = time.monotonic()
+
+        result = await db.execute(select(Site))
+        sites = {site.id: site for site in result.scalars().all()}
+        pids = self._read_pid_files()
+
+        missing = []
+        for site_id, pid in pids.items():
+            site = sites.get(site_id)
+            if not worker_alive(pid, site.path if site else None):
+                self._remove_pid_file(site_id)
+                report.stale_pid_files.append(site_id)
+            elif (
+                site is None
+                or site.status in (SiteStatus.INACTIVE, SiteStatus.SUSPENDED)
+                or not needs_worker(site)
+            ):
+                # Leave workers alone for a while: site creation starts them before activating
+                if self._pid_file_age(site_id) >= settings.RECONCILE_STOP_GRACE:
+                    await frankenphp_service._terminate(pid)
+                    self._remove_pid_file(site_id)
+                    report.stopped.append(site_id)
+        for site in sites.values():
+            if site.status != SiteStatus.ACTIVE or not needs_worker(site):
+                continue
+            report.desired += 1
+            if site.id in pids and site.id not in report.stale_pid_files:
+                report.running += 1
+            else:
+                missing.append(site)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(
+                self._start(frankenphp_service, site, index, semaphore)
+                for index, site in enumerate(missing)
+            ))
+            for site, ok in zip(missing, results):
+                (report.started if ok else report.failed).append(site.id)
+            report.running += len(report.started)
+
+        report.duration = round(time.monotonic() - clock, 3)
+        return report
+
+    async def _start(self, frankenphp_service, site: Site, index: int, semaphore: asyncio.Semaphore) -> bool:
+        # Stagger launches so a reboot does not hit disk and MySQL with every site at once
+        await asyncio.sleep((index % self.concurrency) * self.stagger)
+        async with semaphore:
+            try:
+                await frankenphp_service.start_worker(site)
+                if await frankenphp_service.wait_until_ready(site):
+                    return True
+                logger.warning("Worker for site %s started but did not become ready", site.id)
+            except Exception:
+                logger.exception("Failed to start worker for site %s", site.id)
+            return False
+
+    def _report_path(self) -> str:
+        return os.path.join(settings.RUNTIME_DIR, "reconcile_report.json")
+
+    def _save_report(self, report: ReconcileReport):
+        path = self._report_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(report.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    def _read_pid_files(self) -> dict[int, int]:
+        pids = {}
+        for path in glob.glob(os.path.join(settings.RUNTIME_DIR, "worker_*.pid")):
+            match = PID_FILE_RE.search(path)
+            if not match:
+                continue
+            try:
+                with open(path, "r") as f:
+                    pids[int(match.group(1))] = int(f.read().strip())
+            except (OSError, ValueError):
+                pids[int(match.group(1))] = 0  # Unreadable: treated as stale
+        return pids
+
+    def _pid_file(self, site_id: int) -> str:
+        return os.path.join(settings.RUNTIME_DIR, f"worker_{site_id}.pid")
+
+    def _pid_file_age(self, site_id: int) -> float:
+        try:
+            return time.time() - os.path.getmtime(self._pid_file(site_id))
+        except OSError:
+            return 0.0
+
+    def _remove_pid_file(self, site_id: int):
+        try:
+            os.remove(self._pid_file(site_id))
+        except FileNotFoundError:
+            pass
+
+
+_reconciler: Optional[WorkerReconciler] = None
+
+
+def get_worker_reconciler() -> WorkerReconciler:
+    """Process-wide worker reconciler"""
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = WorkerReconciler()
+    return _reconciler
+
+
+async def reconcile_workers():
+    """Background job: reconcile workers at boot and periodically afterwards"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await get_worker_reconciler().run(db)
@@ -0,0 +1,271 @@
+"""
+Per-site worker resource sampling with in-memory time series
+"""
+from app.core.config import settings
+from array import array
+import asyncio
+import os
+import time
+from typing import Optional
+
+
+class RingBuffer:
+    """Fixed-size array-backed ring buffer of numbers"""
+
+    def __init__(self, capacity: int, typecode: str = "d"):
+        self.capacity = capacity
+        self._data = array(typecode, [0]) * capacity
+        self._next = 0
+        self._size = 0
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def values(self, limit: Optional[int] = None) -> list:
+        """Values oldest → newest, optionally only the newest `limit`"""
+        count = self._size if limit is None else min(limit, self._size)
+        start = (self._next - count) % self.capacity
+        if start + count <= self.capacity:
+            return self._data[start:start + count].tolist()
+        return self._data[start:].tolist() + self._data[:self._next].tolist()
+
+    def last(self):
+        return self._data[(self._next - 1) % self.capacity] if self._size else None
+
+    def __len__(self) -> int:
+        return self._size
+
+
+SERIES = ("cpu_percent", "rss_bytes", "read_bps", "write_bps", "processes")
+
+
+class SiteSeries:
+    """Recent resource history of one site worker"""
+
+    __slots__ = ("site_id", "pid", "timestamps", "series", "_ticks", "_read", "_write", "_at")
+
+    def __init__(self, site_id: int, capacity: int):
+        self.site_id = site_id
+        self.pid: Optional[int] = None
+        self.timestamps = RingBuffer(capacity, "d")
+        self.series = {
+            "cpu_percent": RingBuffer(capacity, "f"),
+            "rss_bytes": RingBuffer(capacity, "q"),
+            "read_bps": RingBuffer(capacity, "f"),
+            "write_bps": RingBuffer(capacity, "f"),
+            "processes": RingBuffer(capacity, "H"),
+        }
+        self._ticks = self._read = self._write = 0
+        self._at = 0.0
+
+    def record(self, pid: int, at: float, ticks: int, rss: int, read: int, write: int, procs: int, clk_tck: int):
+        """Store one sample; rates are computed against the previous raw counters"""
+        elapsed = at - self._at
+        if self.pid == pid and elapsed > 0:
+            cpu = max(0, ticks - self._ticks) / clk_tck / elapsed * 100
+            read_bps = max(0, read - self._read) / elapsed
+            write_bps = max(0, write - self._write) / elapsed
+        else:
+            cpu = read_bps = write_bps = 0.0
+        self.pid = pid
+        self._ticks, self._read, self._write, self._at = ticks, read, write, at
+
+        self.timestamps.append(time.time())
+        self.series["cpu_percent"].append(cpu)
+        self.series["rss_bytes"].append(rss)
+        self.series["read_bps"].append(read_bps)
+        self.series["write_bps"].append(write_bps)
+        self.series["processes"].append(min(procs, 65535))
+
+    def current(self) -> dict:
+        data = {name: buf.last() for name, buf in self.series.items()}
+        data.update(site_id=self.site_id, pid=self.pid, timestamp=self.timestamps.last())
+        return data
+
+    def history(self, limit: Optional[int] = None) -> dict:
+        data = {name: buf.values(limit) for name, buf in self.series.items()}
+        data["timestamps"] = self.timestamps.values(limit)
+        return data
+
+
+class ResourceSampler:
+    """Samples /proc for all running workers (and their children) in one pass"""
+
+    def __init__(
+        self,
+        runtime_dir: Optional[str] = None,
+        proc_root: str = "/proc",
+        capacity: Optional[int] = None,
+    ):
+        self.runtime_dir = runtime_dir or settings.RUNTIME_DIR
+        self.proc_root = proc_root
+        self.capacity = capacity or settings.FRANKENPHP_SAMPLE_HISTORY
+        self.sites: dict[int, SiteSeries] = {}
+        self.last_duration = 0.0
+        self._clk_tck = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def sample(self) -> int:
+        """Take one sample of every running worker; returns the number of workers sampled"""
+        started = time.monotonic()
+        workers = self._running_workers()
+        children = None
+        if workers and not self._has_children_file(next(iter(workers.values()))):
+            children = self._children_map()
+
+        for site_id, pid in workers.items():
+            pids = self._descendants(pid, children)
+            ticks = rss = read = write = 0
+            alive = 0
+            for p in pids:
+                stat = self._read_stat(p)
+                if stat is None:
+                    continue
+                alive += 1
+                ticks += stat
+                rss += self._read_rss(p)
+                r, w = self._read_io(p)
+                read += r
+                write += w
+            if not alive:
+                self.sites.pop(site_id, None)
+                continue
+            series = self.sites.get(site_id)
+            if series is None:
+                series = self.sites[site_id] = SiteSeries(site_id, self.capacity)
+            series.record(pid, time.monotonic(), ticks, rss, read, write, alive, self._clk_tck)
+
+        for site_id in set(self.sites) - set(workers):
+            del self.sites[site_id]
+
+        self.last_duration = time.monotonic() - started
+        return len(workers)
+
+    async def sample_async(self):
+        """Run a sample off the event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.sample)
+
+    def get_site(self, site_id: int, limit: Optional[int] = None) -> Optional[dict]:
+        series = self.sites.get(site_id)
+        if series is None:
+            return None
+        return {"current": series.current(), "history": series.history(limit)}
+
+    def top(self, metric: str = "cpu_percent", limit: int = 10) -> list[dict]:
+        """Sites with the highest latest value of metric"""
+        if metric not in SERIES:
+            raise ValueError(f"Unknown metric: {metric}")
+        ranked = sorted(
+            (s for s in self.sites.values() if len(s.timestamps)),
+            key=lambda s: s.series[metric].last(),
+            reverse=True,
+        )
+        return [s.current() for s in ranked[:limit]]
+
+    def _running_workers(self) -> dict[int, int]:
+        """site_id -> pid from worker_{id}.pid files"""
+        workers = {}
+        try:
+            entries = os.listdir(self.runtime_dir)
+        except OSError:
+            return workers
+        for entry in entries:
+            if not (entry.startswith("worker_") and entry.endswith(".pid")):
+                continue
+            try:
+                site_id = int(entry[7:-4])
+                with open(os.path.join(self.runtime_dir, entry), "r") as f:
+                    workers[site_id] = int(f.read().strip())
+            except (OSError, ValueError):
+                continue
+        return workers
+
+    def _has_children_file(self, pid: int) -> bool:
+        return os.path.exists(os.path.join(self.proc_root, str(pid), "task", str(pid), "children"))
+
+    def _children_map(self) -> dict[int, list[int]]:
+        """ppid -> child pids from a single scan of /proc (kernels without task/*/children)"""
+        children: dict[int, list[int]] = {}
+        for entry in os.listdir(self.proc_root):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.proc_root, entry, "stat"), "r") as f:
+                    stat = f.read()
+                ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        return children
+
+    def _descendants(self, pid: int, children: Optional[dict[int, list[int]]]) -> list[int]:
+        result = [pid]
+        i = 0
+        while i < len(result):
+            current = result[i]
+            if children is not None:
+                result.extend(children.get(current, ()))
+            else:
+                result.extend(self._read_children(current))
+            i += 1
+        return result
+
+    def _read_children(self, pid: int) -> list[int]:
+        found = []
+        task_dir = os.path.join(self.proc_root, str(pid), "task")
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            return found
+        for tid in tids:
+            try:
+                with open(os.path.join(task_dir, tid, "children"), "r") as f:
+                    found.extend(int(c) for c in f.read().split())
+            except (OSError, ValueError):
+                continue
+        return found
+
+    def _read_stat(self, pid: int) -> Optional[int]:
+        """utime + stime in clock ticks"""
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "stat"), "r") as f:
+                stat = f.read()
+            fields = stat[stat.rfind(")") + 2:].split()
+            return int(fields[11]) + int(fields[12])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _read_rss(self, pid: int) -> int:
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "statm"), "r") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _read_io(self, pid: int) -> tuple[int, int]:
+        read = write = 0
+        try:
+            with open(os.path.join(self.proc_root, str(pid), "io"), "r") as f:
+                for line in f:
+                    if line.startswith("read_bytes:"):
+                        read = int(line.split()[1])
+                    elif line.startswith("write_bytes:"):
+                        write = int(line.split()[1])
+        except (OSError, ValueError, IndexError):
+            pass
+        return read, write
+
+
+_resource_sampler: Optional[ResourceSampler] = None
+
+
+def get_resource_sampler() -> ResourceSampler:
+    """Process-wide resource sampler"""
+    global _resource_sampler
+    if _resource_sampler is None:
+        _resource_sampler = ResourceSampler()
+    return _resource_sampler
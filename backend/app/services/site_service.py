@@ -9,7 +9,11 @@ from app.models.database import Database, DatabaseType
 from app.schemas.site import SiteCreate, SiteUpdate
 from app.services.database_service import DatabaseService
 from app.services.domain_service import DomainService
-from app.services.frankenphp_service import FrankenPHPService
+from app.services.frankenphp_service import FrankenPHPService, needs_worker
+from app.services import domain_index_service
+from app.services.page_cache_service import PageCacheRules, PROXY_CONFIG_KEYS
+from app.services.static_files_service import StaticFileRules
+from app.services.precompress_service import PrecompressService
 from app.core.config import settings
 from app.core.security import encrypt_secret
 import os
@@ -102,12 +106,20 @@ class SiteService:
         await self.db.commit()
         await self.db.refresh(site)
         
-        # Start site so it's live (especially for WordPress)
-        if site_data.site_type == SiteType.WORDPRESS:
-            await self.frankenphp_service.start_worker(site)
+        # Start site so it's live (especially for WordPress); stays inactive if PHP fails to boot
+        if not needs_worker(site):
+            # Static sites are live as soon as Caddy serves their directory
             site.status = SiteStatus.ACTIVE
             await self.db.commit()
             await self.db.refresh(site)
+        elif site_data.site_type == SiteType.WORDPRESS:
+            await self.frankenphp_service.start_worker(site)
+            if await self.frankenphp_service.wait_until_ready(site):
+                site.status = SiteStatus.ACTIVE
+                await self.db.commit()
+                await self.db.refresh(site)
+            else:
+                await self.frankenphp_service.stop_worker(site)
         
         return site
     
@@ -123,16 +135,54 @@ class SiteService:
             site.name = site_data.name
         if site_data.description is not None:
             site.description = site_data.description
-        if site_data.php_version:
+        runtime_changed = proxy_changed = False
+        if site_data.php_version and site_data.php_version != site.php_version:
             site.php_version = site_data.php_version
+            runtime_changed = True
         if site_data.config:
-            site.config.update(site_data.config)
+            previous = site.config or {}
+            config = {**previous, **site_data.config}
+            changed = {key for key in config if config.get(key) != previous.get(key)}
+            # Raise ValueError on invalid rules
+            if "page_cache" in changed:
+                PageCacheRules.for_site(site.site_type, config)
+            if "static_files" in changed:
+                StaticFileRules.for_site(site.site_type, site.path, config)
+            proxy_changed = bool(changed & PROXY_CONFIG_KEYS)
+            runtime_changed = runtime_changed or bool(changed - PROXY_CONFIG_KEYS)
+            site.config = config
+        
+        # Swap in a worker with the new runtime settings without dropping requests
+        if runtime_changed and site.status == SiteStatus.ACTIVE:
+            await self.frankenphp_service.reload_worker(site)
         
         from sqlalchemy.sql import func
         site.updated_at = func.now()
         await self.db.commit()
         await self.db.refresh(site)
         
+        if proxy_changed:
+            await self.domain_service.caddy_service.update_site(site.id)
+        
+        return site
+    
+    async def update_page_cache(self, site_id: int, changes: dict) -> Site:
+        """Change a site's page cache rules and apply them at the proxy"""
+        result = await self.db.execute(select(Site).where(Site.id == site_id))
+        site = result.scalar_one_or_none()
+        
+        if not site:
+            raise ValueError(f"Site {site_id} not found")
+        
+        config = dict(site.config or {})
+        config["page_cache"] = {**(config.get("page_cache") or {}), **changes}
+        PageCacheRules.for_site(site.site_type, config)  # Raises ValueError on invalid rules
+        site.config = config
+        
+        await self.db.commit()
+        await self.db.refresh(site)
+        
+        await self.domain_service.caddy_service.update_site(site.id)
         return site
     
     async def delete_site(self, site_id: int) -> bool:
@@ -149,11 +199,19 @@ class SiteService:
         # Remove site directory
         if os.path.exists(site.path):
             shutil.rmtree(site.path)
+        PrecompressService().forget(site_id)
+        
+        result = await self.db.execute(select(Domain.domain).where(Domain.site_id == site_id))
+        domains = list(result.scalars().all())
         
         # Delete from database (cascade will handle related records)
         await self.db.delete(site)
         await self.db.commit()
         
+        # Domains went with the site: stop answering for them
+        await domain_index_service.publish(self.db, remove=domains)
+        await self.domain_service.caddy_service.remove_site(site_id)
+        
         return True
     
     async def start_site(self, site_id: int) -> bool:
@@ -165,6 +223,9 @@ class SiteService:
             raise ValueError(f"Site {site_id} not found")
         
         await self.frankenphp_service.start_worker(site)
+        if not await self.frankenphp_service.wait_until_ready(site):
+            await self.frankenphp_service.stop_worker(site)
+            raise RuntimeError(f"Worker for site {site_id} did not become ready; see its logs")
         site.status = SiteStatus.ACTIVE
         await self.db.commit()
         
@@ -206,13 +267,13 @@ class SiteService:
     
     async def _get_next_worker_port(self) -> int:
         """Get next available worker port"""
-        result = await self.db.execute(
-            select(Site.worker_port).order_by(Site.worker_port.desc()).limit(1)
-        )
-        max_port = result.scalar_one_or_none()
+        from app.services.frankenphp_service import primary_port
+        result = await self.db.execute(select(Site.worker_port))
+        # A site mid-way through blue/green reloads lives on its alternate port
+        ports = [primary_port(port) for port in result.scalars().all() if port]
         
-        if max_port:
-            return max_port + 1
+        if ports:
+            return max(ports) + 1
         return settings.FRANKENPHP_WORKER_START_PORT
     
     async def _generate_site_config(self, site: Site, primary_domain: str):
@@ -0,0 +1,309 @@
+"""
+Mergeable probabilistic sketches for per-site visitor and top-URL analytics
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from app.models.traffic import TrafficSketch
+from app.core.config import settings
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+import hashlib
+import json
+import math
+import struct
+import zlib
+from typing import Iterable, Optional
+
+# HyperLogLog with 2^12 registers: relative standard error 1.04 / sqrt(4096) = 1.6%
+HLL_PRECISION = 12
+# Count-min sketch 2048 x 4: overestimates a count by at most e/2048 (0.13%) of all
+# counted items, with probability 1 - e^-4 (98%); it never underestimates
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+TOP_K = 50
+MAX_KEY_LENGTH = 512
+
+KIND_VISITORS = "visitors"
+KIND_URLS = "urls"
+KIND_REFERRERS = "referrers"
+
+_HLL_HEADER = struct.Struct("<2sB")
+_CMS_HEADER = struct.Struct("<2sHHQI")
+
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash (unlike hash(), identical across processes and nodes, so sketches merge)"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8", "replace"), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """Cardinality estimator over 2^p one-byte registers; merging takes the register-wise max"""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytearray] = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: str):
+        h = hash64(value)
+        index = h >> (64 - self.p)
+        rest = (h << self.p) & ((1 << 64) - 1)
+        rank = min(64 - self.p, 64 - rest.bit_length()) + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range: linear counting is more accurate
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def to_bytes(self) -> bytes:
+        return _HLL_HEADER.pack(b"H1", self.p) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        magic, p = _HLL_HEADER.unpack_from(data)
+        if magic != b"H1":
+            raise ValueError("Not a HyperLogLog blob")
+        return cls(p, bytearray(zlib.decompress(data[_HLL_HEADER.size:])))
+
+
+class TopKSketch:
+    """Count-min sketch plus the heaviest keys seen so far, with their estimated counts"""
+
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, k: int = TOP_K):
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.table = array("Q", bytes(8 * width * depth))
+        self.total = 0
+        self.top: dict[str, int] = {}
+
+    def _cells(self, key: str) -> list[int]:
+        h = hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1):
+        table = self.table
+        cells = self._cells(key)
+        for cell in cells:
+            table[cell] += count
+        self.total += count
+        self._offer(key, min(table[cell] for cell in cells))
+
+    def estimate(self, key: str) -> int:
+        return min(self.table[cell] for cell in self._cells(key))
+
+    def merge(self, other: "TopKSketch"):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge count-min sketches of different dimensions")
+        self.table = array("Q", map(int.__add__, self.table, other.table))
+        self.total += other.total
+        # Only keys that were heavy in some input can be candidates; re-estimate them on the merged table
+        candidates = set(self.top) | set(other.top)
+        self.top = {}
+        for key in candidates:
+            self._offer(key, self.estimate(key))
+
+    def _offer(self, key: str, estimate: int):
+        top = self.top
+        if key in top or len(top) < self.k:
+            top[key] = estimate
+            return
+        smallest = min(top, key=top.get)
+        if estimate > top[smallest]:
+            del top[smallest]
+            top[key] = estimate
+
+    def heavy_hitters(self, limit: int) -> list[tuple[str, int]]:
+        return sorted(self.top.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def error_bound(self) -> int:
+        """Largest overestimate of any count, holding with probability 1 - e^-depth"""
+        return int(math.ceil(math.e / self.width * self.total))
+
+    def to_bytes(self) -> bytes:
+        table = zlib.compress(self.table.tobytes())
+        top = zlib.compress(json.dumps(self.top, separators=(",", ":")).encode())
+        return _CMS_HEADER.pack(b"C1", self.width, self.depth, self.total, len(table)) + table + top
+
+    @classmethod
+    def from_bytes(cls, data: bytes, k: int = TOP_K) -> "TopKSketch":
+        magic, width, depth, total, table_length = _CMS_HEADER.unpack_from(data)
+        if magic != b"C1":
+            raise ValueError("Not a count-min sketch blob")
+        sketch = cls(width, depth, k)
+        start = _CMS_HEADER.size
+        sketch.table = array("Q", zlib.decompress(data[start:start + table_length]))
+        sketch.total = total
+        sketch.top = json.loads(zlib.decompress(data[start + table_length:]))
+        return sketch
+
+
+def new_sketch(kind: str):
+    return HyperLogLog() if kind == KIND_VISITORS else TopKSketch()
+
+
+def load_sketch(kind: str, data: bytes):
+    return HyperLogLog.from_bytes(data) if kind == KIND_VISITORS else TopKSketch.from_bytes(data)
+
+
+def _day(ts: float) -> date:
+    return datetime.fromtimestamp(ts, timezone.utc).date()
+
+
+def _url_key(uri: str) -> str:
+    return uri.split("?", 1)[0][:MAX_KEY_LENGTH]
+
+
+def _referrer_key(referrer: str) -> str:
+    """Origin of a referrer URL (scheme and host), the usual grain of referrer reports"""
+    scheme, sep, rest = referrer.partition("://")
+    if not sep:
+        return ""
+    return f"{scheme.lower()}://{rest.split('/', 1)[0].lower()}"[:MAX_KEY_LENGTH]
+
+
+class SketchAggregator:
+    """Access log consumer: exact per-batch tallies, folded into each site's daily sketches on flush"""
+
+    def __init__(self, hosts=None):
+        self.hosts = hosts  # HostMap of the ingester, to leave out a site's own pages as referrers
+        self.visitors: dict[tuple[int, date], set[str]] = {}
+        self.urls: dict[tuple[int, date], Counter] = {}
+        self.referrers: dict[tuple[int, date], Counter] = {}
+
+    def add(self, site_id: int, entry: dict):
+        ts = entry.get("ts")
+        request = entry.get("request")
+        if not isinstance(ts, (int, float)) or not isinstance(request, dict):
+            return
+        key = (site_id, _day(ts))
+        client = request.get("client_ip") or request.get("remote_ip")
+        if client:
+            self.visitors.setdefault(key, set()).add(client)
+        uri = request.get("uri")
+        if uri:
+            self.urls.setdefault(key, Counter())[_url_key(uri)] += 1
+        referrer = ((request.get("headers") or {}).get("Referer") or [""])[0]
+        if referrer:
+            origin = _referrer_key(referrer)
+            host = origin.partition("://")[2]
+            if origin and (self.hosts is None or self.hosts.site_id(host) != site_id):
+                self.referrers.setdefault(key, Counter())[origin] += 1
+
+    async def flush(self, db: AsyncSession):
+        """Merge the batch into the stored daily sketches"""
+        batches = {KIND_VISITORS: self.visitors, KIND_URLS: self.urls, KIND_REFERRERS: self.referrers}
+        self.visitors, self.urls, self.referrers = {}, {}, {}
+        keys = [(site_id, day, kind) for kind, batch in batches.items() for site_id, day in batch]
+        if not keys:
+            return
+
+        stored = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            result = await db.execute(
+                select(TrafficSketch).where(
+                    tuple_(TrafficSketch.site_id, TrafficSketch.day, TrafficSketch.kind).in_(chunk)
+                )
+            )
+            for row in result.scalars().all():
+                stored[(row.site_id, row.day, row.kind)] = row.data
+
+        rows = []
+        now = datetime.now(timezone.utc)
+        for site_id, day, kind in keys:
+            data = stored.get((site_id, day, kind))
+            sketch = load_sketch(kind, data) if data else new_sketch(kind)
+            tally = batches[kind][(site_id, day)]
+            if kind == KIND_VISITORS:
+                for client in tally:
+                    sketch.add(client)
+            else:
+                for item, count in tally.items():
+                    sketch.add(item, count)
+            rows.append({"site_id": site_id, "day": day, "kind": kind, "data": sketch.to_bytes(), "updated_at": now})
+
+        table = TrafficSketch.__table__
+        for start in range(0, len(rows), 500):
+            stmt = insert(table).values(rows[start:start + 500])
+            await db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["site_id", "day", "kind"],
+                    set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+                )
+            )
+
+    async def prune(self, db: AsyncSession) -> int:
+        return await prune_sketches(db)
+
+
+async def merged_sketches(db: AsyncSession, site_id: int, start: date, end: date) -> dict:
+    """Sketches of a site merged over the days start..end (inclusive), by kind"""
+    result = await db.execute(
+        select(TrafficSketch.kind, TrafficSketch.data).where(
+            TrafficSketch.site_id == site_id,
+            TrafficSketch.day >= start,
+            TrafficSketch.day <= end,
+        )
+    )
+    merged = {kind: new_sketch(kind) for kind in (KIND_VISITORS, KIND_URLS, KIND_REFERRERS)}
+    for kind, data in result.all():
+        if kind in merged:
+            merged[kind].merge(load_sketch(kind, data))
+    return merged
+
+
+async def site_analytics(db: AsyncSession, site_id: int, period: str, end: date, limit: int = 10) -> dict:
+    """Unique visitors and top URLs/referrers of the day or week (7 days) ending on end"""
+    start = end - timedelta(days=6 if period == "week" else 0)
+    merged = await merged_sketches(db, site_id, start, end)
+    visitors, urls, referrers = merged[KIND_VISITORS], merged[KIND_URLS], merged[KIND_REFERRERS]
+    return {
+        "site_id": site_id,
+        "period": period,
+        "start": start,
+        "end": end,
+        "unique_visitors": visitors.count(),
+        "unique_visitors_error": round(visitors.relative_error(), 4),
+        "requests": urls.total,
+        "top_urls": [{"key": key, "count": count} for key, count in urls.heavy_hitters(limit)],
+        "top_urls_error": urls.error_bound(),
+        "top_referrers": [{"key": key, "count": count} for key, count in referrers.heavy_hitters(limit)],
+        "top_referrers_error": referrers.error_bound(),
+    }
+
+
+async def prune_sketches(db: AsyncSession, retention_days: Optional[int] = None) -> int:
+    """Delete daily sketches older than the retention period"""
+    days = retention_days if retention_days is not None else settings.SKETCH_RETENTION_DAYS
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=days)
+    result = await db.execute(delete(TrafficSketch).where(TrafficSketch.day < cutoff))
+    await db.commit()
+    return result.rowcount or 0
+
+
+def merge_blobs(kind: str, blobs: Iterable[bytes]) -> bytes:
+    """Merge serialized sketches of the same kind, e.g. the same day collected on several nodes"""
+    merged = new_sketch(kind)
+    for blob in blobs:
+        merged.merge(load_sketch(kind, blob))
+    return merged.to_bytes()
@@ -0,0 +1,450 @@
+"""
+MySQL slow query log digests: statements normalized to fingerprints and rolled up per database and day
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, text, func, tuple_, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from app.models.database import Database, SlowQueryRollup, QUERY_TIME_BUCKETS_MS
+from app.services.access_log_service import LogTailer, READ_CHUNK_BYTES, MAX_BYTES_PER_RUN, percentile
+from app.core.config import settings
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+import asyncio
+import hashlib
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+UPSERT_BATCH = 500
+HISTOGRAM_SIZE = len(QUERY_TIME_BUCKETS_MS) + 1
+MAX_STATEMENT_BYTES = 64 * 1024  # Longer statements are cut before they are fingerprinted
+MAX_TEXT_CHARS = 4096  # Stored fingerprint length
+EPOCH = date(1970, 1, 1)
+COUNTER_COLUMNS = ("calls", "query_time_sum", "lock_time_sum", "rows_sent", "rows_examined")
+
+# Sort keys of the top slow queries of a site
+ORDERS = ("total_time", "avg_time", "max_time", "calls", "rows_examined")
+
+# Scanned left to right so quotes inside comments and comment markers inside strings are not misread
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|/\*.*?\*/|(?:--\s|#)[^\n]*", re.S)
+_NUMBER_RE = re.compile(r"\b0x[0-9a-f]+\b|\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bin \( ?\?(?: ?, ?\?)* ?\)")
+_VALUES_RE = re.compile(r"\b(values?) ?\([^()]*\)(?: ?, ?\([^()]*\))*")
+_SPACE_RE = re.compile(r"\s+")
+
+_QUERY_TIME_RE = re.compile(
+    rb"Query_time:\s*([\d.]+)\s+Lock_time:\s*([\d.]+)\s+Rows_sent:\s*(\d+)\s+Rows_examined:\s*(\d+)"
+)
+_SCHEMA_RE = re.compile(rb"\bSchema:\s*(\S+)")
+_USE_RE = re.compile(rb"use\s+`?([^`;\s]+)`?;", re.I)
+_TIMESTAMP_RE = re.compile(rb"SET timestamp=(\d+)")
+
+
+def fingerprint(statement: str) -> str:
+    """Statement with comments dropped, literals replaced by ? and lists collapsed, lower-cased"""
+    fp = _LITERAL_RE.sub(lambda m: "?" if m.group(0)[0] in "'\"" else " ", statement)
+    fp = _SPACE_RE.sub(" ", fp).strip().rstrip(";").rstrip().lower()
+    fp = _NUMBER_RE.sub("?", fp)
+    fp = _IN_LIST_RE.sub("in(?+)", fp)
+    return _VALUES_RE.sub(r"\1(?+)", fp)
+
+
+def fingerprint_hash(fp: str) -> int:
+    """Signed 64-bit id of a fingerprint"""
+    return int.from_bytes(hashlib.blake2b(fp.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def _is_banner(line: bytes) -> bool:
+    """Lines the server writes when it (re)opens the log"""
+    return line.endswith(b"started with:") or line.startswith(b"Tcp port:") or (
+        line.startswith(b"Time ") and b"Id Command" in line
+    )
+
+
+class SlowLogParser:
+    """Incremental parser of MySQL/MariaDB slow log entries, fed one line at a time.
+
+    An entry is its '#' header lines, optional use/SET timestamp lines and the
+    statement; it is complete once the next entry's header starts. MySQL only
+    writes 'use' when the schema changes, so it carries over to later entries.
+    """
+
+    def __init__(self, emit: Callable[[Optional[str], dict, str], None], schema: Optional[str] = None):
+        self.emit = emit
+        self.schema = schema
+        self.entry: Optional[dict] = None  # Header fields of the entry being read
+        self.entry_start = 0
+        self.entry_schema = schema  # Schema in effect before the entry being read
+        self.statement: list[bytes] = []
+        self.statement_bytes = 0
+
+    def feed(self, line: bytes, position: int):
+        """One line without its newline; position is its offset in the file"""
+        if line.startswith(b"#"):
+            if line.startswith(b"# administrator command:"):
+                # Logged in place of a statement (e.g. Quit); nothing to fingerprint
+                self.finish()
+                return
+            if self.entry is None or self.statement:
+                self.finish()
+                self.entry = {}
+                self.entry_start = position
+                self.entry_schema = self.schema
+            self._header(line)
+            return
+        if self.entry is None:
+            return
+        if _is_banner(line):
+            self.finish()
+            return
+        if not self.statement:
+            match = _USE_RE.match(line)
+            if match:
+                self.schema = self.entry["schema"] = match.group(1).decode("utf-8", "replace")
+                return
+            match = _TIMESTAMP_RE.match(line)
+            if match:
+                self.entry["timestamp"] = int(match.group(1))
+                return
+        if self.statement_bytes < MAX_STATEMENT_BYTES:
+            self.statement.append(line)
+            self.statement_bytes += len(line) + 1
+
+    def _header(self, line: bytes):
+        match = _QUERY_TIME_RE.search(line)
+        if match:
+            self.entry["query_time"] = float(match.group(1))
+            self.entry["lock_time"] = float(match.group(2))
+            self.entry["rows_sent"] = int(match.group(3))
+            self.entry["rows_examined"] = int(match.group(4))
+            return
+        # MariaDB names the schema of every entry: "# Thread_id: 8  Schema: wp  QC_hit: No"
+        match = _SCHEMA_RE.search(line)
+        if match:
+            self.entry["schema"] = match.group(1).decode("utf-8", "replace")
+
+    def finish(self):
+        """Emit the entry being read as complete"""
+        entry, statement = self.entry, self.statement
+        self.entry, self.statement, self.statement_bytes = None, [], 0
+        if entry is None or not statement or "query_time" not in entry:
+            return
+        statement_text = b"\n".join(statement)[:MAX_STATEMENT_BYTES].decode("utf-8", "replace")
+        self.emit(entry.get("schema") or self.schema, entry, statement_text)
+
+    def resume(self, position: int) -> tuple[int, Optional[str]]:
+        """Where to continue reading, and the schema in effect there: an unfinished entry is read again"""
+        if self.entry is not None:
+            return self.entry_start, self.entry_schema
+        return position, self.schema
+
+
+class QueryRollup:
+    """Counters of one fingerprint, database and day while a batch is aggregated"""
+    __slots__ = (
+        "site_id", "fingerprint", "calls", "query_time_sum", "query_time_max", "lock_time_sum",
+        "rows_sent", "rows_examined", "histogram", "last_seen",
+    )
+
+    def __init__(self, site_id: int, fp: str):
+        self.site_id = site_id
+        self.fingerprint = fp
+        self.calls = 0
+        self.query_time_sum = 0.0
+        self.query_time_max = -1.0
+        self.lock_time_sum = 0.0
+        self.rows_sent = 0
+        self.rows_examined = 0
+        self.histogram = [0] * HISTOGRAM_SIZE
+        self.last_seen = 0
+
+    def add(self, entry: dict, timestamp: int):
+        query_time = entry["query_time"]
+        self.calls += 1
+        self.query_time_sum += query_time
+        self.lock_time_sum += entry["lock_time"]
+        self.rows_sent += entry["rows_sent"]
+        self.rows_examined += entry["rows_examined"]
+        self.histogram[bisect_left(QUERY_TIME_BUCKETS_MS, query_time * 1000.0)] += 1
+        self.query_time_max = max(self.query_time_max, query_time)
+        self.last_seen = max(self.last_seen, timestamp)
+
+    def row(self, database_id: int, fp_hash: int, day: int) -> dict:
+        return {
+            "database_id": database_id,
+            "fingerprint_hash": fp_hash,
+            "day": EPOCH + timedelta(days=day),
+            "site_id": self.site_id,
+            "fingerprint": self.fingerprint[:MAX_TEXT_CHARS],
+            "calls": self.calls,
+            "query_time_sum": self.query_time_sum,
+            "query_time_max": self.query_time_max,
+            "lock_time_sum": self.lock_time_sum,
+            "rows_sent": self.rows_sent,
+            "rows_examined": self.rows_examined,
+            "query_time_histogram": self.histogram,
+            "last_seen": datetime.fromtimestamp(self.last_seen, timezone.utc),
+        }
+
+
+class SlowQueryAggregator:
+    """Folds slow log entries into daily rollups per fingerprint and adds them to the stored ones"""
+
+    def __init__(self):
+        self.rollups: dict[tuple[int, int, int], QueryRollup] = {}  # (database_id, fingerprint hash, day)
+
+    def add(self, database_id: int, site_id: int, entry: dict, statement: str):
+        timestamp = entry.get("timestamp") or int(time.time())
+        fp = fingerprint(statement)
+        key = (database_id, fingerprint_hash(fp), timestamp // 86400)
+        rollup = self.rollups.get(key)
+        if rollup is None:
+            rollup = self.rollups[key] = QueryRollup(site_id, fp)
+        rollup.add(entry, timestamp)
+
+    async def flush(self, db: AsyncSession):
+        """Upsert the batch: counters are added, maximums kept, histograms summed"""
+        rows = [rollup.row(*key) for key, rollup in sorted(self.rollups.items())]
+        # Cleared up front: if the upsert fails, the checkpoint is not saved and the entries are read again
+        self.rollups.clear()
+        table = SlowQueryRollup.__table__
+        for start in range(0, len(rows), UPSERT_BATCH):
+            stmt = insert(table).values(rows[start:start + UPSERT_BATCH])
+            excluded = stmt.excluded
+            update = {column: table.c[column] + excluded[column] for column in COUNTER_COLUMNS}
+            update["query_time_max"] = func.greatest(table.c.query_time_max, excluded.query_time_max)
+            update["last_seen"] = func.greatest(table.c.last_seen, excluded.last_seen)
+            update["query_time_histogram"] = literal_column(
+                "ARRAY(SELECT a + b FROM unnest(slow_query_rollups.query_time_histogram, "
+                "excluded.query_time_histogram) AS t(a, b))"
+            )
+            await db.execute(
+                stmt.on_conflict_do_update(index_elements=["database_id", "fingerprint_hash", "day"], set_=update)
+            )
+
+    async def prune(self, db: AsyncSession, retention_days: Optional[int] = None) -> int:
+        """Delete rollups older than the retention period"""
+        days = retention_days if retention_days is not None else settings.SLOW_QUERY_RETENTION_DAYS
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=days)
+        result = await db.execute(delete(SlowQueryRollup).where(SlowQueryRollup.day < cutoff))
+        await db.commit()
+        return result.rowcount or 0
+
+
+class DatabaseMap:
+    """Schema name -> (database id, site id), refreshed from the databases table"""
+
+    def __init__(self):
+        self.databases: dict[str, tuple[int, int]] = {}
+        self.loaded_at = 0.0
+
+    async def refresh(self, db: AsyncSession, max_age: float = 60.0):
+        if time.monotonic() - self.loaded_at < max_age:
+            return
+        result = await db.execute(select(Database.name, Database.id, Database.site_id))
+        self.databases = {name: (database_id, site_id) for name, database_id, site_id in result.all()}
+        self.loaded_at = time.monotonic()
+
+
+class SlowLogIngester(LogTailer):
+    """Tails the MySQL slow query log and rolls entries of panel databases up per fingerprint and day.
+
+    Memory stays bounded however large the log is: a run reads at most
+    MAX_BYTES_PER_RUN, keeps one rollup per distinct (database, fingerprint,
+    day) and cuts statements at MAX_STATEMENT_BYTES. The checkpoint also
+    holds the schema of the last 'use' line, and points at the start of an
+    entry that may still be incomplete so it is read again in full.
+    """
+
+    def __init__(self, log_file: Optional[str] = None):
+        super().__init__(log_file or settings.SLOW_LOG_FILE, "slow_log_checkpoint.json")
+        self.databases = DatabaseMap()
+        self.aggregator = SlowQueryAggregator()
+        self.attributed = 0
+        self.unattributed = 0  # Entries of schemas the panel does not manage
+        self._schema: Optional[str] = None
+        self._parser: Optional[SlowLogParser] = None  # Parser of the file being read
+        self._position = 0  # File offset of the next line fed to it
+        self._last_prune = 0.0
+
+    async def run(self, db: AsyncSession) -> int:
+        """Ingest new entries; returns the number attributed to a panel database"""
+        await self.databases.refresh(db)
+        checkpoint = self._load_checkpoint()
+        self._schema = checkpoint.get("schema")
+        entries, checkpoint = await asyncio.to_thread(self.ingest, checkpoint)
+        checkpoint["schema"] = self._schema
+        await self.aggregator.flush(db)
+        await db.commit()
+        # Saved after the commit: a crash in between re-reads (and double counts) one batch at most
+        self._save_checkpoint(checkpoint)
+        if time.monotonic() - self._last_prune > 3600:
+            await self.aggregator.prune(db)
+            self._last_prune = time.monotonic()
+        return entries
+
+    def _read(self, path: str, offset: int, budget: int) -> tuple[int, int]:
+        """Parse entries from offset on; returns (entries, offset the next read resumes from)"""
+        # A file read from the top starts without a schema; mid-file, the checkpointed one applies
+        parser = self._parser = SlowLogParser(self._add, self._schema if offset else None)
+        self._position = offset
+        attributed = self.attributed
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return 0, offset
+        full_run = budget >= MAX_BYTES_PER_RUN
+        eof = False
+        with f:
+            f.seek(offset)
+            pending = b""
+            while budget > 0:
+                chunk = f.read(min(READ_CHUNK_BYTES, budget))
+                if not chunk:
+                    eof = True
+                    break
+                budget -= len(chunk)
+                data = pending + chunk
+                end = data.rfind(b"\n")
+                if end < 0:
+                    pending = data
+                    continue
+                pending = data[end + 1:]
+                self._parse(data[:end].split(b"\n"))
+        if eof and path != self.log_file:
+            # Nothing more is written to a rotated file, so its last entry is complete
+            parser.finish()
+        resume, schema = parser.resume(self._position)
+        if resume == offset and not eof and full_run:
+            # One entry larger than the whole budget: take it as it is rather than never moving on
+            parser.finish()
+            resume, schema = parser.resume(self._position)
+        self._schema = schema
+        return self.attributed - attributed, resume
+
+    def _parse(self, lines: Iterable[bytes]) -> int:
+        """Feed complete lines to the current file's parser; returns the entries attributed meanwhile"""
+        attributed = self.attributed
+        for line in lines:
+            self._parser.feed(line, self._position)
+            self._position += len(line) + 1
+        return self.attributed - attributed
+
+    def _add(self, schema: Optional[str], entry: dict, statement: str):
+        target = self.databases.databases.get(schema) if schema else None
+        if target is None:
+            self.unattributed += 1
+            return
+        self.aggregator.add(target[0], target[1], entry, statement)
+        self.attributed += 1
+
+
+async def top_slow_queries(
+    db: AsyncSession, site_id: int, days: int = 7, order: str = "total_time", limit: int = 20
+) -> list[dict]:
+    """The site's slowest statement fingerprints over the last days (UTC, today included)"""
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order: {order}")
+    R = SlowQueryRollup
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    calls = func.sum(R.calls)
+    total = func.sum(R.query_time_sum)
+    keys = {
+        "total_time": total,
+        "avg_time": total / calls,
+        "max_time": func.max(R.query_time_max),
+        "calls": calls,
+        "rows_examined": func.sum(R.rows_examined),
+    }
+    in_range = (R.site_id == site_id, R.day >= since)
+    result = await db.execute(
+        select(
+            R.database_id,
+            R.fingerprint_hash,
+            Database.name.label("database"),
+            calls.label("calls"),
+            total.label("query_time_sum"),
+            func.max(R.query_time_max).label("query_time_max"),
+            func.sum(R.lock_time_sum).label("lock_time_sum"),
+            func.sum(R.rows_sent).label("rows_sent"),
+            func.sum(R.rows_examined).label("rows_examined"),
+            func.max(R.last_seen).label("last_seen"),
+        )
+        .join(Database, Database.id == R.database_id)
+        .where(*in_range)
+        .group_by(R.database_id, R.fingerprint_hash, Database.name)
+        .order_by(keys[order].desc())
+        .limit(limit)
+    )
+    top = result.all()
+    if not top:
+        return []
+    pairs = [(row.database_id, row.fingerprint_hash) for row in top]
+
+    # Fingerprint text of each pair, from its slowest day
+    result = await db.execute(
+        select(R.database_id, R.fingerprint_hash, R.fingerprint)
+        .where(*in_range, tuple_(R.database_id, R.fingerprint_hash).in_(pairs))
+        .distinct(R.database_id, R.fingerprint_hash)
+        .order_by(R.database_id, R.fingerprint_hash, R.query_time_max.desc())
+    )
+    texts = {(row.database_id, row.fingerprint_hash): row.fingerprint for row in result.all()}
+
+    # Histograms are summed per bucket index in SQL, as for traffic rollups
+    histograms = {pair: [0] * HISTOGRAM_SIZE for pair in pairs}
+    result = await db.execute(
+        text(
+            "SELECT database_id, fingerprint_hash, h.idx, sum(h.n) "
+            "FROM slow_query_rollups, unnest(query_time_histogram) WITH ORDINALITY AS h(n, idx) "
+            "WHERE site_id = :site_id AND day >= :since AND fingerprint_hash IN :hashes "
+            "GROUP BY 1, 2, 3"
+        ).bindparams(bindparam("hashes", expanding=True)),
+        {"site_id": site_id, "since": since, "hashes": sorted({fp_hash for _, fp_hash in pairs})},
+    )
+    for database_id, fp_hash, idx, count in result.all():
+        histogram = histograms.get((database_id, fp_hash))
+        if histogram is not None and 0 < idx <= HISTOGRAM_SIZE:
+            histogram[idx - 1] = int(count)
+
+    queries = []
+    for row in top:
+        pair = (row.database_id, row.fingerprint_hash)
+        fp = texts.get(pair, "")
+        row_calls = int(row.calls or 0)
+        queries.append({
+            "database_id": row.database_id,
+            "database": row.database,
+            "fingerprint_id": format(row.fingerprint_hash & 0xFFFFFFFFFFFFFFFF, "016x"),
+            "fingerprint": fp,
+            "calls": row_calls,
+            "total_ms": round(float(row.query_time_sum or 0) * 1000.0, 1),
+            "avg_ms": round(float(row.query_time_sum or 0) * 1000.0 / row_calls, 1) if row_calls else None,
+            "max_ms": round(float(row.query_time_max or 0) * 1000.0, 1),
+            "p95_ms": percentile(histograms[pair], 0.95, QUERY_TIME_BUCKETS_MS),
+            "lock_ms": round(float(row.lock_time_sum or 0) * 1000.0, 1),
+            "rows_sent": int(row.rows_sent or 0),
+            "rows_examined": int(row.rows_examined or 0),
+            "last_seen": row.last_seen,
+        })
+    return queries
+
+
+_ingester: Optional[SlowLogIngester] = None
+
+
+def get_slow_log_ingester() -> SlowLogIngester:
+    """Process-wide slow log ingester (its database map persists between runs)"""
+    global _ingester
+    if _ingester is None:
+        _ingester = SlowLogIngester()
+    return _ingester
+
+
+async def ingest_slow_log():
+    """Background job: fold new slow log entries into per-fingerprint rollups"""
+    from app.core.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await get_slow_log_ingester().run(db)
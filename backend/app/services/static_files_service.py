@@ -0,0 +1,134 @@
+"""
+Static assets served by Caddy straight from the site root, bypassing the PHP worker
+"""
+from app.models.site import SiteType
+from app.core.config import settings
+from app.services import precompress_service
+from dataclasses import dataclass, field, fields, asdict
+from typing import Any, Optional
+import re
+
+# Only these are served directly; anything else (PHP, dotfiles, archives, generated XML) goes to the worker
+DEFAULT_EXTENSIONS = [
+    "css", "js", "mjs", "map",
+    "png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp",
+    "woff", "woff2", "ttf", "otf", "eot",
+    "mp4", "webm", "ogg", "mp3", "wav", "pdf",
+]
+
+# Content-hashed file names (app.3f9a1c2b.js) and WordPress' ?ver= query strings never change content
+FINGERPRINT_REGEX = r"[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_EXTENSION_RE = re.compile(r"^[a-z0-9]{1,10}$")
+
+
+@dataclass
+class StaticFileRules:
+    """Static file settings of one site, stored in Site.config["static_files"]"""
+    root: str = ""
+    enabled: bool = True
+    extensions: list[str] = field(default_factory=lambda: list(DEFAULT_EXTENSIONS))
+    max_age: int = 86400  # Cache-Control max-age (seconds) of assets that are not fingerprinted
+    static_site: bool = False  # SiteType.STATIC: everything is served from disk, there is no worker
+
+    @classmethod
+    def for_site(cls, site_type: SiteType, path: str, config: Optional[dict]) -> "StaticFileRules":
+        rules = cls(root=path, static_site=site_type == SiteType.STATIC)
+        names = {f.name for f in fields(cls)} - {"root", "static_site"}
+        for key, value in dict((config or {}).get("static_files") or {}).items():
+            if key in names:
+                setattr(rules, key, value)
+        rules.validate()
+        return rules
+
+    def validate(self):
+        if self.max_age < 0:
+            raise ValueError("max_age must not be negative")
+        for extension in self.extensions:
+            if not _EXTENSION_RE.match(extension) or extension.startswith("php"):
+                raise ValueError(f"Invalid static file extension: {extension!r}")
+        if any(c.isspace() or c in '"{}' for c in self.root):
+            raise ValueError(f"Unsupported characters in site path: {self.root!r}")
+
+    @property
+    def active(self) -> bool:
+        return self.static_site or (settings.STATIC_FILES_ENABLED and self.enabled and bool(self.extensions))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def file_server_caddyfile(self) -> str:
+        options = []
+        if self.static_site:
+            options.append("hide .*")
+        if settings.PRECOMPRESS_ENABLED:
+            # .br/.gz siblings written by the precompression job, when present
+            options.append("precompressed " + " ".join(precompress_service.encodings()))
+        if not options:
+            return "        file_server\n"
+        return "        file_server {\n" + "".join(f"            {o}\n" for o in options) + "        }\n"
+
+    def path_patterns(self) -> list[str]:
+        return [f"*.{extension}" for extension in self.extensions]
+
+    def caddyfile(self) -> str:
+        """Site block lines serving files from disk; assets missing on disk fall through to the worker"""
+        if not self.active:
+            return ""
+        lines = (
+            f"    @fingerprinted path_regexp fingerprinted {FINGERPRINT_REGEX}\n"
+            "    @versioned query ver=*\n"
+        )
+        headers = (
+            f'        header @fingerprinted Cache-Control "{IMMUTABLE_CACHE_CONTROL}"\n'
+            f'        header @versioned Cache-Control "{IMMUTABLE_CACHE_CONTROL}"\n'
+        )
+        if self.static_site:
+            # Pages keep revalidating; only assets get a max-age
+            return (
+                f"{lines}    @static path {' '.join(self.path_patterns())}\n"
+                f"    handle {{\n        root * {self.root}\n"
+                f'        header @static Cache-Control "public, max-age={self.max_age}"\n{headers}'
+                f"{self.file_server_caddyfile()}    }}\n"
+            )
+        return (
+            f"{lines}    @static {{\n        path {' '.join(self.path_patterns())}\n"
+            f"        file {{\n            root {self.root}\n            try_files {{path}}\n        }}\n    }}\n"
+            f"    handle @static {{\n        root * {self.root}\n"
+            f'        header Cache-Control "public, max-age={self.max_age}"\n{headers}'
+            f"{self.file_server_caddyfile()}    }}\n"
+        )
+
+    def routes_json(self) -> list[dict]:
+        """Routes of the admin API backend, placed before the proxy"""
+        if not self.active:
+            return []
+        header = lambda value: {"handler": "headers", "response": {"set": {"Cache-Control": [value]}}}
+        serve: dict[str, Any] = {"handler": "file_server", "root": self.root}
+        route: dict[str, Any] = {}
+        if settings.PRECOMPRESS_ENABLED:
+            order = precompress_service.encodings()
+            serve["precompressed"] = {encoding: {} for encoding in order}
+            serve["precompressed_order"] = order
+        if self.static_site:
+            serve["hide"] = [".*"]
+        else:
+            on_disk = {"root": self.root, "try_files": ["{http.request.uri.path}"]}
+            route["match"] = [{"path": self.path_patterns(), "file": on_disk}]
+        route["handle"] = [{
+            "handler": "subroute",
+            "routes": [
+                {"match": [{"path": self.path_patterns()}], "handle": [header(f"public, max-age={self.max_age}")]},
+                {
+                    "match": [
+                        {"path_regexp": {"name": "fingerprinted", "pattern": FINGERPRINT_REGEX}},
+                        {"query": {"ver": ["*"]}},
+                    ],
+                    "handle": [header(IMMUTABLE_CACHE_CONTROL)],
+                },
+                {"handle": [serve]},
+            ],
+        }]
+        route["terminal"] = True
+        return [route]
@@ -0,0 +1,105 @@
+"""
+Benchmark: dumping and restoring one database, mysqldump/mysql vs the parallel dump engine
+
+Run from backend/ with the backend's environment (.env) available and MySQL reachable:
+
+    python benchmarks/database_dump.py --database wp_shop --threads 8
+
+Dumps --database with `mysqldump --single-transaction | gzip` (what backups
+used to do, plus compression) and with DumpEngine, then loads each dump into
+the scratch database fp_bench_restore (created and dropped here) with
+`mysql` and with DumpEngine. Reports wall time and dump size per method.
+The source database is only read.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.services.database_dump_service import DumpEngine  # noqa: E402
+from app.services.mysql_admin_service import connect, quote_identifier  # noqa: E402
+
+SCRATCH = "fp_bench_restore"
+
+
+def client_args() -> list[str]:
+    args = [f"--user={settings.MYSQL_ROOT_USER}", f"--password={settings.MYSQL_ROOT_PASSWORD}"]
+    if settings.MYSQL_SOCKET:
+        return args + [f"--socket={settings.MYSQL_SOCKET}"]
+    return args + [f"--host={settings.MYSQL_HOST}", f"--port={settings.MYSQL_PORT}"]
+
+
+def reset_scratch(create: bool = True):
+    connection = connect(autocommit=True)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {quote_identifier(SCRATCH)}")
+    if create:
+        cursor.execute(f"CREATE DATABASE {quote_identifier(SCRATCH)} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+    cursor.close()
+    connection.close()
+
+
+def mysqldump(database: str, path: str) -> float:
+    started = time.perf_counter()
+    with open(path, "wb") as out:
+        dump = subprocess.Popen(["mysqldump", *client_args(), "--single-transaction", database], stdout=subprocess.PIPE)
+        subprocess.run(["gzip", "-3"], stdin=dump.stdout, stdout=out, check=True)
+        dump.stdout.close()
+        if dump.wait() != 0:
+            raise RuntimeError("mysqldump failed")
+    return time.perf_counter() - started
+
+
+def mysql_load(path: str) -> float:
+    started = time.perf_counter()
+    unzip = subprocess.Popen(["gzip", "-dc", path], stdout=subprocess.PIPE)
+    subprocess.run(["mysql", *client_args(), SCRATCH], stdin=unzip.stdout, check=True)
+    unzip.stdout.close()
+    unzip.wait()
+    return time.perf_counter() - started
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--threads", type=int, default=settings.DB_DUMP_THREADS)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="fp_bench_dump_")
+    try:
+        single = os.path.join(work, "dump.sql.gz")
+        chunks = os.path.join(work, "chunks")
+        engine = DumpEngine(args.threads)
+
+        results = []
+        dump_s = mysqldump(args.database, single)
+        reset_scratch()
+        results.append(("mysqldump", dump_s, mysql_load(single), os.path.getsize(single)))
+
+        report = engine.dump(args.database, chunks)
+        reset_scratch()
+        started = time.perf_counter()
+        engine.load(chunks, SCRATCH)
+        results.append((f"engine x{args.threads}", report["seconds"], time.perf_counter() - started, directory_size(chunks)))
+
+        print(f"{args.database}: {report['tables']} tables, {report['rows']} rows, {report['chunks']} chunks\n")
+        print(f"{'method':<14}{'dump s':>10}{'load s':>10}{'size MiB':>11}")
+        for label, dumped, loaded, size in results:
+            print(f"{label:<14}{dumped:>10.1f}{loaded:>10.1f}{size / 1048576:>11.1f}")
+    finally:
+        reset_scratch(create=False)
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: provisioning MySQL databases concurrently, per-call blocking connections vs the admin pool
+
+Run from backend/ with the backend's environment (.env) available and MySQL reachable:
+
+    python benchmarks/mysql_provisioning.py --databases 100
+
+Creates --databases databases (and users) named fp_bench_<n> with all
+requests issued at once, then drops them, twice: the way DatabaseService used
+to do it (a fresh blocking root connection per call, on the event loop) and
+through MySQLAdmin (pooled connections on a thread pool). Reports wall time,
+connections opened and the worst event loop stall seen by a 10 ms ticker,
+which is what every other request served by the process waits on.
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.mysql_admin_service import MySQLAdmin  # noqa: E402
+
+PREFIX = "fp_bench_"
+
+
+class BlockingAdmin:
+    """The previous implementation: connect as root, run the DDL and disconnect, inside async def"""
+
+    def __init__(self):
+        self.connects = 0
+
+    def _connect(self):
+        self.connects += 1
+        return mysql.connector.connect(
+            host=settings.MYSQL_HOST,
+            port=settings.MYSQL_PORT,
+            user=settings.MYSQL_ROOT_USER,
+            password=settings.MYSQL_ROOT_PASSWORD,
+            unix_socket=settings.MYSQL_SOCKET,
+        )
+
+    async def create_database(self, name: str, username: str, password: str):
+        connection = self._connect()
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{name}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+        cursor.execute(f"CREATE USER IF NOT EXISTS '{username}'@'localhost' IDENTIFIED BY '{password}'")
+        cursor.execute(f"GRANT ALL PRIVILEGES ON `{name}`.* TO '{username}'@'localhost'")
+        cursor.execute("FLUSH PRIVILEGES")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    async def drop_database(self, name: str, username: str):
+        connection = self._connect()
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+        cursor.execute(f"DROP USER IF EXISTS '{username}'@'localhost'")
+        cursor.execute("FLUSH PRIVILEGES")
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    def close(self):
+        pass
+
+
+async def ticker(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Largest delay of a periodic 10 ms timer, i.e. the longest the event loop was blocked"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def measure(admin, count: int) -> dict:
+    names = [f"{PREFIX}{i}" for i in range(count)]
+    password = secrets.token_urlsafe(24)
+    stop = asyncio.Event()
+    stall = asyncio.create_task(ticker(stop))
+    await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(admin.create_database(name, f"u_{name}", password) for name in names))
+    created = time.perf_counter() - started
+    started = time.perf_counter()
+    await asyncio.gather(*(admin.drop_database(name, f"u_{name}") for name in names))
+    dropped = time.perf_counter() - started
+
+    stop.set()
+    return {"create": created, "drop": dropped, "stall_ms": await stall * 1000, "connects": admin.connects}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--databases", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=settings.MYSQL_ADMIN_POOL_SIZE)
+    args = parser.parse_args()
+
+    print(f"{args.databases} databases, all requested at once; pool size {args.pool_size}\n")
+    print(f"{'client':<12}{'create s':>10}{'drop s':>10}{'per db ms':>11}{'connects':>10}{'max stall ms':>14}")
+    for label, admin in (("blocking", BlockingAdmin()), ("pooled", MySQLAdmin(args.pool_size))):
+        try:
+            r = await measure(admin, args.databases)
+        finally:
+            admin.close()
+        per_db = (r["create"] + r["drop"]) / args.databases * 1000
+        print(
+            f"{label:<12}{r['create']:>10.2f}{r['drop']:>10.2f}{per_db:>11.1f}"
+            f"{r['connects']:>10}{r['stall_ms']:>14.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""
+Benchmark: static asset throughput through a FrankenPHP worker vs Caddy's file_server
+
+Run from backend/ with the backend's environment (.env) available:
+
+    python benchmarks/static_assets.py --requests 20000 --concurrency 64
+
+By default a throwaway document root with a CSS file, a JPEG-sized blob and a
+small JS file is served twice on loopback: by `frankenphp php-server` (what
+every asset request used to reach) and by `caddy file-server` (what serves
+them now). Pass --worker-url and --direct-url to measure a live site instead,
+e.g. its worker port and Caddy with --host set to one of its domains.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+
+ASSETS = {
+    "/assets/style.css": b"body{margin:0;font-family:sans-serif}\n" * 700,  # ~27 KB
+    "/assets/app.js": b"console.log('frankenpanel');\n" * 120,  # ~3.5 KB
+    "/uploads/photo.jpg": os.urandom(180 * 1024),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_root() -> str:
+    root = tempfile.mkdtemp(prefix="fp-static-bench-")
+    for path, body in ASSETS.items():
+        target = os.path.join(root, path.lstrip("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+    with open(os.path.join(root, "index.php"), "w") as f:
+        f.write("<?php echo 'ok';\n")
+    return root
+
+
+async def wait_listening(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def run_load(base_url: str, path: str, host: str, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, headers={"Host": host}) as client:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    await response.aread()
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "errors": errors,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--worker-url", help="Live worker, e.g. http://127.0.0.1:8081")
+    parser.add_argument("--direct-url", help="Live Caddy, e.g. http://127.0.0.1")
+    parser.add_argument("--host", default="localhost", help="Host header (a domain of the site for live runs)")
+    parser.add_argument("--path", action="append", help="Asset path(s) to request (live runs)")
+    args = parser.parse_args()
+
+    processes, root = [], None
+    try:
+        if args.worker_url and args.direct_url:
+            targets = {"worker": args.worker_url, "direct": args.direct_url}
+            paths = args.path or ["/"]
+        else:
+            root = make_root()
+            worker_port, direct_port = free_port(), free_port()
+            processes.append(subprocess.Popen(
+                [settings.FRANKENPHP_BIN, "php-server", "--root", root, "--listen", f"127.0.0.1:{worker_port}"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+            processes.append(subprocess.Popen(
+                [settings.CADDY_BIN, "file-server", "--root", root, "--listen", f"127.0.0.1:{direct_port}"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+            targets = {
+                "worker": f"http://127.0.0.1:{worker_port}",
+                "direct": f"http://127.0.0.1:{direct_port}",
+            }
+            paths = list(ASSETS)
+            for url in targets.values():
+                await wait_listening(url + paths[0])
+
+        print(f"{args.requests:,} requests per run, concurrency {args.concurrency}\n")
+        print(f"{'path':<22}{'served by':<10}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for path in paths:
+            results = {}
+            for name, url in targets.items():
+                # Warm up connections and the page cache of the file
+                await run_load(url, path, args.host, min(500, args.requests), args.concurrency)
+                results[name] = await run_load(url, path, args.host, args.requests, args.concurrency)
+                r = results[name]
+                print(f"{path:<22}{name:<10}{r['rps']:>10.0f}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['errors']:>8}")
+            speedup = results["direct"]["rps"] / results["worker"]["rps"] if results["worker"]["rps"] else 0
+            print(f"{'':<22}{'speedup':<10}{speedup:>9.1f}x")
+        print("\n(The client runs in one Python process; at high rates it can be the bottleneck, not the server.)")
+    finally:
+        for process in processes:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Benchmark: on-demand TLS ask lookups against the in-memory domain index
+
+Run from backend/ with the backend's environment (.env) available:
+
+    python benchmarks/tls_ask.py --domains 1000000
+
+Reports build time, memory footprint and per-lookup latency of DomainIndex
+next to a plain set of str, plus the latency of a full HTTP round trip
+to the ask listener over loopback (keep-alive, no database).
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.services.domain_index_service import DomainIndex, get_domain_index, _answer_asks  # noqa: E402
+
+
+def make_domains(count: int) -> list[str]:
+    return [f"site{i}.customer{i % 9973}.example.com" for i in range(count)]
+
+
+def measure_build(factory, domains: list[str]):
+    """(structure, build seconds, bytes allocated); memory is traced in a separate build since tracing slows it down"""
+    gc.collect()
+    tracemalloc.start()
+    built = factory(domains)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    gc.collect()
+    started = time.perf_counter()
+    built = factory(domains)
+    return built, time.perf_counter() - started, memory
+
+
+def lookup_latencies(index, queries: list[str], rounds: int = 5) -> tuple[float, float]:
+    """(mean ns per lookup, p99 ns of per-batch means)"""
+    batch = 1000
+    samples = []
+    for _ in range(rounds):
+        for start in range(0, len(queries), batch):
+            chunk = queries[start:start + batch]
+            t = time.perf_counter_ns()
+            for domain in chunk:
+                domain in index
+            samples.append((time.perf_counter_ns() - t) / len(chunk))
+    samples.sort()
+    return statistics.fmean(samples), samples[int(len(samples) * 0.99)]
+
+
+async def http_round_trips(queries: list[str]) -> list[float]:
+    server = await asyncio.start_server(_answer_asks, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    latencies = []
+    try:
+        for domain in queries:
+            request = f"GET {settings.TLS_ASK_PATH}?domain={domain} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+            t = time.perf_counter_ns()
+            writer.write(request.encode())
+            await reader.readuntil(b"\r\n\r\n")
+            latencies.append((time.perf_counter_ns() - t) / 1000)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.sleep(0.1)  # Let the handler see EOF before the server goes away
+        server.close()
+        await server.wait_closed()
+    return latencies
+
+
+def build_index(domains: list[str]) -> DomainIndex:
+    index = DomainIndex()
+    index.replace(domains)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domains", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    domains = make_domains(args.domains)
+    hits = random.sample(domains, min(args.queries // 2, len(domains)))
+    misses = [f"unknown{i}.attacker.test" for i in range(args.queries - len(hits))]
+    queries = hits + misses
+    random.shuffle(queries)
+
+    print(f"{args.domains:,} domains, {len(queries):,} lookups (half hits, half misses)\n")
+    print(f"{'structure':<14}{'build s':>10}{'memory MiB':>13}{'mean ns':>10}{'p99 ns':>10}")
+    for name, factory in (("DomainIndex", build_index), ("set[str]", set)):
+        built, elapsed, memory = measure_build(factory, domains)
+        mean, p99 = lookup_latencies(built, queries)
+        print(f"{name:<14}{elapsed:>10.2f}{memory / 2**20:>13.1f}{mean:>10.0f}{p99:>10.0f}")
+        if name == "DomainIndex":
+            assert all(d in built for d in hits) and not any(d in built for d in misses)
+            get_domain_index().replace(domains)
+        del built
+    print("(set[str] memory excludes the domain strings themselves, which it must also keep alive)")
+
+    latencies = sorted(asyncio.run(http_round_trips(queries[:20_000])))
+    print(
+        f"\nHTTP ask round trip: p50 {latencies[len(latencies) // 2]:.1f} us, "
+        f"p99 {latencies[int(len(latencies) * 0.99)]:.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    main()